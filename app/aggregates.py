@@ -0,0 +1,155 @@
+"""
+Incrementally maintained HIM reporting aggregates.
+
+`ConditionAggregate` counts true MedicalHistory conditions by the patient's
+gender, state of origin, religion and age band; `AdmissionAggregate` counts
+DiagnosisAdmission rows by month of admission.  Signal receivers in
+app/signals.py work out which aggregate keys a row contributed before and
+after each save or delete and apply only the difference, so reports read a
+table whose size depends on the number of demographic combinations rather
+than on the number of records.
+
+The age band is the patient's age when the history was recorded, so it does
+not drift as time passes and never needs a periodic recount.  Bulk writes
+bypass signals; run `manage.py rebuild_him_aggregates` after them.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import AdmissionAggregate, ConditionAggregate, DiagnosisAdmission, MedicalHistory
+
+AGE_BANDS = (
+    (15, '0-14'),
+    (20, '15-19'),
+    (25, '20-24'),
+    (30, '25-29'),
+    (40, '30-39'),
+    (None, '40+'),
+)
+
+CONDITION_DIMENSIONS = ('condition', 'gender', 'state_of_origin', 'religion', 'age_band')
+
+
+def age_band(dob, on):
+    age = on.year - dob.year - ((on.month, on.day) < (dob.month, dob.day))
+    for upper, label in AGE_BANDS:
+        if upper is None or age < upper:
+            return label
+
+
+def condition_keys(conditions, patient, recorded_at):
+    """Aggregate keys for a history with `conditions` bitmask belonging to `patient`."""
+    return _keys_from_row((conditions, recorded_at, patient.dob, patient.gender, patient.state_of_origin,
+                           patient.religion))
+
+
+def history_keys(history):
+    return condition_keys(history.conditions, history.case_folder.patient, history.created_at)
+
+
+def stored_history_keys(history_pk):
+    """Keys the history currently contributes, read from the database."""
+    row = (
+        MedicalHistory.objects.filter(pk=history_pk)
+        .values_list('conditions', 'created_at', 'case_folder__patient__dob', 'case_folder__patient__gender',
+                     'case_folder__patient__state_of_origin', 'case_folder__patient__religion')
+        .first()
+    )
+    if row is None:
+        return []
+    return _keys_from_row(row)
+
+
+def patient_keys(patient, stored=False):
+    """Keys contributed by all of the patient's histories, with stored or in-memory demographics."""
+    histories = MedicalHistory.objects.filter(case_folder__patient=patient.pk).exclude(conditions=0)
+    if stored:
+        rows = histories.values_list('conditions', 'created_at', 'case_folder__patient__dob',
+                                     'case_folder__patient__gender', 'case_folder__patient__state_of_origin',
+                                     'case_folder__patient__religion')
+        return [key for row in rows for key in _keys_from_row(row)]
+    return [
+        key
+        for conditions, created_at in histories.values_list('conditions', 'created_at')
+        for key in condition_keys(conditions, patient, created_at)
+    ]
+
+
+def _keys_from_row(row):
+    mask, created_at, dob, gender, state, religion = row
+    band = age_band(dob, timezone.localtime(created_at).date())
+    return [
+        (name, gender, state, religion, band)
+        for bit, name in enumerate(MedicalHistory.CONDITIONS)
+        if mask & (1 << bit)
+    ]
+
+
+def admission_month(date_of_admission):
+    return timezone.localtime(date_of_admission).date().replace(day=1)
+
+
+def apply_condition_deltas(deltas):
+    _apply(ConditionAggregate, CONDITION_DIMENSIONS, deltas)
+
+
+def apply_admission_deltas(deltas):
+    _apply(AdmissionAggregate, ('month',), {(month,): delta for month, delta in deltas.items()})
+
+
+def diff(before, after):
+    """Per-key change going from the `before` keys to the `after` keys."""
+    deltas = Counter(after)
+    deltas.subtract(Counter(before))
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def _apply(model, dimensions, deltas):
+    for key, delta in deltas.items():
+        lookup = dict(zip(dimensions, key))
+        with transaction.atomic():
+            if model.objects.filter(**lookup).update(count=F('count') + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    model.objects.create(count=delta, **lookup)
+            except IntegrityError:
+                # Another writer created the row first
+                model.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+def rebuild(chunk_size=2000):
+    """Recount both aggregate tables from the source rows."""
+    conditions = Counter()
+    rows = (
+        MedicalHistory.objects.exclude(conditions=0)
+        .values_list('conditions', 'created_at', 'case_folder__patient__dob', 'case_folder__patient__gender',
+                     'case_folder__patient__state_of_origin', 'case_folder__patient__religion')
+        .order_by()
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        conditions.update(_keys_from_row(row))
+
+    admissions = Counter()
+    months = (
+        DiagnosisAdmission.objects.annotate(month=TruncMonth('date_of_admission'))
+        .values('month').annotate(total=Count('pk')).order_by()
+    )
+    for row in months:
+        admissions[admission_month(row['month'])] += row['total']
+
+    with transaction.atomic():
+        ConditionAggregate.objects.all().delete()
+        AdmissionAggregate.objects.all().delete()
+        ConditionAggregate.objects.bulk_create(
+            [ConditionAggregate(count=count, **dict(zip(CONDITION_DIMENSIONS, key))) for key, count in conditions.items()],
+            batch_size=1000,
+        )
+        AdmissionAggregate.objects.bulk_create(
+            [AdmissionAggregate(month=month, count=count) for month, count in admissions.items()],
+        )
+    return len(conditions), len(admissions)
@@ -3,4 +3,9 @@ from django.apps import AppConfig
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'app'
\ No newline at end of file
+    name = 'app'
+
+    def ready(self):
+        from . import bundles, signals  # noqa: F401  (bundles registers its task)
+        from .blacklist import start_token_pruner
+        start_token_pruner()
@@ -0,0 +1,162 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """
+    Bounded, TTL-evicting, thread-safe map of user id to User.
+
+    Entries are dropped when the user is saved or deleted in this process
+    (see app/signals.py) and otherwise live at most `ttl` seconds.  An entry
+    may carry a stamp; `get()` with a different stamp misses, which is how
+    other processes learn of a change (see `auth_stamp()`).  The entries
+    themselves are per process.  Callers get a
+    copy so per-request attribute changes never leak into the shared
+    instance.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return self._max_size if self._max_size is not None else getattr(settings, 'JWT_USER_CACHE_SIZE', 1024)
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else getattr(settings, 'JWT_USER_CACHE_TTL', 60)
+
+    def get(self, user_id, stamp=None):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, entry_stamp, user = entry
+            if expires < time.monotonic() or entry_stamp != stamp:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        return copy.copy(user)
+
+    def set(self, user_id, user, stamp=None):
+        max_size = self.max_size
+        if max_size <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, stamp, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+user_cache = UserCache()
+
+# Saving any of these changes what a token may do; see revoke_cached_user()
+AUTH_FIELDS = {'is_active', 'is_authorized', 'role', 'password'}
+
+
+def _stamp_key(user_id):
+    return 'user:%s:auth' % user_id
+
+
+def auth_stamp(user_id):
+    """
+    The user's current stamp in the default cache, created if missing.
+
+    The default cache is shared by the workers (see CACHES in settings), so a
+    stamp replaced by one of them is read by all of them on their next
+    request.  A worker pointed at a different cache store only drops its
+    entry when it expires, JWT_USER_CACHE_TTL seconds after it was cached.
+    """
+    key = _stamp_key(user_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def revoke_cached_user(user_id):
+    """Drop the user from every worker's `user_cache` by replacing its shared stamp."""
+    user_cache.invalidate(user_id)
+    cache.set(_stamp_key(user_id), uuid.uuid4().hex, None)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user from `user_cache`.
+
+    A cache hit costs no query; it is trusted only while the user's stamp in
+    the default cache is unchanged, so deactivating, unapproving or changing
+    the role of a user takes effect in every worker sharing that cache on
+    its next request (see `auth_stamp()`).  Tokens whose
+    `role` or `is_authorized` claim no longer matches the account are
+    rejected, so such a change also revokes the access tokens issued before
+    it.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        stamp = auth_stamp(user_id)
+        user = user_cache.get(user_id, stamp)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user, stamp)
+        elif not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        role = validated_token.get('role')
+        if role is not None and role != user.role:
+            raise AuthenticationFailed('Token was issued for a different role', code='role_changed')
+        if not user.is_authorized or validated_token.get('is_authorized', True) is not True:
+            raise AuthenticationFailed('User has not been approved by an admin', code='user_not_authorized')
+        return user
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Accept `Authorization: Bearer <METRICS_TOKEN>` as an anonymous scraper.
+
+    Listed before CachedJWTAuthentication on the metrics view, so the token
+    is never parsed as a JWT; any other header falls through to it.
+    """
+
+    def authenticate(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if token and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token):
+            return AnonymousUser(), token
+        return None
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="metrics"'
@@ -0,0 +1,161 @@
+"""
+Process-local index of blacklisted refresh tokens.
+
+simplejwt checks `BlacklistedToken` with a query on every refresh and logout.
+This index keeps the blacklisted jtis (with their expiry) in memory instead:
+it is loaded from the tables on first use, receives local blacklistings
+straight from a post_save receiver, and pulls rows blacklisted by other
+processes at most every BLACKLIST_INDEX_SYNC_INTERVAL seconds with a primary
+key range query.  A full reload every BLACKLIST_INDEX_RELOAD_INTERVAL seconds
+picks up rows deleted from the tables.  Entries are pruned once the token
+has expired, since an expired token is rejected anyway.
+
+The index trades a bounded staleness window for a query-free hot path: a
+token blacklisted in this process is rejected at once, but one blacklisted
+(logged out or rotated) by another process is still accepted here for up to
+BLACKLIST_INDEX_SYNC_INTERVAL seconds.  The range pull relies on ids being
+committed in order, which holds on SQLite (one writer at a time); on a
+database with concurrent writers a row committed behind a higher id is only
+seen at the next full reload, so there the window is
+BLACKLIST_INDEX_RELOAD_INTERVAL.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+logger = logging.getLogger(__name__)
+
+
+class BlacklistIndex:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._synced_at = None
+        self._last_id = 0
+
+    def is_blacklisted(self, jti):
+        self.sync()
+        return jti in self._entries
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._entries[jti] = expires_at
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._loaded_at = self._synced_at = None
+            self._last_id = 0
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        reload_interval = getattr(settings, 'BLACKLIST_INDEX_RELOAD_INTERVAL', 600)
+        sync_interval = getattr(settings, 'BLACKLIST_INDEX_SYNC_INTERVAL', 5)
+        if self._loaded_at is None or force or now - self._loaded_at >= reload_interval:
+            self._load(now)
+        elif now - self._synced_at >= sync_interval:
+            self._pull(now)
+
+    def _load(self, now):
+        last_id = BlacklistedToken.objects.aggregate(last=Max('pk'))['last'] or 0
+        rows = BlacklistedToken.objects.filter(pk__lte=last_id, token__expires_at__gt=timezone.now())
+        entries = dict(rows.values_list('token__jti', 'token__expires_at'))
+        with self._lock:
+            self._entries = entries
+            self._loaded_at = self._synced_at = now
+            self._last_id = last_id
+
+    def _pull(self, now):
+        rows = list(BlacklistedToken.objects.filter(pk__gt=self._last_id)
+                    .values_list('pk', 'token__jti', 'token__expires_at').order_by('pk'))
+        current = timezone.now()
+        with self._lock:
+            for pk, jti, expires_at in rows:
+                self._entries[jti] = expires_at
+                self._last_id = max(self._last_id, pk)
+            self._entries = {jti: expires for jti, expires in self._entries.items() if expires > current}
+            self._synced_at = now
+
+    def __len__(self):
+        return len(self._entries)
+
+
+blacklist_index = BlacklistIndex()
+
+
+def prune_expired_tokens(batch_size=5000, pause=0.0, now=None):
+    """
+    Delete expired outstanding tokens and their blacklist rows in batches.
+
+    Each batch is its own short transaction covering one primary key range,
+    so on SQLite the write lock is released between batches (optionally for
+    `pause` seconds) and logins keep flowing while a large backlog drains.
+    Returns counts of deleted rows, batches, and the elapsed time.
+    """
+    now = now or timezone.now()
+    started = time.perf_counter()
+    quote = connection.ops.quote_name
+    opts = OutstandingToken._meta
+    delete_sql = 'DELETE FROM %s WHERE %s >= %%s AND %s <= %%s AND %s <= %%s' % (
+        quote(opts.db_table), quote(opts.pk.column), quote(opts.pk.column), quote(opts.get_field('expires_at').column),
+    )
+    totals = {'outstanding': 0, 'blacklisted': 0, 'batches': 0, 'slowest_batch': 0.0}
+    expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('pk').values_list('pk', flat=True)
+
+    while True:
+        boundary = list(expired[:batch_size])
+        if not boundary:
+            break
+        low, high = boundary[0], boundary[-1]
+        batch_started = time.perf_counter()
+        with transaction.atomic():
+            blacklisted, _ = BlacklistedToken.objects.filter(
+                token__pk__range=(low, high), token__expires_at__lte=now,
+            ).delete()
+            # Raw DELETE: the ORM would first load every token to cascade.
+            with connection.cursor() as cursor:
+                cursor.execute(delete_sql, [low, high, connection.ops.adapt_datetimefield_value(now)])
+                outstanding = cursor.rowcount
+        totals['outstanding'] += outstanding
+        totals['blacklisted'] += blacklisted
+        totals['batches'] += 1
+        totals['slowest_batch'] = max(totals['slowest_batch'], time.perf_counter() - batch_started)
+        if pause:
+            time.sleep(pause)
+
+    totals['seconds'] = time.perf_counter() - started
+    return totals
+
+
+_pruner_started = False
+
+
+def start_token_pruner():
+    """Prune expired tokens every TOKEN_PRUNE_INTERVAL seconds in a daemon thread."""
+    global _pruner_started
+    interval = getattr(settings, 'TOKEN_PRUNE_INTERVAL', None)
+    if not interval or _pruner_started:
+        return
+    _pruner_started = True
+
+    def run():
+        while True:
+            time.sleep(interval)
+            close_old_connections()
+            try:
+                totals = prune_expired_tokens(batch_size=getattr(settings, 'TOKEN_PRUNE_BATCH_SIZE', 5000))
+                logger.info('Pruned %(outstanding)d outstanding and %(blacklisted)d blacklisted tokens '
+                            'in %(seconds).2fs', totals)
+            except Exception:
+                logger.exception('Token pruning failed')
+            finally:
+                close_old_connections()
+
+    threading.Thread(target=run, name='token-pruner', daemon=True).start()
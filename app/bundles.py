@@ -0,0 +1,202 @@
+"""
+Per-patient record bundles for transfers and legal requests.
+
+Each patient is written as `<patient id>.json.gz`: the patient with every
+case folder, its medical history, diagnoses, vital signs and notes.  Patient
+ids are split into shards of `shard_size`; every shard is loaded with one
+planned queryset (a handful of queries regardless of shard size) and its
+bundles are written by a worker of a process pool, so throughput grows with
+the number of cores.  Workers are spawned rather than forked: the exporting
+process runs other threads (task runner, metrics flush) whose locks and
+connections a fork would copy mid-use.  With `workers=1` shards run
+in-process.
+
+Bundles are written to a temporary name and renamed into place, and each
+finished shard is appended to `manifest.ndjson`.  A rerun over the same
+directory skips every patient already in the manifest, so an interrupted
+export resumes where it stopped.  `manifest.json` is written once all
+patients are done; ids with no patient are listed in it as `missing`.
+
+A BundleExportJob is run by the `app.export_bundles` task.  The job's
+`heartbeat_at` is renewed after every shard; a PENDING or RUNNING job whose
+heartbeat is older than BUNDLE_EXPORT_LEASE seconds was left by a process
+that died and may be resumed.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import tasks, workers as worker_processes
+from .models import BundleExportJob, Patient
+from .prefetch import plan_queryset
+from .serializers import PatientBundleSerializer
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.ndjson'
+
+
+def bundle_name(patient_id):
+    return '%s.json.gz' % patient_id
+
+
+def write_shard(directory, patient_ids):
+    """Write the bundles of one shard; return their manifest entries."""
+    serializer = PatientBundleSerializer()
+    queryset = plan_queryset(Patient.objects.filter(pk__in=patient_ids), serializer)
+    encoder = JSONEncoder()
+    entries = []
+    for patient in queryset:
+        body = gzip.compress(encoder.encode(serializer.to_representation(patient)).encode('utf-8'), mtime=0)
+        name = bundle_name(patient.pk)
+        path = os.path.join(directory, name)
+        with open(path + '.tmp', 'wb') as handle:
+            handle.write(body)
+        os.replace(path + '.tmp', path)
+        entries.append({
+            'patient': str(patient.pk),
+            'file': name,
+            'bytes': len(body),
+            'sha256': hashlib.sha256(body).hexdigest(),
+            'case_folders': len(patient.case_folders.all()),
+        })
+    return entries
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    entries = {}
+    with open(path) as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn final line of an interrupted run
+            entries[entry['patient']] = entry
+    return entries
+
+
+def export_bundles(patient_ids, directory, workers=1, shard_size=50, on_progress=None):
+    """
+    Write a bundle for each of `patient_ids` into `directory`.
+
+    `on_progress(done, total)` is called after every shard.  Returns counts of
+    patients, bundles written this run and bundles skipped as already done,
+    and the requested ids that have no patient.
+    """
+    os.makedirs(directory, exist_ok=True)
+    done = read_manifest(directory)
+    pending = [pk for pk in (str(pk) for pk in patient_ids) if pk not in done]
+    total = len(done) + len(pending)
+    shards = [pending[start:start + shard_size] for start in range(0, len(pending), shard_size)]
+    totals = {'patients': total, 'written': 0, 'skipped': total - len(pending), 'missing': []}
+
+    with open(os.path.join(directory, MANIFEST), 'a') as manifest:
+        def record(entries):
+            for entry in entries:
+                manifest.write(json.dumps(entry) + '\n')
+                done[entry['patient']] = entry
+            manifest.flush()
+            os.fsync(manifest.fileno())
+            totals['written'] += len(entries)
+            if on_progress is not None:
+                on_progress(len(done), total)
+
+        if workers <= 1:
+            for shard in shards:
+                record(write_shard(directory, shard))
+        elif shards:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=worker_processes.setup,
+                                     initargs=(worker_processes.database_names(),)) as pool:
+                for entries in pool.map(write_shard, [directory] * len(shards), shards):
+                    record(entries)
+
+    totals['missing'] = [pk for pk in pending if pk not in done]
+    with open(os.path.join(directory, 'manifest.json'), 'w') as handle:
+        json.dump({
+            'patients': total,
+            'missing': totals['missing'],
+            'bytes': sum(entry['bytes'] for entry in done.values()),
+            'bundles': sorted(done.values(), key=lambda entry: entry['patient']),
+        }, handle)
+    return totals
+
+
+def job_directory(job):
+    root = getattr(settings, 'BUNDLE_EXPORT_ROOT', os.path.join(settings.BASE_DIR, 'exports'))
+    return os.path.join(str(root), 'bundles-%d' % job.pk)
+
+
+def _stale(now):
+    lease = timedelta(seconds=getattr(settings, 'BUNDLE_EXPORT_LEASE', 600))
+    return Q(status__in=['PENDING', 'RUNNING'], heartbeat_at__lt=now - lease)
+
+
+def start_job(job):
+    """Queue `job` for the task runner; call inside the transaction that created or reset it."""
+    export_job.delay(job_id=job.pk)
+
+
+def resume_job(job):
+    """Queue a failed or abandoned job again; False if it is done or still running."""
+    now = timezone.now()
+    resumable = Q(status='FAILED') | _stale(now)
+    if not BundleExportJob.objects.filter(resumable, pk=job.pk).update(status='PENDING', heartbeat_at=now):
+        return False
+    start_job(job)
+    return True
+
+
+def run_job(job_id, workers=None):
+    """Run or resume a BundleExportJob; a resumed job skips bundles already written."""
+    now = timezone.now()
+    claimed = BundleExportJob.objects.filter(~Q(status='RUNNING') | _stale(now), pk=job_id).update(
+        status='RUNNING', heartbeat_at=now, error='', finished_at=None,
+    )
+    if not claimed:
+        logger.warning('Bundle export %d is already running', job_id)
+        return
+    job = BundleExportJob.objects.get(pk=job_id)
+    workers = workers or getattr(settings, 'BUNDLE_EXPORT_WORKERS', os.cpu_count() or 1)
+    patient_ids = job.patient_ids
+    if patient_ids is None:
+        patient_ids = [str(pk) for pk in Patient.objects.order_by('pk').values_list('pk', flat=True)]
+    directory = job.output_dir or job_directory(job)
+    BundleExportJob.objects.filter(pk=job.pk).update(output_dir=directory, total=len(patient_ids))
+
+    def progress(done, total):
+        BundleExportJob.objects.filter(pk=job.pk).update(completed=done, heartbeat_at=timezone.now())
+
+    try:
+        totals = export_bundles(patient_ids, directory, workers=workers,
+                                shard_size=getattr(settings, 'BUNDLE_EXPORT_SHARD_SIZE', 50), on_progress=progress)
+    except Exception as exc:
+        logger.exception('Bundle export %d failed', job.pk)
+        BundleExportJob.objects.filter(pk=job.pk).update(status='FAILED', error=str(exc),
+                                                          finished_at=timezone.now())
+        raise
+    if totals['missing']:
+        logger.warning('Bundle export %d: %d patients not found', job.pk, len(totals['missing']))
+    BundleExportJob.objects.filter(pk=job.pk).update(
+        status='DONE', completed=totals['patients'] - len(totals['missing']), missing_patient_ids=totals['missing'],
+        finished_at=timezone.now(),
+    )
+
+
+@tasks.task(name='app.export_bundles', max_attempts=1)
+def export_job(job_id):
+    # Failures are recorded on the job; resuming it is the retry
+    run_job(job_id)
@@ -0,0 +1,86 @@
+"""
+Cached case folder documents.
+
+A folder's serialized document is stored under a key that embeds a per-folder
+version token.  Invalidating a folder replaces the token, which orphans every
+cached variant of it (full document and any ?fields=/?expand= projection) at
+once; orphaned entries simply age out.  A missing token is always replaced by
+a fresh one, so an evicted token can never resurrect an older document.
+
+The tokens and documents live in the default cache, which is shared by all
+worker processes (see CACHES in ehr/settings.py), so an invalidation made by
+one worker is seen by the others on their next read.  The hit and miss
+counters are plain get-and-set increments on the file backend and may drop
+a few counts under concurrent requests.
+
+Changes to a folder's users (e.g. a renamed `created_by`) are not tracked and
+are picked up when the entry times out (`CASEFOLDER_CACHE_TIMEOUT`).
+"""
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+VARIANT_PARAMS = ('fields', 'expand')
+HITS_KEY = 'casefolder:stats:hits'
+MISSES_KEY = 'casefolder:stats:misses'
+
+
+def _timeout():
+    return getattr(settings, 'CASEFOLDER_CACHE_TIMEOUT', 300)
+
+
+def _version_key(folder_id):
+    return 'casefolder:%s:version' % folder_id
+
+
+def _version(folder_id):
+    key = _version_key(folder_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def document_key(folder_id, query_params):
+    variant = urlencode(sorted((name, query_params[name]) for name in VARIANT_PARAMS if name in query_params))
+    return 'casefolder:%s:%s:%s' % (folder_id, _version(folder_id), variant)
+
+
+def get_document(key):
+    data = cache.get(key)
+    _count(HITS_KEY if data is not None else MISSES_KEY)
+    return data
+
+
+def set_document(key, data):
+    cache.set(key, data, _timeout())
+
+
+def invalidate_casefolder(*folder_ids):
+    cache.set_many({_version_key(pk): uuid.uuid4().hex for pk in folder_ids}, None)
+
+
+def stats():
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
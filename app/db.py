@@ -0,0 +1,35 @@
+"""
+Per-connection SQLite tuning.
+
+`apply_sqlite_pragmas` runs on every new connection (connection_created) and
+issues the PRAGMAs in settings.SQLITE_PRAGMAS, in order.  journal_mode=WAL
+lets readers proceed while a writer commits; busy_timeout makes a blocked
+writer wait instead of failing with "database is locked"; synchronous=NORMAL
+is durable under WAL except across power loss; cache_size and mmap_size keep
+the hot pages of the database in memory.
+"""
+import re
+
+from django.conf import settings
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def sqlite_pragmas():
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    for name, value in pragmas.items():
+        if not PRAGMA_NAME.match(name) or not PRAGMA_VALUE.match(str(value)):
+            raise ValueError('Invalid SQLite pragma %s=%r' % (name, value))
+    return pragmas
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = sqlite_pragmas()
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
@@ -0,0 +1,93 @@
+"""
+Streaming CSV and NDJSON exports.
+
+Rows are read in primary key order, `chunk_size` at a time, with a keyset
+filter (`pk > last seen`) so every chunk is a cheap index range.  Each chunk
+goes through `plan_queryset`, so its relations are joined or prefetched for
+that chunk only, and is rendered and handed to the response before the next
+one is read.  Memory therefore depends on the chunk size, not on the number
+of rows exported.  (QuerySet.iterator() ignores prefetch_related before
+Django 4.1, which is why chunks are fetched explicitly.)
+
+CSV flattens nested objects into dotted columns (`patient.first_name`);
+nested lists (diagnoses, vital signs, notes) are written as a JSON array in
+one column.
+"""
+import csv
+import json
+
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+from .prefetch import plan_queryset
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_chunks(queryset, serializer, chunk_size=500):
+    """Yield lists of serialized rows, one list per chunk."""
+    queryset = plan_queryset(queryset.order_by('pk'), serializer)
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        instances = list(chunk[:chunk_size])
+        if not instances:
+            return
+        yield [serializer.to_representation(instance) for instance in instances]
+        last = instances[-1].pk
+
+
+def csv_columns(serializer, prefix=()):
+    """`(header, path)` pairs for the readable fields, nested objects flattened."""
+    columns = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        path = prefix + (name,)
+        if isinstance(field, serializers.Serializer):
+            columns.extend(csv_columns(field, path))
+        else:
+            columns.append(('.'.join(path), path))
+    return columns
+
+
+def _cell(row, path):
+    value = row
+    for name in path:
+        if value is None:
+            return ''
+        value = value.get(name)
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, cls=JSONEncoder)
+    return value
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset, serializer, chunk_size=500):
+    columns = csv_columns(serializer)
+    writer = csv.writer(_Echo())
+    yield writer.writerow([header for header, _ in columns])
+    for rows in iter_chunks(queryset, serializer, chunk_size):
+        yield ''.join(writer.writerow([_cell(row, path) for _, path in columns]) for row in rows)
+
+
+def stream_ndjson(queryset, serializer, chunk_size=500):
+    encoder = JSONEncoder()
+    for rows in iter_chunks(queryset, serializer, chunk_size):
+        yield ''.join(encoder.encode(row) + '\n' for row in rows)
+
+
+def stream(fmt, queryset, serializer, chunk_size=500):
+    streamer = stream_csv if fmt == 'csv' else stream_ndjson
+    return streamer(queryset, serializer, chunk_size)
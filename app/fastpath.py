@@ -0,0 +1,166 @@
+"""
+Render GET lists straight from `values()` rows.
+
+Building a model instance for every row and walking the serializer field by
+field (get_attribute, SkipField checks, an OrderedDict per object) costs
+more CPU on large lists than the query does.  `compile_serializer()` walks a
+serializer once and returns a `RowRenderer` holding the `values()` columns
+it needs and one extractor per field.  Each extractor passes its column
+through the DRF field's own `to_representation`, so dates, UUIDs, choices
+and nested users come out exactly as the serializer renders them.
+
+Plain model fields, primary key related fields, and nested serializers over
+forward foreign keys (read from joined columns) are supported.  Anything that
+needs the instance gives no renderer, and the view serializes as usual:
+collections, method fields, properties, dotted sources, and serializers
+overriding to_representation.
+"""
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+class Unsupported(Exception):
+    pass
+
+
+class RowRenderer:
+    def __init__(self, columns, extractors):
+        self.columns = columns
+        self.extractors = extractors
+
+    def values(self, queryset, *extra):
+        """`queryset` as dict rows with every column the extractors (and `extra`) read."""
+        columns = list(dict.fromkeys(list(self.columns) + list(extra)))
+        return queryset.prefetch_related(None).values(*columns)
+
+    def render(self, rows):
+        # DRF looks the current timezone up for every datetime; once per list is enough
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        extractors = self.extractors
+        return [{name: extract(row, tz) for name, extract in extractors} for row in rows]
+
+
+def compile_serializer(serializer):
+    """A RowRenderer producing `serializer`'s output, or None if a field needs the instance."""
+    try:
+        columns, extractors = _compile(serializer.Meta.model, serializer, '')
+    except Unsupported:
+        return None
+    return RowRenderer(columns, extractors)
+
+
+_renderers = {}
+
+
+def renderer_for(serializer):
+    """
+    The renderer for `serializer`, compiled once per class when its fields are
+    fixed; serializers that choose fields per request are compiled each time.
+    """
+    cls = type(serializer)
+    static = cls.get_fields is serializers.ModelSerializer.get_fields
+    if static and cls in _renderers:
+        return _renderers[cls]
+    renderer = compile_serializer(serializer)
+    if static:
+        _renderers[cls] = renderer
+    return renderer
+
+
+def _compile(model, serializer, prefix):
+    if not isinstance(serializer, serializers.ModelSerializer) or \
+            type(serializer).to_representation is not serializers.Serializer.to_representation:
+        raise Unsupported(serializer)
+    columns, extractors = [], []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == '*' or len(field.source_attrs) != 1:
+            raise Unsupported(name)
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise Unsupported(name)
+        path = prefix + field.source
+        forward = model_field.concrete and (model_field.many_to_one or model_field.one_to_one)
+
+        if isinstance(field, serializers.BaseSerializer):
+            if not forward or isinstance(field, serializers.ListSerializer):
+                raise Unsupported(name)
+            nested_columns, nested_extractors = _compile(model_field.related_model, field, path + '__')
+            columns.append(path)
+            columns.extend(nested_columns)
+            extractors.append((name, _nested(path, nested_extractors)))
+        elif isinstance(field, PrimaryKeyRelatedField):
+            if not forward:
+                raise Unsupported(name)
+            columns.append(path)
+            extractors.append((name, _column(path, field.pk_field.to_representation if field.pk_field else None)))
+        elif isinstance(field, (RelatedField, ManyRelatedField)) or model_field.is_relation:
+            raise Unsupported(name)
+        elif _iso_datetime(field):
+            columns.append(path)
+            extractors.append((name, _datetime(path, field)))
+        else:
+            columns.append(path)
+            extractors.append((name, _column(path, field.to_representation)))
+    return columns, extractors
+
+
+def _iso_datetime(field):
+    return (isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone') and settings.USE_TZ
+            and str(getattr(field, 'format', api_settings.DATETIME_FORMAT)).lower() == ISO_8601)
+
+
+def _column(path, to_representation):
+    if to_representation is None:
+        return lambda row, tz: row[path]
+
+    def extract(row, tz):
+        value = row[path]
+        return None if value is None else to_representation(value)
+    return extract
+
+
+def _datetime(path, field):
+    """DateTimeField.to_representation for aware values and ISO 8601 output, with `tz` passed in."""
+    def extract(row, tz):
+        value = row[path]
+        if not value:
+            return None
+        if timezone.is_naive(value):
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return extract
+
+
+def _nested(path, extractors):
+    def extract(row, tz):
+        if row[path] is None:
+            return None
+        return {name: get(row, tz) for name, get in extractors}
+    return extract
+
+
+class FastListMixin:
+    """
+    Serve GET lists from `values()` rows through the serializer's RowRenderer
+    when it has one (and FAST_LISTS is on); otherwise list as usual.
+    """
+
+    def list(self, request, *args, **kwargs):
+        renderer = renderer_for(self.get_serializer()) if getattr(settings, 'FAST_LISTS', True) else None
+        if renderer is None:
+            return super().list(request, *args, **kwargs)
+        ordering = [field.lstrip('-') for field in getattr(self.paginator, 'ordering', ())]
+        queryset = renderer.values(self.filter_queryset(self.get_queryset()), *ordering)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(renderer.render(page))
+        return Response(renderer.render(queryset))
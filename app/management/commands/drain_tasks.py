@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from app import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (email and other side effects) until none are due.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Also run tasks waiting out a retry backoff.')
+        parser.add_argument('--limit', type=int, help='Stop after this many tasks.')
+
+    def handle(self, *args, **options):
+        succeeded, failed = tasks.drain(include_scheduled=options['all'], limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS('Ran %d tasks, %d failed' % (succeeded + failed, failed)))
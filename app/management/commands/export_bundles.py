@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import bundles
+from app.models import BundleExportJob, Patient
+
+
+class Command(BaseCommand):
+    help = 'Write one gzipped JSON bundle per patient, in parallel; rerun with the same output to resume.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', help='Directory for the bundles and manifest.')
+        parser.add_argument('--patients', help='File of patient ids, one per line (default: every patient).')
+        parser.add_argument('--job', type=int, help='Run or resume a bundle export job instead.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--shard-size', type=int, default=50, help='Patients loaded and written per task.')
+
+    def handle(self, *args, **options):
+        if options['job']:
+            if not BundleExportJob.objects.filter(pk=options['job']).exists():
+                raise CommandError('No bundle export job %d.' % options['job'])
+            bundles.run_job(options['job'], workers=options['workers'])
+            job = BundleExportJob.objects.get(pk=options['job'])
+            self.stdout.write(self.style.SUCCESS('Job %d: %d bundles in %s' % (job.pk, job.completed, job.output_dir)))
+            return
+        if not options['output']:
+            raise CommandError('Give an output directory or --job.')
+
+        if options['patients']:
+            with open(options['patients']) as handle:
+                patient_ids = [line.strip() for line in handle if line.strip()]
+        else:
+            patient_ids = Patient.objects.order_by('pk').values_list('pk', flat=True)
+
+        def progress(done, total):
+            self.stdout.write('%d/%d' % (done, total), ending='\r')
+
+        totals = bundles.export_bundles(patient_ids, options['output'], workers=options['workers'],
+                                        shard_size=options['shard_size'], on_progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            'Wrote %(written)d bundles, skipped %(skipped)d already done, %(patients)d patients in manifest' % totals
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.synthetic import PASSWORD, generate
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with synthetic staff, patients, case folders and clinical records for load '
+            'testing, e.g. --patients 100000 for a production-sized data set. Never run this against real data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--folders-per-patient', type=float, default=1.5,
+                            help='Mean case folders per patient (every patient gets at least one).')
+        parser.add_argument('--diagnoses', type=float, default=1, help='Mean diagnoses per case folder.')
+        parser.add_argument('--vitals', type=float, default=10, help='Mean vital signs readings per case folder.')
+        parser.add_argument('--notes', type=float, default=5, help='Mean notes per case folder.')
+        parser.add_argument('--no-histories', action='store_true', help='Skip the per-folder medical histories.')
+        parser.add_argument('--staff', type=int, default=5, help='Users of each role.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Patients inserted, with all their records, per transaction.')
+
+    def handle(self, *args, **options):
+        if options['patients'] < 0 or options['batch_size'] < 1 or options['staff'] < 1:
+            raise CommandError('--patients must not be negative; --batch-size and --staff must be positive.')
+        verbosity = options['verbosity']
+
+        def on_progress(totals):
+            if verbosity > 1:
+                self.stdout.write('%(patients)d patients, %(vital_signs)d vital signs (%(seconds).1fs)' % totals)
+
+        totals = generate(
+            options['patients'], folders_per_patient=options['folders_per_patient'],
+            histories=not options['no_histories'], diagnoses_per_folder=options['diagnoses'],
+            vitals_per_folder=options['vitals'], notes_per_folder=options['notes'],
+            staff_per_role=options['staff'], seed=options['seed'], batch_size=options['batch_size'],
+            on_progress=on_progress,
+        )
+        rows = sum(count for name, count in totals.items() if name != 'seconds')
+        totals['rate'] = rows / totals['seconds'] if totals['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            'Generated %(patients)d patients, %(case_folders)d case folders, %(medical_histories)d medical '
+            'histories, %(diagnoses)d diagnoses, %(vital_signs)d vital signs and %(notes)d notes '
+            'in %(seconds).1fs (%(rate).0f rows/s)' % totals
+        ))
+        self.stdout.write('Staff log in with username synthetic-<role>-<n> (e.g. synthetic-him-1) and password %s' % PASSWORD)
@@ -0,0 +1,49 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import User
+from app.patient_import import FORMATS, detect_format, import_patients, iter_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import patients from a CSV or NDJSON file, streaming it in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with a header row) or NDJSON file of patients.')
+        parser.add_argument('--user', required=True, help='Username recorded as created_by.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'PATIENT_IMPORT_BATCH_SIZE', 1000),
+                            help='Patients validated against the database and inserted per transaction.')
+        parser.add_argument('--rejects', help='Write rejected rows, one JSON object per line, to this file.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        if fmt is None:
+            raise CommandError('Cannot tell the format of %s; pass --format.' % options['path'])
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError('No user named %s.' % options['user'])
+
+        rejects = open(options['rejects'], 'w') if options['rejects'] else None
+
+        def on_reject(line, row, errors):
+            if rejects is not None:
+                rejects.write(json.dumps({'line': line, 'errors': errors, 'row': row}) + '\n')
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                totals = import_patients(iter_rows(stream, fmt), user, batch_size=options['batch_size'],
+                                         on_reject=on_reject)
+        finally:
+            if rejects is not None:
+                rejects.close()
+
+        totals['rate'] = totals['rows'] / totals['seconds'] if totals['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %(created)d of %(rows)d rows (%(rejected)d rejected) in %(seconds).2fs, %(rate).0f rows/s'
+            % totals
+        ))
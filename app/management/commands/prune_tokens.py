@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app.blacklist import prune_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired outstanding and blacklisted JWT refresh tokens in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Outstanding tokens deleted per transaction.')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches so other writers get the lock.')
+
+    def handle(self, *args, **options):
+        totals = prune_expired_tokens(batch_size=options['batch_size'], pause=options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            'Removed %(outstanding)d outstanding and %(blacklisted)d blacklisted tokens in %(batches)d batches, '
+            '%(seconds).2fs (slowest batch %(slowest_batch).3fs)' % totals
+        ))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app import aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recount the HIM condition and admission aggregate tables from the source records.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Medical history rows fetched per round trip.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        conditions, months = aggregates.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt %d condition groups and %d admission months in %.2fs'
+            % (conditions, months, time.perf_counter() - started)
+        ))
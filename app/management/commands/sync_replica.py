@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the read replica with the online backup API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and copy again every INTERVAL seconds.')
+        parser.add_argument('--pages', type=int, default=-1,
+                            help='Pages copied per step; -1 copies everything in one step.')
+
+    def handle(self, *args, **options):
+        alias = getattr(settings, 'READ_REPLICA_ALIAS', None)
+        if not alias:
+            raise CommandError('No read replica is configured (set EHR_REPLICA_DATABASE).')
+        primary, replica = connections.databases[DEFAULT_DB_ALIAS], connections.databases[alias]
+        if primary['ENGINE'] != 'django.db.backends.sqlite3' or replica['ENGINE'] != primary['ENGINE']:
+            raise CommandError('sync_replica only copies between SQLite databases.')
+
+        while True:
+            started = time.perf_counter()
+            source = sqlite3.connect(str(primary['NAME']))
+            target = sqlite3.connect(str(replica['NAME']))
+            try:
+                source.backup(target, pages=options['pages'])
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(self.style.SUCCESS(
+                'Copied %s to %s in %.2fs' % (primary['NAME'], replica['NAME'], time.perf_counter() - started)
+            ))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,40 @@
+"""
+Parse the free-text vital sign columns into numbers.
+
+Nurses type readings such as "120/80", "72 bpm" or "70.5kg"; the first number
+in the text is taken, units are ignored, and anything unreadable becomes None.
+"""
+import re
+
+NUMBER = re.compile(r'\d+(?:\.\d+)?')
+BLOOD_PRESSURE = re.compile(r'^\s*(\d{2,3})\s*/\s*(\d{2,3})')
+
+
+def parse_number(value):
+    match = NUMBER.search(value or '')
+    return float(match.group()) if match else None
+
+
+def parse_integer(value):
+    number = parse_number(value)
+    return int(round(number)) if number is not None else None
+
+
+def parse_blood_pressure(value):
+    """Return `(systolic, diastolic)` from text like "120/80"."""
+    match = BLOOD_PRESSURE.match(value or '')
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+
+def parse_vitals(blood_pressure, pulse, weight, height):
+    """Map the text readings onto the typed VitalSigns columns."""
+    systolic, diastolic = parse_blood_pressure(blood_pressure)
+    return {
+        'systolic': systolic,
+        'diastolic': diastolic,
+        'pulse_rate': parse_integer(pulse),
+        'weight_kg': parse_number(weight),
+        'height_cm': parse_number(height),
+    }
@@ -0,0 +1,273 @@
+"""
+Prometheus metrics shared across worker processes.
+
+Each process counts into a plain in-memory registry guarded by one lock, so
+recording a request is a few dict updates.  When METRICS_DIR is set the
+process also writes its registry to `<METRICS_DIR>/<pid>-<start token>.json`
+at most every METRICS_FLUSH_INTERVAL seconds (and on every scrape), and
+`/metrics` sums the files of all processes, past and present, so counters
+stay monotonic across restarts.  The start token keeps a process that is
+given a dead process's pid from overwriting its totals.  Files of processes
+that are no longer running are merged into `archive.json` on scrape, so the
+directory does not grow with every restart; it must be local to the host
+for the pid check to hold.  Without METRICS_DIR only the scraped process is
+reported.
+
+Labels are bounded: the view is the URL name from him/urls.py or
+app/urls.py ('unmatched' otherwise), the method is one of a fixed set, the
+status is its class (2xx..5xx) and the role is a User role, 'anonymous' or
+'other'.
+"""
+import bisect
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Count
+
+from . import cache as document_cache
+from .authentication import user_cache
+from .blacklist import blacklist_index
+from .models import Task, User
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METHODS = {'GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'}
+
+HELP = {
+    'ehr_http_requests_total': ('counter', 'Requests served, by view, method, status class and role.'),
+    'ehr_http_request_duration_seconds': ('histogram', 'Request latency by view and method.'),
+    'ehr_db_queries_total': ('counter', 'Database queries run while serving each view.'),
+    'ehr_db_query_seconds_total': ('counter', 'Time spent in database queries while serving each view.'),
+    'ehr_db_connections_opened_total': ('counter', 'Database connections opened, by alias.'),
+    'ehr_casefolder_cache_requests_total': ('counter', 'Case folder document cache lookups by result.'),
+    'ehr_jwt_user_cache_entries': ('gauge', 'Users held by the JWT user cache of the scraped process.'),
+    'ehr_token_blacklist_entries': ('gauge', 'Blacklisted tokens indexed by the scraped process.'),
+    'ehr_tasks': ('gauge', 'Background tasks by status.'),
+}
+ROLES = {value for value, _ in User.ROLE_CHOICES}
+ARCHIVE = 'archive.json'
+PROCESS_FILE = re.compile(r'^(\d+)-\w+\.json$')
+
+
+def _key(name, labels):
+    """File form of a series key: the name followed by its labels as JSON."""
+    return name + json.dumps(sorted(labels.items()), separators=(',', ':'))
+
+
+def _split(key):
+    index = key.index('[')
+    return key[:index], dict(json.loads(key[index:]))
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._flushed_at = 0.0
+        self._pid = None
+        self._file = None
+
+    # In memory a series is keyed by (name, sorted label items); JSON only on flush
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            buckets = self._histograms.get(key)
+            if buckets is None:
+                # one count per bucket, +Inf, then the sum
+                buckets = self._histograms[key] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+            buckets[bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+            buckets[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, list(values)) for key, values in self._histograms.items()]
+        return {'counters': {_key(name, dict(labels)): value for (name, labels), value in counters},
+                'histograms': {_key(name, dict(labels)): values for (name, labels), values in histograms}}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def maybe_flush(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if directory and time.monotonic() - self._flushed_at >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+            self.flush(directory)
+
+    def file_name(self):
+        """This process's file in METRICS_DIR; a forked child gets its own."""
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid, self._file = pid, '%d-%s.json' % (pid, uuid.uuid4().hex[:12])
+        return self._file
+
+    def flush(self, directory):
+        self._flushed_at = time.monotonic()
+        _write(os.path.join(directory, self.file_name()), self.snapshot())
+
+    def collect(self):
+        """Counters and histograms summed over every process."""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return self.snapshot()
+        self.flush(directory)
+        merged = _empty()
+        with _locked(directory):
+            archive_dead_processes(directory)
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    _merge(merged, _read(os.path.join(directory, name)))
+        return merged
+
+
+def _empty():
+    return {'counters': defaultdict(float), 'histograms': {}}
+
+
+def _merge(merged, data):
+    for key, value in data['counters'].items():
+        merged['counters'][key] += value
+    for key, values in data['histograms'].items():
+        total = merged['histograms'].setdefault(key, [0] * len(values))
+        merged['histograms'][key] = [a + b for a, b in zip(total, values)]
+
+
+def _read(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {'counters': {}, 'histograms': {}}
+
+
+def _write(path, data):
+    with open(path + '.tmp', 'w') as handle:
+        json.dump(data, handle)
+    os.replace(path + '.tmp', path)
+
+
+@contextmanager
+def _locked(directory):
+    # Serializes scrapes of all processes, so a dead process is archived once
+    with open(os.path.join(directory, 'archive.lock'), 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # running, as another user
+    return True
+
+
+def archive_dead_processes(directory):
+    """Fold the files of processes that have exited into ARCHIVE; call under _locked()."""
+    dead = [name for name in os.listdir(directory)
+            if PROCESS_FILE.match(name) and not _running(int(PROCESS_FILE.match(name).group(1)))]
+    if not dead:
+        return
+    archive = _empty()
+    _merge(archive, _read(os.path.join(directory, ARCHIVE)))
+    for name in dead:
+        _merge(archive, _read(os.path.join(directory, name)))
+    _write(os.path.join(directory, ARCHIVE), archive)
+    for name in dead:
+        os.remove(os.path.join(directory, name))
+
+
+registry = Registry()
+
+
+def role_label(user):
+    if user is None or not user.is_authenticated:
+        return 'anonymous'
+    role = getattr(user, 'role', None)
+    return role if role in ROLES else 'other'
+
+
+def record_request(view, method, status_code, role, seconds, queries, query_seconds):
+    method = method if method in METHODS else 'other'
+    registry.inc('ehr_http_requests_total',
+                 {'view': view, 'method': method, 'status': '%dxx' % (status_code // 100), 'role': role})
+    registry.observe('ehr_http_request_duration_seconds', {'view': view, 'method': method}, seconds)
+    if queries:
+        registry.inc('ehr_db_queries_total', {'view': view}, queries)
+        registry.inc('ehr_db_query_seconds_total', {'view': view}, query_seconds)
+    registry.maybe_flush()
+
+
+def connection_opened(sender, connection, **kwargs):
+    registry.inc('ehr_db_connections_opened_total', {'alias': connection.alias})
+
+
+def _labels(labels):
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                             for name, value in sorted(labels.items()))
+
+
+def render():
+    """The Prometheus text exposition of every metric."""
+    data = registry.collect()
+    series = defaultdict(list)
+    for key, value in data['counters'].items():
+        name, labels = _split(key)
+        series[name].append('%s%s %s' % (name, _labels(labels), _number(value)))
+    for key, values in data['histograms'].items():
+        name, labels = _split(key)
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS + ('+Inf',), values):
+            cumulative += count
+            series[name].append('%s_bucket%s %d' % (name, _labels(dict(labels, le=str(bound))), cumulative))
+        series[name].append('%s_sum%s %s' % (name, _labels(labels), _number(values[-1])))
+        series[name].append('%s_count%s %d' % (name, _labels(labels), cumulative))
+    series.update(_scrape_time_series())
+
+    lines = []
+    for name in sorted(series):
+        kind, description = HELP.get(name, ('gauge', ''))
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s %s' % (name, kind))
+        lines.extend(sorted(series[name]))
+    return '\n'.join(lines) + '\n'
+
+
+def _scrape_time_series():
+    """Values read when scraped: cache counters and queue depth."""
+    stats = document_cache.stats()
+    tasks = dict(Task.objects.values_list('status').annotate(total=Count('pk')).order_by())
+    return {
+        'ehr_casefolder_cache_requests_total': [
+            'ehr_casefolder_cache_requests_total{result="hit"} %d' % stats['hits'],
+            'ehr_casefolder_cache_requests_total{result="miss"} %d' % stats['misses'],
+        ],
+        'ehr_jwt_user_cache_entries': ['ehr_jwt_user_cache_entries %d' % len(user_cache)],
+        'ehr_token_blacklist_entries': ['ehr_token_blacklist_entries %d' % len(blacklist_index)],
+        'ehr_tasks': ['ehr_tasks{status="%s"} %d' % (status, tasks.get(status, 0)) for status in
+                      ('PENDING', 'RUNNING', 'DONE', 'FAILED')],
+    }
+
+
+def _number(value):
+    return '%d' % value if float(value).is_integer() else repr(float(value))
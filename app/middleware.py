@@ -0,0 +1,128 @@
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, routers
+from .profiling import RequestTiming, profiler
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Open the router's request scope, the only place reads may use the replica,
+    and scope its read-your-writes pin to the request.
+
+    A request is pinned to the primary when it is unsafe or carries the
+    sticky cookie; a request that wrote sets the cookie for
+    REPLICA_STICKY_SECONDS so the client's follow-up reads see the write.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cookie = getattr(settings, 'REPLICA_STICKY_COOKIE', 'ehr_primary')
+        routers.open_request()
+        if request.method not in SAFE_METHODS or cookie in request.COOKIES:
+            routers.pin_to_primary()
+        try:
+            response = self.get_response(request)
+            if routers.has_written() and routers.replica_alias():
+                response.set_cookie(cookie, '1', max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 5),
+                                    httponly=True, samesite='Lax')
+            return response
+        finally:
+            routers.close_request()
+
+
+class ProfilingMiddleware:
+    """
+    Time each request and report it in a `Server-Timing` header.
+
+    Enabled with PROFILING_ENABLED; list it first in MIDDLEWARE so `total`
+    covers the other middleware.  Timings are also recorded per URL name in
+    `app.profiling.profiler`.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = request._profiling = RequestTiming()
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timing))
+            response = self.get_response(request)
+            finished = perf_counter()
+
+        marks = getattr(request, '_profiling_marks', {})
+        view_started, view_db = marks.get('view', (started, 0.0))
+        view_ended, render_db = marks.get('view_end', (finished, timing.db_time))
+        rendered = marks.get('rendered', view_ended)
+        timing.total = (finished - started) * 1000
+        timing.view_time = max(0.0, (view_ended - view_started) * 1000 - (render_db - view_db))
+        timing.render_time = max(0.0, (rendered - view_ended) * 1000)
+
+        response['Server-Timing'] = timing.header()
+        match = request.resolver_match
+        if match is not None:
+            profiler.record(match.view_name, timing, response.status_code)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._profiling_marks = {'view': (perf_counter(), request._profiling.db_time)}
+
+    def process_template_response(self, request, response):
+        marks = request._profiling_marks
+        marks['view_end'] = (perf_counter(), request._profiling.db_time)
+        response.add_post_render_callback(lambda response: marks.__setitem__('rendered', perf_counter()))
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Count requests, latency and database work for the Prometheus exporter.
+
+    Enabled with METRICS_ENABLED; the counters live in `app.metrics.registry`.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        database = _QueryCounter()
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(database))
+            response = self.get_response(request)
+        match = request.resolver_match
+        metrics.record_request(
+            match.view_name if match is not None else 'unmatched', request.method, response.status_code,
+            metrics.role_label(getattr(request, 'user', None)), perf_counter() - started,
+            database.queries, database.seconds,
+        )
+        return response
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += perf_counter() - started
+            self.queries += 1
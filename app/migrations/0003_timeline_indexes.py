@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diagnosisadmission',
+            index=models.Index(fields=['case_folder', '-created_at', '-id'], name='diagnosis_folder_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patientnote',
+            index=models.Index(fields=['case_folder', '-created_at', '-id'], name='note_folder_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vitalsigns',
+            index=models.Index(fields=['case_folder', '-recorded_at', '-id'], name='vitals_folder_recorded_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vitalsigns',
+            name='diastolic',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vitalsigns',
+            name='height_cm',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vitalsigns',
+            name='pulse_rate',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vitalsigns',
+            name='systolic',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vitalsigns',
+            name='weight_kg',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
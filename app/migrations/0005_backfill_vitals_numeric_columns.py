@@ -0,0 +1,53 @@
+import re
+
+from django.db import migrations
+
+NUMERIC_FIELDS = ['systolic', 'diastolic', 'pulse_rate', 'weight_kg', 'height_cm']
+BATCH_SIZE = 1000
+
+# app/measurements.py as of this migration
+NUMBER = re.compile(r'\d+(?:\.\d+)?')
+BLOOD_PRESSURE = re.compile(r'^\s*(\d{2,3})\s*/\s*(\d{2,3})')
+
+
+def parse_number(value):
+    match = NUMBER.search(value or '')
+    return float(match.group()) if match else None
+
+
+def parse_vitals(blood_pressure, pulse, weight, height):
+    match = BLOOD_PRESSURE.match(blood_pressure or '')
+    pulse_rate = parse_number(pulse)
+    return {
+        'systolic': int(match.group(1)) if match else None,
+        'diastolic': int(match.group(2)) if match else None,
+        'pulse_rate': int(round(pulse_rate)) if pulse_rate is not None else None,
+        'weight_kg': parse_number(weight),
+        'height_cm': parse_number(height),
+    }
+
+
+def backfill(apps, schema_editor):
+    VitalSigns = apps.get_model('app', 'VitalSigns')
+    batch = []
+    rows = VitalSigns.objects.only('blood_pressure', 'pulse', 'weight', 'height').order_by('pk')
+    for vitals in rows.iterator(chunk_size=BATCH_SIZE):
+        for name, value in parse_vitals(vitals.blood_pressure, vitals.pulse, vitals.weight, vitals.height).items():
+            setattr(vitals, name, value)
+        batch.append(vitals)
+        if len(batch) == BATCH_SIZE:
+            VitalSigns.objects.bulk_update(batch, NUMERIC_FIELDS)
+            batch = []
+    if batch:
+        VitalSigns.objects.bulk_update(batch, NUMERIC_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_vitals_numeric_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
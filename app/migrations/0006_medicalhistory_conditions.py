@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_backfill_vitals_numeric_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalhistory',
+            name='conditions',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+# MedicalHistory.CONDITIONS as of this migration
+CONDITIONS = (
+    'hypertension', 'measles', 'chicken_pox', 'tb', 'diabetes', 'yellow_fever', 'sti', 'kidney_disease',
+    'liver_disease', 'epilepsy', 'sc_disease', 'gd_ulcer', 'rta_injury', 'alcohol_smoking', 'previous_ops',
+    'schistosomiasis', 'respiratory_disease', 'mental_disease', 'hiv', 'allergies',
+)
+
+
+def backfill(apps, schema_editor):
+    MedicalHistory = apps.get_model('app', 'MedicalHistory')
+    batch = []
+    for history in MedicalHistory.objects.only(*CONDITIONS).order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        history.conditions = sum(1 << bit for bit, name in enumerate(CONDITIONS) if getattr(history, name))
+        batch.append(history)
+        if len(batch) == BATCH_SIZE:
+            MedicalHistory.objects.bulk_update(batch, ['conditions'])
+            batch = []
+    if batch:
+        MedicalHistory.objects.bulk_update(batch, ['conditions'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_medicalhistory_conditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
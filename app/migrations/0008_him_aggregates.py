@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_backfill_medicalhistory_conditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdmissionAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ConditionAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('condition', models.CharField(max_length=30)),
+                ('gender', models.CharField(max_length=1)),
+                ('state_of_origin', models.CharField(max_length=50)),
+                ('religion', models.CharField(max_length=25)),
+                ('age_band', models.CharField(max_length=10)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='conditionaggregate',
+            constraint=models.UniqueConstraint(fields=('condition', 'gender', 'state_of_origin', 'religion', 'age_band'), name='unique_condition_aggregate'),
+        ),
+    ]
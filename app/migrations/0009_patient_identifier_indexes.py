@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_him_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='patient',
+            name='jamb_no',
+            field=models.CharField(db_index=True, max_length=15),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='matric_no',
+            field=models.CharField(db_index=True, max_length=15),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 11:18
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bundleexportjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='bundleexportjob',
+            name='missing_patient_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,8 +1,10 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.core.validators import RegexValidator
+from django.utils import timezone
 import uuid
-from rest_framework_simplejwt.tokens import RefreshToken
+from .measurements import parse_vitals
+from .tokens import RoleRefreshToken
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -28,7 +30,7 @@ class User(AbstractUser):
         return f"{self.username} ({self.role})"
 
     def tokens(self):
-        refresh = RefreshToken.for_user(self)
+        refresh = RoleRefreshToken.for_user(self)
         return {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -51,8 +53,8 @@ class Patient(models.Model):
     last_name = models.CharField(max_length=100)
     dob = models.DateField()
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
-    matric_no = models.CharField(max_length=15)
-    jamb_no = models.CharField(max_length=15)
+    matric_no = models.CharField(max_length=15, db_index=True)
+    jamb_no = models.CharField(max_length=15, db_index=True)
     address = models.TextField()
     phone = models.CharField(max_length=15)
     email = models.EmailField(blank=True, null=True)
@@ -65,6 +67,9 @@ class Patient(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='patient_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -77,6 +82,9 @@ class CaseFolder(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='casefolder_created_id_idx'),
+        ]
     
     def __str__(self):
         return f"Case Folder {self.folder_number} - {self.patient}"
@@ -103,13 +111,39 @@ class MedicalHistory(models.Model):
     mental_disease = models.BooleanField(default=False)
     hiv = models.BooleanField(default=False)
     allergies = models.BooleanField(default=False)
+    # Bit i is set when CONDITIONS[i] is true; kept in step by save()
+    conditions = models.PositiveIntegerField(default=0, db_index=True)
     recorded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recorded_medicalhistory')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    # Bit order of `conditions`; only ever append, existing positions are stored data
+    CONDITIONS = (
+        'hypertension', 'measles', 'chicken_pox', 'tb', 'diabetes', 'yellow_fever', 'sti', 'kidney_disease',
+        'liver_disease', 'epilepsy', 'sc_disease', 'gd_ulcer', 'rta_injury', 'alcohol_smoking', 'previous_ops',
+        'schistosomiasis', 'respiratory_disease', 'mental_disease', 'hiv', 'allergies',
+    )
     
     def __str__(self):
         return f"Medical History - {self.case_folder.patient}"
 
+    @classmethod
+    def condition_mask(cls, names):
+        mask = 0
+        for name in names:
+            mask |= 1 << cls.CONDITIONS.index(name)
+        return mask
+
+    def compute_conditions(self):
+        return self.condition_mask(name for name in self.CONDITIONS if getattr(self, name))
+
+    def save(self, *args, **kwargs):
+        self.conditions = self.compute_conditions()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'conditions'}
+        super().save(*args, **kwargs)
+
 class DiagnosisAdmission(models.Model):
     case_folder = models.ForeignKey(CaseFolder, on_delete=models.CASCADE, related_name='diagnoses')
     date = models.DateTimeField()
@@ -122,6 +156,9 @@ class DiagnosisAdmission(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['case_folder', '-created_at', '-id'], name='diagnosis_folder_created_idx'),
+        ]
     
     def __str__(self):
         return f"Diagnosis - {self.case_folder.patient} - {self.date.strftime('%Y-%m-%d')}"
@@ -134,15 +171,35 @@ class VitalSigns(models.Model):
     height = models.CharField(max_length=10)
     urine_albumin = models.CharField(max_length=20)
     urine_sugar = models.CharField(max_length=20)
+    # Numeric copies of the readings above, kept in step by save()
+    systolic = models.PositiveSmallIntegerField(blank=True, null=True)
+    diastolic = models.PositiveSmallIntegerField(blank=True, null=True)
+    pulse_rate = models.PositiveSmallIntegerField(blank=True, null=True)
+    weight_kg = models.FloatField(blank=True, null=True)
+    height_cm = models.FloatField(blank=True, null=True)
     recorded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recorded_vitals')
     recorded_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['case_folder', '-recorded_at', '-id'], name='vitals_folder_recorded_idx'),
+        ]
     
     def __str__(self):
         return f"Vitals - {self.case_folder.patient} - {self.recorded_at.strftime('%Y-%m-%d')}"
 
+    def parse_readings(self):
+        for name, value in parse_vitals(self.blood_pressure, self.pulse, self.weight, self.height).items():
+            setattr(self, name, value)
+
+    def save(self, *args, **kwargs):
+        self.parse_readings()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'systolic', 'diastolic', 'pulse_rate', 'weight_kg', 'height_cm'}
+        super().save(*args, **kwargs)
+
 class PatientNote(models.Model):
     USER_TYPE_CHOICES = [
         ('DOCTOR', 'Doctor'),
@@ -160,6 +217,105 @@ class PatientNote(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['case_folder', '-created_at', '-id'], name='note_folder_created_idx'),
+        ]
     
     def __str__(self):
         return f"Note - {self.case_folder.patient} - {self.date.strftime('%Y-%m-%d')}"
+
+
+class ConditionAggregate(models.Model):
+    """Medical history condition counts by patient demographics (see app/aggregates.py)"""
+    condition = models.CharField(max_length=30)
+    gender = models.CharField(max_length=1)
+    state_of_origin = models.CharField(max_length=50)
+    religion = models.CharField(max_length=25)
+    age_band = models.CharField(max_length=10)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['condition', 'gender', 'state_of_origin', 'religion', 'age_band'],
+                name='unique_condition_aggregate',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.condition} {self.gender}/{self.state_of_origin}/{self.religion}/{self.age_band}: {self.count}"
+
+class AdmissionAggregate(models.Model):
+    """Admission counts per calendar month of date_of_admission"""
+    month = models.DateField(unique=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['month']
+
+    def __str__(self):
+        return f"{self.month.strftime('%Y-%m')}: {self.count}"
+
+class BundleExportJob(models.Model):
+    """A per-patient bundle export (see app/bundles.py); null patient_ids means every patient"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    patient_ids = models.JSONField(blank=True, null=True)
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    output_dir = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    missing_patient_ids = models.JSONField(default=list, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bundle_export_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Renewed as the export progresses; see BUNDLE_EXPORT_LEASE
+    heartbeat_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Bundle export {self.pk} ({self.status}, {self.completed}/{self.total})"
+
+class Task(models.Model):
+    """A queued side effect run off the request by app/tasks.py"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status}, attempt {self.attempts}/{self.max_attempts})"
+
+class Counter(models.Model):
+    """A named sequence handed out in blocks by app/numbering.py"""
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
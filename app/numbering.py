@@ -0,0 +1,149 @@
+"""
+Server-side case folder numbers.
+
+Numbers come from CASEFOLDER_NUMBER_FORMAT, e.g. '{year}/{seq:06d}' gives
+'2026/000042'.  Every other placeholder in the format (currently only
+`year`) selects the sequence, so a format with `{year}` starts again from 1
+each year.  Each sequence is one Counter row.
+
+A process reserves CASEFOLDER_NUMBER_BLOCK numbers at a time (hi/lo) with a
+single `value = value + block` UPDATE and then hands them out from memory,
+so concurrent clerks touch the counter row once per block instead of once per
+folder.  A block reserved inside the caller's transaction is only kept for
+later numbers once that transaction commits; if it rolls back, so does the
+reservation, and keeping the block would hand its numbers out twice.
+Numbers never repeat; those left in a block when a process exits are
+skipped, so sequences can have gaps.  The counter update runs outside the
+allocator's lock: threads that find the block empty while another thread is
+reserving wait for it on a condition instead of reserving blocks of their own.
+
+Clients may still supply their own folder numbers, but not ones that match
+the format (`is_server_number`), which a later allocation could collide with.
+"""
+import re
+import string
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Counter
+
+RESERVE_ATTEMPTS = 8
+
+
+class HiLoAllocator:
+    def __init__(self, name, block_size):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._refilled = threading.Condition(self._lock)
+        self._reserving = False
+        self._next, self._limit = 1, 0
+
+    def allocate(self):
+        with self._lock:
+            while self._next > self._limit and self._reserving:
+                self._refilled.wait()
+            if self._next <= self._limit:
+                value = self._next
+                self._next += 1
+                return value
+            self._reserving = True
+        block = None
+        try:
+            block = low, high = self.reserve()
+        finally:
+            with self._lock:
+                self._reserving = False
+                if block is not None and not connection.in_atomic_block:
+                    self._next, self._limit = low + 1, high
+                self._refilled.notify_all()
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self._keep(low + 1, high))
+        return low
+
+    def _keep(self, low, high):
+        with self._lock:
+            if self._next > self._limit:
+                self._next, self._limit = low, high
+                self._refilled.notify_all()
+
+    def reserve(self):
+        """Take the next `block_size` numbers from the counter; returns (first, last)."""
+        for attempt in range(RESERVE_ATTEMPTS):
+            try:
+                return self._reserve_block()
+            except OperationalError as exc:
+                # SQLite can refuse the write lock outright rather than wait for it
+                if 'locked' not in str(exc) or attempt == RESERVE_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.01 * 2 ** attempt)
+
+    def _reserve_block(self):
+        with transaction.atomic():
+            if not Counter.objects.filter(name=self.name).update(value=F('value') + self.block_size):
+                try:
+                    with transaction.atomic():
+                        Counter.objects.create(name=self.name, value=self.block_size)
+                except IntegrityError:
+                    # Another process created the counter first
+                    Counter.objects.filter(name=self.name).update(value=F('value') + self.block_size)
+            high = Counter.objects.filter(name=self.name).values_list('value', flat=True).get()
+        return high - self.block_size + 1, high
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def allocator(name):
+    block_size = getattr(settings, 'CASEFOLDER_NUMBER_BLOCK', 20)
+    with _allocators_lock:
+        current = _allocators.get(name)
+        if current is None or current.block_size != block_size:
+            current = _allocators[name] = HiLoAllocator(name, block_size)
+        return current
+
+
+def reset():
+    """Forget reserved blocks; the next number reserves a fresh one."""
+    with _allocators_lock:
+        _allocators.clear()
+
+
+def folder_number_format():
+    return getattr(settings, 'CASEFOLDER_NUMBER_FORMAT', '{year}/{seq:06d}')
+
+
+def is_server_number(value):
+    """Whether `value` has the shape of an allocated number, in any sequence."""
+    pattern = ''.join(re.escape(literal) + (r'\d+' if name else '')
+                      for literal, name, _, _ in string.Formatter().parse(folder_number_format()))
+    return re.fullmatch(pattern, value) is not None
+
+
+def _sequence(now):
+    number_format = folder_number_format()
+    context = {'year': timezone.localtime(now).year}
+    scope = [str(context[name]) for _, name, _, _ in string.Formatter().parse(number_format)
+             if name and name != 'seq']
+    return ':'.join(['casefolder'] + scope), number_format, context
+
+
+def next_folder_number(now=None):
+    name, number_format, context = _sequence(now)
+    seq = allocator(name).allocate()
+    return number_format.format(seq=seq, **context)
+
+
+def reserve_folder_numbers(count, now=None):
+    """Reserve `count` consecutive numbers with one counter update, for bulk loads."""
+    if count <= 0:
+        return []
+    name, number_format, context = _sequence(now)
+    low, high = HiLoAllocator(name, count).reserve()
+    return [number_format.format(seq=seq, **context) for seq in range(low, high + 1)]
@@ -0,0 +1,164 @@
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import timeline
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the full ordering tuple.
+
+    Unlike DRF's CursorPagination, which positions on the first ordering field
+    and walks an offset over ties, the cursor stores a value for every field in
+    `ordering` so each page is a single indexed range scan.  The last field
+    must be unique (normally the primary key) for the ordering to be total.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, reverse))
+        ordering = self._reversed_ordering() if reverse else self.ordering
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+            except (KeyError, ValueError):
+                pass
+            else:
+                if size > 0:
+                    return min(size, self.max_page_size)
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, instance, reverse):
+        tokens = [('r', '1' if reverse else '0')]
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            tokens.append(('p', str(value)))
+        encoded = b64encode(parse.urlencode(tokens).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+            reverse = tokens['r'][0] == '1'
+            raw = tokens['p']
+            if len(raw) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, raw)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def _reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else '-' + field for field in self.ordering)
+
+    def _seek(self, position, reverse):
+        """Build `(f1, f2, ...) < (v1, v2, ...)` as OR-ed prefix comparisons."""
+        condition = Q()
+        prefix = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= prefix & Q(**{'%s__%s' % (name, lookup): value})
+            prefix &= Q(**{name: value})
+        return condition
+
+
+class TimelinePagination(KeysetPagination):
+    """
+    Pages of a case folder's timeline (app/timeline.py), newest first.
+
+    The feed merges three tables, so it is paged with `paginate_timeline()`
+    rather than over a queryset; page sizes, links and the response follow
+    KeysetPagination, with the timeline's own cursors.
+    """
+
+    def paginate_timeline(self, folder_id, request):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = None, False
+        if self.cursor_query_param in request.query_params:
+            try:
+                position, reverse = timeline.decode_cursor(request.query_params[self.cursor_query_param])
+            except timeline.InvalidCursor:
+                raise NotFound(self.invalid_cursor_message)
+        results, self.next_cursor, self.previous_cursor = timeline.timeline_page(
+            folder_id, position, self.page_size, reverse)
+        return results
+
+    def get_next_link(self):
+        return self._link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.previous_cursor)
+
+    def _link(self, cursor):
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor) if cursor else None
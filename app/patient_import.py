@@ -0,0 +1,111 @@
+"""
+Streaming bulk import of patients from CSV or NDJSON.
+
+Rows are read one at a time from the file, validated with PatientSerializer's
+field rules, and written with bulk_create in batches of `batch_size`, each in
+its own transaction; memory stays proportional to the batch, not the file.
+A row is rejected when it fails validation or when its `matric_no` or
+`jamb_no` is already taken, either by a stored patient (checked per batch
+against the indexed columns) or by an earlier row of the same batch.
+Rejected rows are handed to `on_reject` with their line number and errors.
+"""
+import csv
+import io
+import json
+import time
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Patient
+from .serializers import PatientSerializer
+
+FORMATS = ('csv', 'ndjson')
+UNIQUE_FIELDS = ('matric_no', 'jamb_no')
+
+
+def detect_format(filename):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return None
+
+
+def iter_rows(stream, fmt):
+    """Yield `(line, row)` from a binary stream; undecodable NDJSON lines yield `(line, None)`."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            row.pop(None, None)  # cells beyond the header
+            yield reader.line_num, row
+        return
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError:
+            row = None
+        yield line, row if isinstance(row, dict) else None
+
+
+def import_patients(rows, user, batch_size=1000, on_reject=None):
+    """
+    Create patients from `(line, row)` pairs; return counts and elapsed time.
+
+    `on_reject(line, row, errors)` is called for every rejected row.
+    """
+    started = time.perf_counter()
+    # One serializer validates every row; building its fields is the slow part
+    validator = PatientSerializer()
+    totals = {'rows': 0, 'created': 0, 'rejected': 0}
+    batch = []
+
+    def reject(line, row, errors):
+        totals['rejected'] += 1
+        if on_reject is not None:
+            on_reject(line, row, errors)
+
+    for line, row in rows:
+        totals['rows'] += 1
+        if row is None:
+            reject(line, row, {'non_field_errors': ['Expected a JSON object.']})
+            continue
+        try:
+            data = validator.run_validation(row)
+        except serializers.ValidationError as exc:
+            reject(line, row, exc.detail)
+            continue
+        batch.append((line, row, data))
+        if len(batch) >= batch_size:
+            totals['created'] += _write_batch(batch, user, reject)
+            batch = []
+    if batch:
+        totals['created'] += _write_batch(batch, user, reject)
+
+    totals['seconds'] = time.perf_counter() - started
+    return totals
+
+
+def _write_batch(batch, user, reject):
+    taken = {
+        field: set(Patient.objects.filter(**{field + '__in': {data[field] for _, _, data in batch}})
+                   .values_list(field, flat=True))
+        for field in UNIQUE_FIELDS
+    }
+    patients = []
+    for line, row, data in batch:
+        duplicates = {field: ['A patient with this %s already exists.' % field]
+                      for field in UNIQUE_FIELDS if data[field] in taken[field]}
+        if duplicates:
+            reject(line, row, duplicates)
+            continue
+        for field in UNIQUE_FIELDS:
+            taken[field].add(data[field])
+        patients.append(Patient(created_by=user, **data))
+    with transaction.atomic():
+        Patient.objects.bulk_create(patients)
+    return len(patients)
@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission
 
+from .authentication import MetricsTokenAuthentication
+
 class IsHIMRole(BasePermission):
     """Permission class for HIM role"""
     def has_permission(self, request, view):
@@ -34,4 +36,11 @@ class IsNurseOrDoctorRole(BasePermission):
 class IsHIMNurseOrDoctorRole(BasePermission):
     """Permission class for HIM or Doctor roles"""
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.role in ['HIM', 'NURSE', 'DOCTOR']
\ No newline at end of file
+        return request.user.is_authenticated and request.user.role in ['HIM', 'NURSE', 'DOCTOR']
+
+class IsMetricsScraper(BasePermission):
+    """Permission class for /metrics: the METRICS_TOKEN bearer or a staff user"""
+    def has_permission(self, request, view):
+        if isinstance(request.successful_authenticator, MetricsTokenAuthentication):
+            return True
+        return request.user.is_authenticated and request.user.is_staff
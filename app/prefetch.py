@@ -0,0 +1,64 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+def plan_queryset(queryset, serializer):
+    """
+    Apply the select_related/prefetch_related calls `serializer` will need.
+
+    The serializer tree is walked once: nested single-object serializers and
+    related fields that render the object become joins, many=True nested
+    serializers become `Prefetch` objects whose querysets are planned the same
+    way, so a list costs one query per collection rather than one per row.
+    Primary key related fields read the `<name>_id` column and cost nothing.
+    """
+    select, prefetch = _plan(queryset.model, serializer, '')
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def _plan(model, serializer, prefix):
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        relation = _relation(model, field.source)
+        if relation is None:
+            continue
+        path = prefix + field.source
+
+        if isinstance(field, serializers.ListSerializer):
+            child = field.child
+            related_model = relation.related_model
+            if isinstance(child, serializers.ModelSerializer):
+                prefetch.append(Prefetch(path, queryset=plan_queryset(related_model._default_manager.all(), child)))
+            else:
+                prefetch.append(path)
+        elif isinstance(field, ManyRelatedField):
+            prefetch.append(path)
+        elif relation.many_to_many or relation.one_to_many:
+            # A plain field on a collection (e.g. ListField) still iterates it.
+            prefetch.append(path)
+        elif isinstance(field, serializers.BaseSerializer):
+            select.append(path)
+            nested_select, nested_prefetch = _plan(relation.related_model, field, path + '__')
+            select.extend(nested_select)
+            prefetch.extend(nested_prefetch)
+        elif isinstance(field, RelatedField) and not field.use_pk_only_optimization():
+            select.append(path)
+    return select, prefetch
+
+
+def _relation(model, source):
+    if '.' in source:
+        return None
+    try:
+        field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
@@ -0,0 +1,135 @@
+"""
+Per-request timings and per-URL latency histograms.
+
+ProfilingMiddleware (app/middleware.py) times each request and breaks it
+into database time and query count (through `connection.execute_wrapper`),
+view time (the view's own work, mostly serialization, with database time
+taken out) and template response rendering.  The split is sent back as a
+`Server-Timing` header and recorded here under the URL name.
+
+Each URL name keeps counters and a histogram with fixed, logarithmically
+spaced buckets (each 25% wider than the last, 0.1 ms to ~60 s), so memory
+is constant however many requests are seen and recording is a bisect.
+Percentiles are read from the buckets and are accurate to one bucket width.
+Histograms are per process.
+"""
+import bisect
+import math
+import threading
+from time import perf_counter
+
+BUCKET_GROWTH = 1.25
+BUCKET_BOUNDS = tuple(0.1 * BUCKET_GROWTH ** n for n in range(int(math.log(600000, BUCKET_GROWTH)) + 1))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * fraction))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+
+
+class RouteStats:
+    def __init__(self):
+        self.duration = Histogram()
+        self.db_time = 0.0
+        self.queries = 0
+        self.view_time = 0.0
+        self.render_time = 0.0
+        self.errors = 0
+
+    def summary(self):
+        count = self.duration.count
+        return {
+            'requests': count,
+            'errors': self.errors,
+            'p50_ms': _round(self.duration.percentile(0.50)),
+            'p95_ms': _round(self.duration.percentile(0.95)),
+            'p99_ms': _round(self.duration.percentile(0.99)),
+            'max_ms': _round(self.duration.max),
+            'mean_ms': _round(self.duration.total / count),
+            'mean_db_ms': _round(self.db_time / count),
+            'mean_queries': round(self.queries / count, 2),
+            'mean_view_ms': _round(self.view_time / count),
+            'mean_render_ms': _round(self.render_time / count),
+        }
+
+
+def _round(value):
+    return None if value is None else round(value, 3)
+
+
+class Profiler:
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, timing, status_code):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats()
+            stats.duration.add(timing.total)
+            stats.db_time += timing.db_time
+            stats.queries += timing.queries
+            stats.view_time += timing.view_time
+            stats.render_time += timing.render_time
+            if status_code >= 500:
+                stats.errors += 1
+
+    def stats(self):
+        with self._lock:
+            return {route: stats.summary() for route, stats in sorted(self._routes.items())}
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+
+
+profiler = Profiler()
+
+
+class RequestTiming:
+    """Milliseconds spent in one request, filled in by ProfilingMiddleware."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.view_time = 0.0
+        self.render_time = 0.0
+        self.total = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += (perf_counter() - started) * 1000
+            self.queries += 1
+
+    def header(self):
+        return ', '.join([
+            'db;dur=%.2f;desc="%d queries"' % (self.db_time, self.queries),
+            'view;dur=%.2f' % self.view_time,
+            'render;dur=%.2f' % self.render_time,
+            'total;dur=%.2f' % self.total,
+        ])
@@ -0,0 +1,85 @@
+"""
+Primary/replica database routing.
+
+Reads inside a request go to the READ_REPLICA_ALIAS database when one is
+configured; writes, migrations and anything inside a transaction on the
+primary go to the primary.  ReplicaStickinessMiddleware (app/middleware.py)
+opens the request scope.  Everything outside one -- task runners, management
+commands, background threads -- reads from the primary, since it cannot
+tell how far behind the replica is.
+
+Once a request writes, its later reads are pinned to the primary so it reads
+its own writes; the middleware carries that pin over to the client's next
+few requests with a short-lived cookie, which covers the replica's sync lag.
+
+The token blacklist is always read from the primary: a revoked token must
+not be accepted while the replica catches up.
+"""
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_ONLY_APPS = {'token_blacklist'}
+
+_state = threading.local()
+
+
+def replica_alias():
+    return getattr(settings, 'READ_REPLICA_ALIAS', None)
+
+
+def open_request():
+    """Let this thread's reads use the replica until close_request()."""
+    _state.request = True
+    unpin()
+
+
+def close_request():
+    _state.request = False
+    unpin()
+
+
+def in_request():
+    return getattr(_state, 'request', False)
+
+
+def pin_to_primary():
+    _state.pinned = True
+
+
+def unpin():
+    _state.pinned = _state.wrote = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def has_written():
+    return getattr(_state, 'wrote', False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if (
+            not alias
+            or not in_request()
+            or is_pinned()
+            or model._meta.app_label in PRIMARY_ONLY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _state.pinned = _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,31 @@
+"""
+Test runner.
+
+The default cache lives outside the process (see CACHES in ehr/settings.py),
+so a run would otherwise share it with the development server and with
+earlier runs, whose cached documents belong to other databases.  Each run
+gets a throwaway cache directory instead.
+"""
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner as BaseDiscoverRunner
+from django.test.utils import override_settings
+
+
+class DiscoverRunner(BaseDiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp(prefix='ehr-test-cache-')
+        self._cache_override = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self._cache_dir,
+            }
+        })
+        self._cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_override.disable()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
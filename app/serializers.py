@@ -1,11 +1,16 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
-from .models import User, Patient, CaseFolder, MedicalHistory, DiagnosisAdmission, VitalSigns, PatientNote
+from .models import User, Patient, CaseFolder, MedicalHistory, DiagnosisAdmission, VitalSigns, PatientNote, BundleExportJob
 from rest_framework import serializers
 from django.contrib import auth
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
+from .tokens import RoleRefreshToken
+from . import numbering
 from django.utils.crypto import get_random_string
+from django.conf import settings
+from datetime import timedelta
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -71,20 +76,21 @@ class LoginSerializer(serializers.ModelSerializer):
         username = attrs.get('username', '')
         password = attrs.get('password', '')
 
-        if not User.objects.filter(username=username).exists():
-            raise AuthenticationFailed('Invalid username, try again')
-        
-        user = auth.authenticate(username=username, password=password)
-
+        # authenticate() does the only lookup of a successful login; a failed one
+        # looks the username up again to say why
+        user = auth.authenticate(self.context.get('request'), username=username, password=password)
         if user is None:
+            is_active = User.objects.filter(username=username).values_list('is_active', flat=True).first()
+            if is_active is None:
+                raise AuthenticationFailed('Invalid username, try again')
+            if not is_active:
+                raise AuthenticationFailed('Account disabled, contact admin')
             raise AuthenticationFailed('Invalid password, try again')
 
-        if not user.is_active:
-            raise AuthenticationFailed('Account disabled, contact admin')
-
         if not user.is_authorized:
             raise AuthenticationFailed('Your account has not been approved by an admin')
 
+        self.user = user
         serializer = UserSerializer(user)
         return {
             'email': user.email,
@@ -100,12 +106,17 @@ class LogoutSerializer(serializers.Serializer):
         return attrs
     def save(self, **kwargs):
         try:
-            RefreshToken(self.token).blacklist()
+            RoleRefreshToken(self.token).blacklist()
         except TokenError as e:
             # self.fail('bad_token')
             raise serializers.ValidationError(str(e))
 
 
+class RefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that checks the in-memory blacklist index"""
+    token_class = RoleRefreshToken
+
+
 # class PasswordResetSerializer(serializers.Serializer):
 #     email = serializers.EmailField()
 
@@ -131,6 +142,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 class PatientSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
+    tribe = serializers.CharField(source='Tribe', max_length=60)
     
     class Meta:
         model = Patient
@@ -144,7 +156,7 @@ class PatientSerializer(serializers.ModelSerializer):
 class MedicalHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicalHistory
-        fields = ['id', 'hypertension', 'measles', 'chicken_pox', 'tb', 'diabetes', 'liver_disease', 'sti',
+        fields = ['id', 'hypertension', 'measles', 'chicken_pox', 'tb', 'diabetes', 'kidney_disease', 'sti',
          'yellow_fever', 'liver_disease', 'epilepsy', 'sc_disease', 'gd_ulcer', 'rta_injury', 'alcohol_smoking',
          'previous_ops', 'schistosomiasis', 'respiratory_disease', 'mental_disease', 'hiv', 'allergies', 'recorded_by',
           'created_at', 'updated_at']
@@ -165,17 +177,152 @@ class VitalSignsSerializer(serializers.ModelSerializer):
         fields = ['id', 'blood_pressure', 'pulse', 'weight', 'height', 'urine_albumin', 'urine_sugar', 'recorded_by', 'recorded_at']
         read_only_fields = ['recorded_by', 'recorded_at']
 
+class ConditionListField(serializers.CharField):
+    """Comma separated MedicalHistory condition names, validated to a list"""
+    def to_internal_value(self, data):
+        names = [name.strip() for name in super().to_internal_value(data).split(',') if name.strip()]
+        unknown = [name for name in names if name not in MedicalHistory.CONDITIONS]
+        if unknown:
+            raise serializers.ValidationError('Unknown condition(s): %s' % ', '.join(unknown))
+        return names
+
+class CohortQuerySerializer(serializers.Serializer):
+    include = ConditionListField(required=False, default=list)
+    exclude = ConditionListField(required=False, default=list)
+    limit = serializers.IntegerField(min_value=0, max_value=1000, default=100)
+
+    def validate(self, attrs):
+        overlap = set(attrs['include']) & set(attrs['exclude'])
+        if overlap:
+            raise serializers.ValidationError('Conditions both included and excluded: %s' % ', '.join(sorted(overlap)))
+        return attrs
+
+class ConditionReportQuerySerializer(serializers.Serializer):
+    DIMENSIONS = ['gender', 'state_of_origin', 'religion', 'age_band']
+
+    condition = ConditionListField(required=False, default=list)
+    group_by = serializers.MultipleChoiceField(choices=DIMENSIONS, required=False, default=set)
+
+    def to_internal_value(self, data):
+        if 'group_by' in data and hasattr(data, 'getlist'):
+            data = data.copy()
+            data.setlist('group_by', [name.strip() for value in data.getlist('group_by') for name in value.split(',')])
+        return super().to_internal_value(data)
+
+class AdmissionReportQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+class VitalSignsBulkItemSerializer(VitalSignsSerializer):
+    case_folder = serializers.IntegerField()
+
+    class Meta(VitalSignsSerializer.Meta):
+        fields = ['case_folder'] + VitalSignsSerializer.Meta.fields
+
+class VitalSignsSeriesQuerySerializer(serializers.Serializer):
+    # The longest bucket of each interval, for counting the buckets of a span
+    INTERVALS = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1),
+                 'month': timedelta(days=31)}
+
+    case_folder = serializers.IntegerField()
+    interval = serializers.ChoiceField(choices=list(INTERVALS), default='day')
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs:
+            if attrs['end'] <= attrs['start']:
+                raise serializers.ValidationError('end must be after start.')
+            buckets = (attrs['end'] - attrs['start']) / self.INTERVALS[attrs['interval']]
+            if buckets > max_series_buckets():
+                raise serializers.ValidationError(
+                    'A %s series is limited to %d buckets; narrow start..end or use a longer interval.' % (
+                        attrs['interval'], max_series_buckets()))
+        return attrs
+
+
+def max_series_buckets():
+    return getattr(settings, 'VITALS_SERIES_MAX_BUCKETS', 1000)
+
+
 class PatientNoteSerializer(serializers.ModelSerializer):
-    profile = UserSerializer(read_only=True)
+    recorded_by = UserSerializer(read_only=True)
     
     class Meta:
         model = PatientNote
         fields = ['id', 'surname', 'other_names', 'date', 'notes', 'user_type', 'recorded_by', 'created_at']
-        read_only_fields = ['profile', 'created_at']
+        read_only_fields = ['recorded_by', 'user_type', 'created_at']
+
+def parse_fieldset(value):
+    """Turn `id,patient.first_name,patient.last_name` into a nested dict tree."""
+    tree = {}
+    for path in filter(None, (part.strip() for part in value.split(','))):
+        node = tree
+        for name in path.split('.'):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def prune_fields(fields, tree):
+    """Drop every field not named in `tree`, recursing into nested serializers."""
+    for name in list(fields):
+        if name not in tree:
+            del fields[name]
+        elif tree[name]:
+            field = fields[name]
+            field = getattr(field, 'child', field)
+            if isinstance(field, serializers.BaseSerializer):
+                prune_fields(field.fields, tree[name])
 
-class CaseFolderSerializer(serializers.ModelSerializer):
+
+class SparseFieldsetMixin:
+    """
+    Let GET requests choose what is rendered with `?fields=` and `?expand=`.
+
+    `expand` lists the nested relations to render in full; relations left out
+    collapse to their primary key (foreign keys) or are omitted (reverse
+    relations and collections).  When `expand` is absent every relation is
+    expanded, as before.  `fields` restricts the output to the listed fields,
+    with dotted paths reaching into nested serializers; a dotted path also
+    expands its relation.  Views plan their queryset from the pruned fields,
+    so nothing that is not rendered gets joined or prefetched.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return fields
+
+        params = request.query_params
+        requested = parse_fieldset(params['fields']) if 'fields' in params else None
+        if 'expand' in params:
+            expanded = set(parse_fieldset(params['expand']))
+            expanded.update(name for name, sub in (requested or {}).items() if sub)
+            self._collapse(fields, expanded)
+        if requested is not None:
+            prune_fields(fields, requested)
+        return fields
+
+    def _collapse(self, fields, expanded):
+        opts = self.Meta.model._meta
+        for name, field in list(fields.items()):
+            if name in expanded or field.write_only:
+                continue
+            if not isinstance(field, (serializers.BaseSerializer, serializers.RelatedField)):
+                continue
+            source = field.source or name
+            model_field = opts.get_field(source)
+            if model_field.concrete and not model_field.many_to_many:
+                kwargs = {'source': source} if source != name else {}
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **kwargs)
+            else:
+                del fields[name]
+
+
+class CaseFolderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     patient = PatientSerializer(read_only=True)
-    patient_id = serializers.IntegerField(write_only=True)
+    patient_id = serializers.PrimaryKeyRelatedField(queryset=Patient.objects.all(), source='patient', write_only=True)
     medical_history = MedicalHistorySerializer(read_only=True)
     diagnoses = DiagnosisAdmissionSerializer(many=True, read_only=True)
     vital_signs = VitalSignsSerializer(many=True, read_only=True)
@@ -186,7 +333,56 @@ class CaseFolderSerializer(serializers.ModelSerializer):
         model = CaseFolder
         fields = ['id', 'patient', 'patient_id', 'folder_number', 'medical_history', 'diagnoses', 'vital_signs', 'notes', 'created_by', 'created_at']
         read_only_fields = ['created_by', 'created_at']
+        # Allocated by the server (app/numbering.py) when left out
+        extra_kwargs = {'folder_number': {'required': False}}
+
+    def validate_folder_number(self, value):
+        # A supplied number the server could also assign would make a later
+        # allocation fail on the unique constraint
+        unchanged = self.instance is not None and self.instance.folder_number == value
+        if not unchanged and numbering.is_server_number(value):
+            raise serializers.ValidationError(
+                'Numbers in the format %s are assigned by the server; leave folder_number out to get one.'
+                % numbering.folder_number_format())
+        return value
     
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
+
+
+class BundleCaseFolderSerializer(serializers.ModelSerializer):
+    """A case folder inside a patient bundle; the patient is the bundle's root"""
+    medical_history = MedicalHistorySerializer(read_only=True)
+    diagnoses = DiagnosisAdmissionSerializer(many=True, read_only=True)
+    vital_signs = VitalSignsSerializer(many=True, read_only=True)
+    notes = PatientNoteSerializer(many=True, read_only=True)
+    created_by = UserSerializer(read_only=True)
+
+    class Meta:
+        model = CaseFolder
+        fields = ['id', 'folder_number', 'medical_history', 'diagnoses', 'vital_signs', 'notes', 'created_by', 'created_at']
+
+
+class PatientBundleSerializer(PatientSerializer):
+    case_folders = BundleCaseFolderSerializer(many=True, read_only=True)
+
+    class Meta(PatientSerializer.Meta):
+        fields = PatientSerializer.Meta.fields + ['case_folders']
+
+
+class BundleExportJobSerializer(serializers.ModelSerializer):
+    patient_ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_null=True,
+                                        write_only=True)
+
+    class Meta:
+        model = BundleExportJob
+        fields = ['id', 'status', 'patient_ids', 'total', 'completed', 'output_dir', 'error', 'missing_patient_ids',
+                  'created_by', 'created_at', 'heartbeat_at', 'finished_at']
+        read_only_fields = ['status', 'total', 'completed', 'output_dir', 'error', 'missing_patient_ids',
+                            'created_by', 'created_at', 'heartbeat_at', 'finished_at']
+
+    def validate_patient_ids(self, value):
+        if value is not None and not value:
+            raise serializers.ValidationError('Give at least one patient, or leave out patient_ids for all.')
+        return None if value is None else [str(pk) for pk in dict.fromkeys(value)]
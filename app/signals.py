@@ -0,0 +1,104 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from . import aggregates
+from .authentication import AUTH_FIELDS, revoke_cached_user, user_cache
+from .blacklist import blacklist_index
+from .cache import invalidate_casefolder
+from .db import apply_sqlite_pragmas
+from .metrics import connection_opened
+from .models import User, CaseFolder, DiagnosisAdmission, MedicalHistory, Patient, PatientNote, VitalSigns
+
+
+connection_created.connect(apply_sqlite_pragmas, dispatch_uid='apply_sqlite_pragmas')
+connection_created.connect(connection_opened, dispatch_uid='count_connections')
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or AUTH_FIELDS & set(update_fields):
+        revoke_cached_user(instance.pk)
+    else:
+        user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def index_blacklisted_token(sender, instance, created, **kwargs):
+    if created:
+        blacklist_index.add(instance.token.jti, instance.token.expires_at)
+
+
+@receiver([post_save, post_delete], sender=MedicalHistory)
+@receiver([post_save, post_delete], sender=DiagnosisAdmission)
+@receiver([post_save, post_delete], sender=VitalSigns)
+@receiver([post_save, post_delete], sender=PatientNote)
+def invalidate_folder_of_record(sender, instance, **kwargs):
+    invalidate_casefolder(instance.case_folder_id)
+
+
+@receiver([post_save, post_delete], sender=CaseFolder)
+def invalidate_folder(sender, instance, **kwargs):
+    invalidate_casefolder(instance.pk)
+
+
+@receiver(post_save, sender=Patient)
+def invalidate_folders_of_patient(sender, instance, **kwargs):
+    invalidate_casefolder(*instance.case_folders.values_list('pk', flat=True))
+
+
+@receiver(pre_save, sender=MedicalHistory)
+def remember_history_aggregate_keys(sender, instance, **kwargs):
+    instance._aggregate_keys = aggregates.stored_history_keys(instance.pk) if instance.pk else []
+
+
+@receiver(post_save, sender=MedicalHistory)
+def update_history_aggregates(sender, instance, **kwargs):
+    before = getattr(instance, '_aggregate_keys', [])
+    aggregates.apply_condition_deltas(aggregates.diff(before, aggregates.history_keys(instance)))
+
+
+@receiver(pre_delete, sender=MedicalHistory)
+def remember_deleted_history_aggregate_keys(sender, instance, **kwargs):
+    instance._aggregate_keys = aggregates.stored_history_keys(instance.pk)
+
+
+@receiver(post_delete, sender=MedicalHistory)
+def remove_history_aggregates(sender, instance, **kwargs):
+    aggregates.apply_condition_deltas(aggregates.diff(getattr(instance, '_aggregate_keys', []), []))
+
+
+@receiver(pre_save, sender=Patient)
+def remember_patient_aggregate_keys(sender, instance, **kwargs):
+    instance._aggregate_keys = None
+    if instance.pk and not instance._state.adding:
+        instance._aggregate_keys = aggregates.patient_keys(instance, stored=True)
+
+
+@receiver(post_save, sender=Patient)
+def update_patient_aggregates(sender, instance, **kwargs):
+    before = getattr(instance, '_aggregate_keys', None)
+    if before is not None:
+        aggregates.apply_condition_deltas(aggregates.diff(before, aggregates.patient_keys(instance)))
+
+
+@receiver(pre_save, sender=DiagnosisAdmission)
+def remember_admission_month(sender, instance, **kwargs):
+    instance._aggregate_month = None
+    if instance.pk:
+        stored = DiagnosisAdmission.objects.filter(pk=instance.pk).values_list('date_of_admission', flat=True).first()
+        if stored is not None:
+            instance._aggregate_month = aggregates.admission_month(stored)
+
+
+@receiver(post_save, sender=DiagnosisAdmission)
+def update_admission_aggregates(sender, instance, **kwargs):
+    before = getattr(instance, '_aggregate_month', None)
+    after = aggregates.admission_month(instance.date_of_admission)
+    aggregates.apply_admission_deltas(aggregates.diff([before] if before else [], [after]))
+
+
+@receiver(post_delete, sender=DiagnosisAdmission)
+def remove_admission_aggregates(sender, instance, **kwargs):
+    aggregates.apply_admission_deltas({aggregates.admission_month(instance.date_of_admission): -1})
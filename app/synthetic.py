@@ -0,0 +1,244 @@
+"""
+Synthetic HIM data for load testing and benchmarks.
+
+`generate()` fills the database with staff of every role, patients, case
+folders and their medical histories, diagnoses, vital signs and notes,
+inserting each batch of patients and everything under them with bulk_create
+in one transaction.  bulk_create skips save() and signals, so the derived
+columns are filled in here (the `conditions` bitmask, the parsed vital
+readings, folder numbers from the case folder sequence) and the reporting
+aggregates are rebuilt at the end.
+
+Timestamps are spread over the past few years rather than all being "now",
+so time-ordered lists, timelines, vital sign series and monthly reports see
+realistic distributions.  The same seed produces the same data.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import aggregates
+from .models import CaseFolder, DiagnosisAdmission, MedicalHistory, Patient, PatientNote, User, VitalSigns
+from .numbering import reserve_folder_numbers
+
+FIRST_NAMES = (
+    'Adebayo', 'Chiamaka', 'Emeka', 'Fatima', 'Funmilayo', 'Ibrahim', 'Ifeoma', 'Kehinde', 'Musa', 'Ngozi',
+    'Oluwaseun', 'Sadiq', 'Temitope', 'Uche', 'Yetunde', 'Zainab', 'Tunde', 'Aisha', 'Chinedu', 'Bola',
+)
+LAST_NAMES = (
+    'Adeyemi', 'Okafor', 'Bello', 'Okonkwo', 'Abubakar', 'Balogun', 'Eze', 'Ogunleye', 'Nwosu', 'Lawal',
+    'Olawale', 'Danjuma', 'Chukwu', 'Akinola', 'Usman', 'Obi', 'Adewale', 'Ibekwe', 'Salami', 'Garba',
+)
+# ((state of origin, tribe), weight)
+ORIGINS = (
+    (('Oyo', 'Yoruba'), 20), (('Lagos', 'Yoruba'), 15), (('Ogun', 'Yoruba'), 10), (('Osun', 'Yoruba'), 8),
+    (('Anambra', 'Igbo'), 8), (('Enugu', 'Igbo'), 6), (('Imo', 'Igbo'), 6), (('Kano', 'Hausa'), 6),
+    (('Kaduna', 'Hausa'), 5), (('Kwara', 'Yoruba'), 5), (('Rivers', 'Ijaw'), 4), (('Edo', 'Bini'), 4),
+    (('Benue', 'Tiv'), 3),
+)
+RELIGIONS = (('CHRISTIAN', 55), ('MUSLIM', 40), ('OTHER', 5))
+ORIGIN_VALUES, ORIGIN_WEIGHTS = zip(*ORIGINS)
+RELIGION_VALUES, RELIGION_WEIGHTS = zip(*RELIGIONS)
+# Share of medical histories with each condition
+PREVALENCE = {
+    'hypertension': 0.06, 'measles': 0.3, 'chicken_pox': 0.25, 'tb': 0.01, 'diabetes': 0.02,
+    'yellow_fever': 0.02, 'sti': 0.03, 'kidney_disease': 0.01, 'liver_disease': 0.01, 'epilepsy': 0.01,
+    'sc_disease': 0.02, 'gd_ulcer': 0.05, 'rta_injury': 0.04, 'alcohol_smoking': 0.08, 'previous_ops': 0.06,
+    'schistosomiasis': 0.02, 'respiratory_disease': 0.05, 'mental_disease': 0.01, 'hiv': 0.01, 'allergies': 0.12,
+}
+DIAGNOSES = (
+    'Malaria', 'Typhoid fever', 'Upper respiratory tract infection', 'Acute gastroenteritis',
+    'Peptic ulcer disease', 'Urinary tract infection', 'Dysmenorrhoea', 'Asthma exacerbation',
+    'Sickle cell crisis', 'Essential hypertension', 'Allergic conjunctivitis', 'Soft tissue injury',
+)
+NOTES = (
+    'Patient seen and examined. Vitals stable.', 'Complains of headache and fever for three days.',
+    'Commenced on oral antimalarials; review in 72 hours.', 'Tolerating orally, no fresh complaints.',
+    'Advised on adequate hydration and rest.', 'Referred to the laboratory for full blood count.',
+    'Wound dressed, healing well.', 'Blood pressure rechecked after rest.', 'Discharged home on medication.',
+)
+HISTORY_YEARS = 4
+PASSWORD = 'password123'
+
+
+@contextmanager
+def backdated(*fields):
+    """Let bulk_create store the given auto_now_add fields as set on the instances."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _timestamp_fields():
+    return [model._meta.get_field(name) for model, name in (
+        (Patient, 'created_at'), (CaseFolder, 'created_at'), (MedicalHistory, 'created_at'),
+        (DiagnosisAdmission, 'created_at'), (VitalSigns, 'recorded_at'), (PatientNote, 'created_at'),
+    )]
+
+
+def _count(rng, mean):
+    """A per-record count with the given mean and a long tail."""
+    return int(round(rng.expovariate(1.0 / mean))) if mean > 0 else 0
+
+
+def _between(rng, start, end):
+    return start + timedelta(seconds=rng.uniform(0, max((end - start).total_seconds(), 0)))
+
+
+def create_staff(per_role, rng, prefix='synthetic'):
+    """`per_role` authorized users of every role; existing ones are reused."""
+    password = make_password(PASSWORD)
+    wanted = [('%s-%s-%d' % (prefix, role.lower(), n), role)
+              for role, _ in User.ROLE_CHOICES for n in range(1, per_role + 1)]
+    existing = set(User.objects.filter(username__in=[name for name, _ in wanted]).values_list('username', flat=True))
+    User.objects.bulk_create([
+        User(username=username, email='%s@example.com' % username, password=password, role=role,
+             is_authorized=True, first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES))
+        for username, role in wanted if username not in existing
+    ])
+    staff = {role: [] for role, _ in User.ROLE_CHOICES}
+    for user in User.objects.filter(username__in=[name for name, _ in wanted]).order_by('pk'):
+        staff[user.role].append(user)
+    return staff
+
+
+def generate(patients, folders_per_patient=1.5, histories=True, diagnoses_per_folder=1, vitals_per_folder=10,
+             notes_per_folder=5, staff_per_role=5, seed=0, batch_size=1000, on_progress=None):
+    """
+    Insert `patients` synthetic patients and their records.
+
+    Folder and record counts per patient vary around the given means.
+    `on_progress(totals)` is called after every batch.  Returns the row count
+    of each table and the elapsed seconds.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    now = timezone.now()
+    staff = create_staff(staff_per_role, rng)
+    him, doctors, nurses = staff['HIM'], staff['DOCTOR'], staff['NURSE']
+    serial = Patient.objects.count()
+
+    totals = {'staff': sum(len(users) for users in staff.values()), 'patients': 0, 'case_folders': 0,
+              'medical_histories': 0, 'diagnoses': 0, 'vital_signs': 0, 'notes': 0}
+    with backdated(*_timestamp_fields()):
+        for low in range(0, patients, batch_size):
+            count = min(batch_size, patients - low)
+            with transaction.atomic():
+                batch = _patients(rng, count, serial + low, him, now)
+                folders = _case_folders(rng, batch, folders_per_patient, him, now)
+                history_rows, diagnoses, vitals, notes = [], [], [], []
+                for folder in folders:
+                    if histories:
+                        history_rows.append(_history(rng, folder, doctors))
+                    diagnoses.extend(_diagnosis(rng, folder, doctors, now)
+                                     for _ in range(_count(rng, diagnoses_per_folder)))
+                    vitals.extend(_vitals(rng, folder, nurses, now) for _ in range(_count(rng, vitals_per_folder)))
+                    notes.extend(_note(rng, folder, doctors, nurses, now)
+                                 for _ in range(_count(rng, notes_per_folder)))
+                MedicalHistory.objects.bulk_create(history_rows, batch_size=batch_size)
+                DiagnosisAdmission.objects.bulk_create(diagnoses, batch_size=batch_size)
+                VitalSigns.objects.bulk_create(vitals, batch_size=batch_size)
+                PatientNote.objects.bulk_create(notes, batch_size=batch_size)
+            totals['patients'] += len(batch)
+            totals['case_folders'] += len(folders)
+            totals['medical_histories'] += len(history_rows)
+            totals['diagnoses'] += len(diagnoses)
+            totals['vital_signs'] += len(vitals)
+            totals['notes'] += len(notes)
+            if on_progress is not None:
+                on_progress(dict(totals, seconds=time.perf_counter() - started))
+
+    aggregates.rebuild()
+    totals['seconds'] = time.perf_counter() - started
+    return totals
+
+
+def _patients(rng, count, serial, him, now):
+    batch = []
+    for n in range(serial, serial + count):
+        state, tribe = rng.choices(ORIGIN_VALUES, ORIGIN_WEIGHTS)[0]
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        created_at = _between(rng, now - timedelta(days=365 * HISTORY_YEARS), now)
+        batch.append(Patient(
+            first_name=first, last_name=last,
+            dob=date(created_at.year - rng.randint(16, 30), rng.randint(1, 12), rng.randint(1, 28)),
+            gender=rng.choice('MF'), matric_no='%02d/%07d' % (created_at.year % 100, n), jamb_no='J%010d' % n,
+            address='Room %d, %s Hall' % (rng.randint(1, 400), rng.choice(LAST_NAMES)),
+            phone='080%08d' % rng.randint(0, 99999999),
+            email='%s.%s%d@example.com' % (first.lower(), last.lower(), n) if rng.random() < 0.7 else None,
+            xray_no='XR%08d' % n, religion=rng.choices(RELIGION_VALUES, RELIGION_WEIGHTS)[0],
+            state_of_origin=state, Tribe=tribe, created_by=rng.choice(him), created_at=created_at,
+        ))
+    return Patient.objects.bulk_create(batch)
+
+
+def _case_folders(rng, patients, per_patient, him, now):
+    whole, fraction = int(per_patient), per_patient - int(per_patient)
+    owners = [patient for patient in patients for _ in range(max(whole + (rng.random() < fraction), 1))]
+    numbers = reserve_folder_numbers(len(owners))
+    before = CaseFolder.objects.aggregate(last=Max('pk'))['last'] or 0
+    folders = [
+        CaseFolder(patient=patient, folder_number=number, created_by=rng.choice(him),
+                   created_at=_between(rng, patient.created_at, now))
+        for patient, number in zip(owners, numbers)
+    ]
+    CaseFolder.objects.bulk_create(folders)
+    # bulk_create does not set primary keys on SQLite; read them back
+    ids = dict(CaseFolder.objects.filter(pk__gt=before).values_list('folder_number', 'pk'))
+    for folder in folders:
+        folder.pk = ids[folder.folder_number]
+    return folders
+
+
+def _history(rng, folder, doctors):
+    history = MedicalHistory(case_folder=folder, recorded_by=rng.choice(doctors), created_at=folder.created_at,
+                             **{name: rng.random() < share for name, share in PREVALENCE.items()})
+    history.conditions = history.compute_conditions()
+    return history
+
+
+def _diagnosis(rng, folder, doctors, now):
+    admitted = _between(rng, folder.created_at, now)
+    discharged = admitted + timedelta(days=rng.randint(1, 10)) if rng.random() < 0.9 else None
+    doctor = rng.choice(doctors)
+    return DiagnosisAdmission(
+        case_folder=folder, date=admitted, diagnosis=rng.choice(DIAGNOSES), date_of_admission=admitted,
+        date_of_discharge=discharged if discharged is None or discharged < now else None,
+        recorded_by=doctor, created_by=doctor, created_at=admitted,
+    )
+
+
+def _vitals(rng, folder, nurses, now):
+    systolic = int(rng.gauss(118, 14))
+    vitals = VitalSigns(
+        case_folder=folder,
+        blood_pressure='%d/%d' % (systolic, int(systolic * rng.uniform(0.6, 0.72))),
+        pulse=rng.choice(('%d', '%d bpm', '%d/min')) % rng.randint(55, 110),
+        weight='%.1fkg' % rng.gauss(65, 11), height='%dcm' % rng.gauss(168, 9),
+        urine_albumin=rng.choice(('NIL', 'NIL', 'NIL', 'TRACE', '+')),
+        urine_sugar=rng.choice(('NIL', 'NIL', 'NIL', 'NIL', 'TRACE')),
+        recorded_by=rng.choice(nurses), recorded_at=_between(rng, folder.created_at, now),
+    )
+    vitals.parse_readings()
+    return vitals
+
+
+def _note(rng, folder, doctors, nurses, now):
+    user_type = rng.choice(('DOCTOR', 'NURSE'))
+    author = rng.choice(doctors if user_type == 'DOCTOR' else nurses)
+    written = _between(rng, folder.created_at, now)
+    return PatientNote(
+        case_folder=folder, surname=author.last_name, other_names=author.first_name, date=written,
+        notes=' '.join(rng.sample(NOTES, rng.randint(1, 3))), user_type=user_type, recorded_by=author,
+        created_at=written,
+    )
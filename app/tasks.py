@@ -0,0 +1,180 @@
+"""
+A small database-backed task queue for slow side effects such as email.
+
+`@task` registers a function; `fn.delay(**kwargs)` stores a Task row in the
+caller's transaction and, once that commits, wakes the runner, so the request
+never waits for the side effect itself.  The runner is a dispatcher thread
+feeding a pool of TASK_RUNNER_THREADS workers, started on first use; with
+TASK_RUNNER_THREADS = 0 tasks wait for `manage.py drain_tasks`.
+
+A task is claimed with a conditional UPDATE, so several processes can share
+the queue.  A failed attempt is retried after TASK_RETRY_BACKOFF * 2**(n-1)
+seconds (capped at TASK_RETRY_MAX_DELAY) until `max_attempts` is reached.
+A task left RUNNING for longer than TASK_LEASE seconds (its process died) is
+claimed again, or failed if that was its last attempt.  Task arguments are keyword arguments and must be JSON.
+"""
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name=None, max_attempts=5):
+    def register(fn):
+        task_name = name or '%s.%s' % (fn.__module__, fn.__name__)
+
+        def delay(**kwargs):
+            return enqueue(task_name, **kwargs)
+
+        fn.task_name = task_name
+        fn.max_attempts = max_attempts
+        fn.delay = delay
+        TASKS[task_name] = fn
+        return fn
+    return register
+
+
+def enqueue(name, max_attempts=None, run_after=None, **kwargs):
+    if name not in TASKS:
+        raise KeyError('Unknown task %s' % name)
+    queued = Task.objects.create(name=name, kwargs=kwargs, max_attempts=max_attempts or TASKS[name].max_attempts,
+                                 run_after=run_after or timezone.now())
+    transaction.on_commit(task_runner.wake)
+    return queued
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _due(now):
+    lease = timedelta(seconds=_setting('TASK_LEASE', 600))
+    return Q(status='PENDING', run_after__lte=now) | Q(status='RUNNING', claimed_at__lt=now - lease)
+
+
+def claim(include_scheduled=False):
+    """Mark the next due task RUNNING and return its pk, or None."""
+    now = timezone.now()
+    due = _due(now) if not include_scheduled else _due(now) | Q(status='PENDING')
+    candidates = Task.objects.filter(due).order_by('run_after', 'pk')
+    for pk, name, status, attempts, max_attempts in candidates.values_list(
+            'pk', 'name', 'status', 'attempts', 'max_attempts')[:10]:
+        if status == 'RUNNING' and attempts >= max_attempts:
+            # The lease ran out on its last attempt
+            if Task.objects.filter(due, pk=pk).update(status='FAILED', finished_at=now,
+                                                      last_error='Lease expired on the last attempt'):
+                logger.error('Task %s (%d) failed for good: lease expired on attempt %d of %d', name, pk,
+                             attempts, max_attempts)
+            continue
+        if Task.objects.filter(due, pk=pk).update(status='RUNNING', claimed_at=now, attempts=F('attempts') + 1):
+            return pk
+    return None
+
+
+def backoff(attempts):
+    delay = _setting('TASK_RETRY_BACKOFF', 2) * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, _setting('TASK_RETRY_MAX_DELAY', 300)))
+
+
+def run_task(pk):
+    queued = Task.objects.get(pk=pk)
+    fn = TASKS.get(queued.name)
+    try:
+        if fn is None:
+            raise KeyError('Unknown task %s' % queued.name)
+        fn(**queued.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        if fn is None or queued.attempts >= queued.max_attempts:
+            logger.error('Task %s (%d) failed for good:\n%s', queued.name, pk, error)
+            Task.objects.filter(pk=pk).update(status='FAILED', last_error=error, finished_at=now)
+        else:
+            logger.warning('Task %s (%d) failed, attempt %d of %d', queued.name, pk, queued.attempts,
+                           queued.max_attempts)
+            Task.objects.filter(pk=pk).update(status='PENDING', last_error=error,
+                                              run_after=now + backoff(queued.attempts))
+        return False
+    Task.objects.filter(pk=pk).update(status='DONE', finished_at=timezone.now())
+    return True
+
+
+def drain(include_scheduled=False, limit=None):
+    """Run due tasks in this thread until none are left; return (succeeded, failed)."""
+    succeeded = failed = 0
+    while limit is None or succeeded + failed < limit:
+        pk = claim(include_scheduled)
+        if pk is None:
+            break
+        if run_task(pk):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
+
+
+class TaskRunner:
+    def __init__(self):
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def wake(self):
+        threads = _setting('TASK_RUNNER_THREADS', 2)
+        if not threads:
+            return
+        with self._lock:
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._dispatch, args=(threads,), name='task-dispatcher',
+                                 daemon=True).start()
+        self._wake.set()
+
+    def _dispatch(self, threads):
+        pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='task-worker')
+        slots = threading.BoundedSemaphore(threads)
+        while True:
+            slots.acquire()
+            close_old_connections()
+            try:
+                pk = claim()
+            except Exception:
+                logger.exception('Claiming a task failed')
+                pk = None
+            if pk is None:
+                slots.release()
+                self._wake.wait(_setting('TASK_POLL_INTERVAL', 1))
+                self._wake.clear()
+                continue
+            pool.submit(self._work, pk, slots)
+
+    def _work(self, pk, slots):
+        try:
+            run_task(pk)
+        except Exception:
+            logger.exception('Task %d could not be run', pk)
+        finally:
+            close_old_connections()
+            slots.release()
+            self._wake.set()
+
+
+task_runner = TaskRunner()
+
+
+@task(name='app.send_email')
+def send_email(subject, message, recipient_list, from_email=None):
+    send_mail(subject, message, from_email, recipient_list)
@@ -1,3 +1,651 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.signals import user_login_failed
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+from benchmarks.scenarios import SCENARIOS
+
+from .authentication import UserCache, user_cache
+from .blacklist import blacklist_index, prune_expired_tokens
+from . import aggregates, fastpath, metrics, numbering, routers, tasks
+from .db import apply_sqlite_pragmas
+from .prefetch import plan_queryset
+from .serializers import (
+    CaseFolderSerializer, DiagnosisAdmissionSerializer, MedicalHistorySerializer, PatientNoteSerializer,
+    PatientSerializer, UserSerializer, VitalSignsSerializer,
+)
+from .synthetic import generate
+from .middleware import ReplicaStickinessMiddleware
+from .models import (
+    BundleExportJob, CaseFolder, ConditionAggregate, DiagnosisAdmission, MedicalHistory, Patient, PatientNote, Task,
+    User, VitalSigns,
+)
+from .tokens import RoleRefreshToken
+
+
+def make_user(username='nurse', role='NURSE', **extra):
+    extra.setdefault('is_authorized', True)
+    return User.objects.create_user(
+        username=username, email='%s@example.com' % username, password='password123', role=role, **extra
+    )
+
+
+class LoginTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def login(self, username='nurse', password='password123'):
+        return self.client.post('/login/', {'username': username, 'password': password}, format='json')
+
+    def test_login_issues_one_token_pair_in_three_queries(self):
+        user = make_user()
+        # user lookup, outstanding token insert, refresh_token update
+        with self.assertNumQueries(3):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        refresh = response.data['tokens']['refresh']
+        self.assertEqual(response.cookies['refreshToken'].value, refresh)
+        user.refresh_from_db()
+        self.assertEqual(user.refresh_token, refresh)
+        self.assertEqual(OutstandingToken.objects.filter(user=user).count(), 1)
+        self.assertEqual(response.data['user']['username'], 'nurse')
+
+    def test_rejections(self):
+        make_user()
+        make_user('pending', is_authorized=False)
+        self.assertEqual(self.login('nobody').data['detail'], 'Invalid username, try again')
+        self.assertEqual(self.login(password='wrong-password').data['detail'], 'Invalid password, try again')
+        response = self.login('pending')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'Your account has not been approved by an admin')
+
+    def test_login_goes_through_the_authentication_backends(self):
+        make_user()
+        make_user('disabled', is_active=False)
+        failures = []
+
+        def receiver(sender, credentials, **kwargs):
+            failures.append(credentials['username'])
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+
+        self.assertEqual(self.login('disabled').data['detail'], 'Account disabled, contact admin')
+        self.login('nobody')
+        self.login(password='wrong-password')
+        self.assertEqual(failures, ['disabled', 'nobody', 'nurse'])
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    url = '/records/reports/admissions/'
+
+    def setUp(self):
+        user_cache.clear()
+        self.user = make_user('clerk', role='HIM')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.tokens()['access'])
+
+    def test_token_carries_role_claims(self):
+        token = AccessToken(self.user.tokens()['access'])
+        self.assertEqual((token['role'], token['is_authorized']), ('HIM', True))
+
+    def test_repeat_requests_skip_the_user_query(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_saving_the_user_evicts_it(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_change_made_by_another_process_evicts_it(self):
+        self.client.get(self.url)
+        # another process saves the user and replaces its stamp through its own
+        # connection to the shared cache
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        caches.create_connection('default').set('user:%s:auth' % self.user.pk, 'other', None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_unapproved_users_are_rejected(self):
+        self.client.get(self.url)
+        self.user.is_authorized = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'User has not been approved by an admin')
+
+    def test_role_change_revokes_existing_tokens(self):
+        self.client.get(self.url)
+        self.user.role = 'NURSE'
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'Token was issued for a different role')
+
+    def test_cache_is_bounded(self):
+        cache = UserCache(max_size=2, ttl=60)
+        for pk in range(3):
+            cache.set(pk, self.user)
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(len(cache), 2)
+        self.assertIsNot(cache.get(2), self.user)
+        expired = UserCache(max_size=2, ttl=-1)
+        expired.set(0, self.user)
+        self.assertIsNone(expired.get(0))
+
+
+class BlacklistIndexTests(TestCase):
+    def setUp(self):
+        blacklist_index.clear()
+        self.user = make_user()
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post('/api/token/refresh/', {'refresh': token}, format='json')
+
+    def test_refresh_skips_the_blacklist_table_once_warm(self):
+        refresh = self.user.tokens()['refresh']
+        self.assertEqual(self.refresh(refresh).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.refresh(refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+
+    def test_logout_is_seen_by_the_index(self):
+        refresh = self.user.tokens()['refresh']
+        self.refresh(refresh)
+        self.assertEqual(self.client.post('/logout/', {'refresh': refresh}, format='json').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refresh(refresh).status_code, 401)
+
+    def test_index_warms_from_the_tables(self):
+        token = RoleRefreshToken.for_user(self.user)
+        token.blacklist()
+        blacklist_index.clear()
+        self.assertTrue(blacklist_index.is_blacklisted(token['jti']))
+
+    def test_blacklisting_by_another_process_is_seen_within_the_sync_interval(self):
+        token = RoleRefreshToken.for_user(self.user)
+        clock = [1000.0]
+        with mock.patch('app.blacklist.time.monotonic', lambda: clock[0]), \
+                self.settings(BLACKLIST_INDEX_SYNC_INTERVAL=5):
+            self.assertFalse(blacklist_index.is_blacklisted(token['jti']))
+            # a blacklisting made by another process arrives without the receiver
+            BlacklistedToken.objects.bulk_create(
+                [BlacklistedToken(token=OutstandingToken.objects.get(jti=token['jti']))])
+            clock[0] += 4.9
+            with self.assertNumQueries(0):
+                self.assertFalse(blacklist_index.is_blacklisted(token['jti']))  # inside the staleness window
+            clock[0] += 0.1
+            with self.assertNumQueries(1):
+                self.assertTrue(blacklist_index.is_blacklisted(token['jti']))
+
+
+class PruneTokensTests(TestCase):
+    def test_prunes_only_expired_tokens_in_batches(self):
+        now = timezone.now()
+        tokens = OutstandingToken.objects.bulk_create([
+            OutstandingToken(jti='jti-%d' % n, token='t', expires_at=now + timedelta(hours=-1 if n % 2 else 1))
+            for n in range(10)
+        ])
+        tokens = list(OutstandingToken.objects.order_by('pk'))
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens[:4]])
+
+        totals = prune_expired_tokens(batch_size=2)
+        self.assertEqual((totals['outstanding'], totals['blacklisted'], totals['batches']), (5, 2, 3))
+        self.assertFalse(OutstandingToken.objects.filter(expires_at__lte=now).exists())
+        self.assertEqual(OutstandingToken.objects.count(), 5)
+        self.assertEqual(BlacklistedToken.objects.count(), 2)
+
+        out = StringIO()
+        call_command('prune_tokens', stdout=out)
+        self.assertIn('Removed 0 outstanding', out.getvalue())
+
+
+class SQLitePragmaTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA %s' % name)
+            return cursor.fetchone()[0]
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234, 'cache_size': -4096})
+    def test_configured_pragmas_are_applied_to_connection(self):
+        apply_sqlite_pragmas(sender=type(connection), connection=connection)
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+        self.assertEqual(self.pragma('cache_size'), -4096)
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': '1; DROP TABLE app_user'})
+    def test_invalid_pragma_value_is_rejected(self):
+        with self.assertRaises(ValueError):
+            apply_sqlite_pragmas(sender=type(connection), connection=connection)
+
+
+@override_settings(READ_REPLICA_ALIAS='replica')
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        routers.open_request()
+        self.addCleanup(routers.close_request)
+
+    def test_reads_go_to_replica_until_thread_writes(self):
+        self.assertEqual(self.router.db_for_read(Patient), 'replica')
+        self.assertEqual(self.router.db_for_write(Patient), 'default')
+        self.assertEqual(self.router.db_for_read(Patient), 'default')
+
+    def test_reads_outside_a_request_go_to_primary(self):
+        routers.close_request()
+        self.assertEqual(self.router.db_for_read(Patient), 'default')
+
+        def read(request):
+            return HttpResponse(self.router.db_for_read(Patient))
+
+        response = ReplicaStickinessMiddleware(read)(RequestFactory().get('/records/patients/'))
+        self.assertEqual(response.content, b'replica')
+        self.assertFalse(routers.in_request())
+        self.assertEqual(self.router.db_for_read(Patient), 'default')
+
+    def test_blacklist_is_always_read_from_primary(self):
+        self.assertEqual(self.router.db_for_read(BlacklistedToken), 'default')
+
+    @override_settings(READ_REPLICA_ALIAS=None)
+    def test_reads_stay_on_primary_without_replica(self):
+        self.assertEqual(self.router.db_for_read(Patient), 'default')
+
+    def test_migrations_only_run_on_primary(self):
+        self.assertTrue(self.router.allow_migrate('default', 'app'))
+        self.assertFalse(self.router.allow_migrate('replica', 'app'))
+
+    def test_write_sets_sticky_cookie_for_following_reads(self):
+        factory = RequestFactory()
+
+        def write(request):
+            self.router.db_for_write(Patient)
+            return HttpResponse()
+
+        def read(request):
+            return HttpResponse(self.router.db_for_read(Patient))
+
+        response = ReplicaStickinessMiddleware(write)(factory.post('/records/patients/'))
+        self.assertIn('ehr_primary', response.cookies)
+        self.assertFalse(routers.is_pinned())
+
+        response = ReplicaStickinessMiddleware(read)(factory.get('/records/patients/'))
+        self.assertEqual(response.content, b'replica')
+        self.assertNotIn('ehr_primary', response.cookies)
+
+        request = factory.get('/records/patients/')
+        request.COOKIES['ehr_primary'] = '1'
+        self.assertEqual(ReplicaStickinessMiddleware(read)(request).content, b'default')
+
+
+FLAKY_CALLS = []
+
+
+@tasks.task(name='tests.flaky', max_attempts=2)
+def flaky(fail_times):
+    FLAKY_CALLS.append(fail_times)
+    if len(FLAKY_CALLS) <= fail_times:
+        raise RuntimeError('SMTP timeout')
+
+
+@override_settings(TASK_RETRY_BACKOFF=30)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        FLAKY_CALLS.clear()
+
+    def test_email_is_sent_by_the_queue_not_the_caller(self):
+        tasks.send_email.delay(subject='OTP', message='123456', recipient_list=['nurse@example.com'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(tasks.drain(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ['nurse@example.com'])
+        self.assertEqual(Task.objects.get().status, 'DONE')
+
+    def test_failed_attempt_is_retried_after_backoff(self):
+        started = timezone.now()
+        tasks.enqueue('tests.flaky', fail_times=1)
+        with self.assertLogs('app.tasks', 'WARNING'):
+            self.assertEqual(tasks.drain(), (0, 1))
+        queued = Task.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ('PENDING', 1))
+        self.assertIn('SMTP timeout', queued.last_error)
+        self.assertGreaterEqual(queued.run_after, started + timedelta(seconds=30))
+        # still backing off
+        self.assertEqual(tasks.drain(), (0, 0))
+        self.assertEqual(tasks.drain(include_scheduled=True), (1, 0))
+        self.assertEqual(Task.objects.get().status, 'DONE')
+
+    def test_task_fails_for_good_after_max_attempts(self):
+        tasks.enqueue('tests.flaky', fail_times=5)
+        with self.assertLogs('app.tasks', 'WARNING') as logs:
+            tasks.drain()
+            tasks.drain(include_scheduled=True)
+        self.assertIn('failed for good', logs.output[-1])
+        queued = Task.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ('FAILED', 2))
+        self.assertEqual(len(FLAKY_CALLS), 2)
+
+    def test_task_abandoned_while_running_is_claimed_again(self):
+        queued = tasks.enqueue('tests.flaky', fail_times=0)
+        Task.objects.filter(pk=queued.pk).update(status='RUNNING', attempts=1,
+                                                 claimed_at=timezone.now() - timedelta(hours=1))
+        out = StringIO()
+        call_command('drain_tasks', stdout=out)
+        self.assertIn('Ran 1 tasks, 0 failed', out.getvalue())
+        self.assertEqual(Task.objects.get().attempts, 2)
+
+    def test_task_abandoned_on_its_last_attempt_is_failed(self):
+        queued = tasks.enqueue('tests.flaky', fail_times=0)
+        Task.objects.filter(pk=queued.pk).update(status='RUNNING', attempts=2,
+                                                 claimed_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('app.tasks', 'ERROR'):
+            self.assertEqual(tasks.drain(), (0, 0))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('FAILED', 2))
+        self.assertEqual(FLAKY_CALLS, [])
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_DIR=None, METRICS_TOKEN=None)
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user(role='HIM', is_staff=True))
+
+    def scrape(self, **extra):
+        response = self.client.get('/metrics', **extra)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_are_counted_by_view_method_status_and_role(self):
+        self.client.get('/records/patients/')
+        self.client.get('/records/patients/')
+        self.client.get('/records/casefolders/999/')
+        self.client.generic('PROPFIND', '/no-such-page/')
+        body = self.scrape()
+        self.assertIn('ehr_http_requests_total{method="GET",role="HIM",status="2xx",view="patient-list-create"} 2',
+                      body)
+        self.assertIn('ehr_http_requests_total{method="GET",role="HIM",status="4xx",view="casefolder-detail"} 1',
+                      body)
+        self.assertIn('ehr_http_requests_total{method="other",role="anonymous",status="4xx",view="unmatched"} 1',
+                      body)
+        self.assertIn('ehr_http_request_duration_seconds_count{method="GET",view="patient-list-create"} 2', body)
+        self.assertIn('ehr_http_request_duration_seconds_bucket{le="+Inf",method="GET",view="patient-list-create"} 2',
+                      body)
+        self.assertIn('# TYPE ehr_tasks gauge', body)
+
+    def test_counters_are_summed_across_process_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        labels = {'method': 'GET', 'role': 'HIM', 'status': '2xx', 'view': 'patient-list-create'}
+        series = 'ehr_http_requests_total{method="GET",role="HIM",status="2xx",view="patient-list-create"}'
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        for name in ('%d-live.json' % os.getppid(), '%d-dead.json' % exited.pid):
+            with open(os.path.join(directory, name), 'w') as handle:
+                json.dump({'counters': {metrics._key('ehr_http_requests_total', labels): 5}, 'histograms': {}},
+                          handle)
+        with self.settings(METRICS_DIR=directory):
+            self.client.get('/records/patients/')
+            self.assertIn(series + ' 11', self.scrape())
+            # the exited process was folded into the archive, and still counts
+            self.assertIn(series + ' 11', self.scrape())
+        self.assertEqual(sorted(name for name in os.listdir(directory) if name.endswith('.json')),
+                         sorted([metrics.ARCHIVE, '%d-live.json' % os.getppid(), metrics.registry.file_name()]))
+        self.assertTrue(metrics.registry.file_name().startswith('%d-' % os.getpid()))
+
+    def test_only_staff_may_scrape_without_a_token(self):
+        client = APIClient()
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        client.force_authenticate(make_user('clerk', role='HIM'))
+        self.assertEqual(client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_is_accepted_when_configured(self):
+        client = APIClient()
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE ehr_tasks gauge', response.content)
+
+
+class GenerateDataTests(TestCase):
+    def generate(self, **options):
+        out = StringIO()
+        call_command('generate_data', stdout=out, staff=2, seed=1, **options)
+        return out.getvalue()
+
+    def test_generates_consistent_records_for_every_role(self):
+        self.assertIn('Generated 40 patients', self.generate(patients=40, batch_size=15))
+        self.assertEqual(Patient.objects.count(), 40)
+        self.assertEqual(sorted(User.objects.values_list('role', flat=True)),
+                         sorted(role for role, _ in User.ROLE_CHOICES for _ in range(2)))
+        folders = CaseFolder.objects.count()
+        self.assertGreaterEqual(folders, 40)
+        self.assertEqual(CaseFolder.objects.values('folder_number').distinct().count(), folders)
+        self.assertEqual(MedicalHistory.objects.count(), folders)
+        for history in MedicalHistory.objects.all():
+            self.assertEqual(history.conditions, history.compute_conditions())
+        self.assertFalse(VitalSigns.objects.filter(systolic__isnull=True).exists())
+        self.assertGreater(VitalSigns.objects.values('recorded_at__date').distinct().count(), 1)
+
+        stored = sorted(ConditionAggregate.objects.values_list('condition', 'gender', 'age_band', 'count'))
+        self.assertTrue(stored)
+        aggregates.rebuild()
+        self.assertEqual(sorted(ConditionAggregate.objects.values_list('condition', 'gender', 'age_band', 'count')),
+                         stored)
+
+    def test_repeated_runs_add_patients_and_reuse_staff(self):
+        self.generate(patients=5)
+        self.generate(patients=5)
+        self.assertEqual(Patient.objects.count(), 10)
+        self.assertEqual(Patient.objects.values('matric_no').distinct().count(), 10)
+        self.assertEqual(User.objects.count(), 2 * len(User.ROLE_CHOICES))
+
+
+QUERY_BUDGETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_budgets.json')
+
+
+class QueryBudgetFixture:
+    """
+    `scale` patients, each with a case folder holding `scale` diagnoses, vital
+    signs and notes; bulk requests carry `scale` rows.  See benchmarks/scenarios.py.
+    """
+    password = 'password123'
+    run = 'q'
+
+    def __init__(self, scale, users):
+        self.batch = scale
+        self.users = users
+        self.now = timezone.now().isoformat()
+        him, doctor, nurse = users['HIM'], users['DOCTOR'], users['NURSE']
+        now = timezone.now()
+        folders = []
+        for n in range(scale):
+            patient = Patient.objects.create(
+                first_name='First%d' % n, last_name='Last%d' % n, dob=date(2000, 1, 1), gender='MF'[n % 2],
+                matric_no='QMAT%05d' % n, jamb_no='QJAMB%05d' % n, address='Hall', phone='0800000%04d' % n,
+                xray_no='QXR%05d' % n, religion='OTHER', state_of_origin='Oyo', Tribe='Yoruba', created_by=him,
+            )
+            folder = CaseFolder.objects.create(patient=patient, folder_number='QCF%05d' % n, created_by=him)
+            MedicalHistory.objects.create(case_folder=folder, diabetes=True, recorded_by=doctor)
+            for _ in range(scale):
+                DiagnosisAdmission.objects.create(case_folder=folder, date=now, diagnosis='Malaria',
+                                                  date_of_admission=now, recorded_by=doctor, created_by=doctor)
+                VitalSigns.objects.create(case_folder=folder, blood_pressure='120/80', pulse='72', weight='70',
+                                          height='175', urine_albumin='NIL', urine_sugar='NIL', recorded_by=nurse)
+                PatientNote.objects.create(case_folder=folder, surname='Last', other_names='First', date=now,
+                                           notes='Stable', user_type='NURSE', recorded_by=nurse)
+            folders.append(folder)
+        self.folder_ids = [folder.pk for folder in folders]
+        self.patient_ids = [folder.patient_id for folder in folders]
+        self.job_id = BundleExportJob.objects.create(status='DONE', patient_ids=[], created_by=him).pk
+
+    def folder(self, n):
+        return self.folder_ids[n % len(self.folder_ids)]
+
+    def patient(self, n):
+        return self.patient_ids[n % len(self.patient_ids)]
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every endpoint must issue the same number of queries whatever the number
+    of rows it reads or writes, and no more than its budget in
+    app/query_budgets.json.  Each scenario is measured against a small and a
+    large fixture after one warm-up request (which fills process-level caches
+    such as the folder number block); the case folder document cache is
+    cleared before measuring, so detail views are measured on a miss.
+
+    After an intended change, rewrite the budgets with
+
+        EHR_UPDATE_QUERY_BUDGETS=1 python manage.py test app.tests.QueryBudgetTests
+    """
+    SCALES = (2, 6)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {role: make_user('budget-%s' % role.lower(), role) for role, _ in User.ROLE_CHOICES}
+        cls.users['ADMIN'] = cls.users['METRICS'] = make_user('budget-admin', 'HIM', is_staff=True)
+
+    def request(self, scenario, fixture, n):
+        client = APIClient()
+        if scenario.role:
+            client.force_authenticate(self.users[scenario.role])
+        body = scenario.body(fixture, n) if scenario.body else None
+        kwargs = {'format': 'multipart' if scenario.multipart else 'json'} if body is not None else {}
+        response = getattr(client, scenario.method.lower())(scenario.path(fixture, n), body, **kwargs)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertIn(response.status_code, scenario.expect,
+                         '%s returned %d: %s' % (scenario.name, response.status_code, content[:500]))
+
+    def measure(self, scenario, scale):
+        with transaction.atomic():
+            numbering.reset()
+            fixture = QueryBudgetFixture(scale, self.users)
+            # run the warm-up's commit hooks, e.g. keeping the folder number block
+            with override_settings(TASK_RUNNER_THREADS=0), self.captureOnCommitCallbacks(execute=True):
+                self.request(scenario, fixture, 0)
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.request(scenario, fixture, 1)
+            transaction.set_rollback(True)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_every_route_has_a_scenario(self):
+        from app.urls import urlpatterns as app_patterns
+        from him.urls import urlpatterns as him_patterns
+        covered = {scenario.route for scenario in SCENARIOS}
+        routes = {pattern.name for pattern in list(him_patterns) + list(app_patterns) if pattern.name}
+        self.assertEqual(routes - covered, set())
+
+    def test_query_counts_are_flat_and_within_budget(self):
+        with open(QUERY_BUDGETS) as handle:
+            budgets = json.load(handle)
+        update = os.environ.get('EHR_UPDATE_QUERY_BUDGETS') == '1'
+        measured = {}
+        for scenario in SCENARIOS:
+            with self.subTest(scenario.name):
+                small, large = (self.measure(scenario, scale) for scale in self.SCALES)
+                measured[scenario.name] = len(large)
+                self.assertEqual(len(small), len(large), '%s issues %d queries at scale %d but %d at scale %d:\n%s' % (
+                    scenario.name, len(small), self.SCALES[0], len(large), self.SCALES[1], _numbered(large)))
+                if update:
+                    continue
+                budget = budgets.get(scenario.name)
+                self.assertIsNotNone(budget, '%s has no budget in %s' % (scenario.name, QUERY_BUDGETS))
+                self.assertLessEqual(len(large), budget, '%s issues %d queries, over its budget of %d:\n%s' % (
+                    scenario.name, len(large), budget, _numbered(large)))
+
+        if update:
+            with open(QUERY_BUDGETS, 'w') as handle:
+                json.dump(dict(sorted(measured.items())), handle, indent=2)
+                handle.write('\n')
+            return
+        self.assertEqual(set(budgets) - set(measured), set(), 'Budgets without a scenario')
+
+
+def _numbered(queries):
+    return '\n'.join('%3d. %s' % (n, sql) for n, sql in enumerate(queries, 1))
+
+
+class FastListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate(12, staff_per_role=1, seed=2)
+        cls.user = User.objects.get(username='synthetic-him-1')
+        cls.folder = CaseFolder.objects.annotate(readings=Count('vital_signs')).order_by('-readings').first()
+
+    def test_rendered_rows_match_the_serializer(self):
+        for serializer_class in (PatientSerializer, UserSerializer, MedicalHistorySerializer,
+                                 DiagnosisAdmissionSerializer, VitalSignsSerializer, PatientNoteSerializer):
+            with self.subTest(serializer_class.__name__):
+                queryset = serializer_class.Meta.model.objects.order_by('pk')
+                renderer = fastpath.compile_serializer(serializer_class())
+                expected = serializer_class(plan_queryset(queryset, serializer_class()), many=True).data
+                rendered = renderer.render(renderer.values(queryset))
+                self.assertTrue(rendered)
+                self.assertEqual(rendered, expected)
+                self.assertEqual([list(row) for row in rendered], [list(row) for row in expected])
+
+    def test_datetimes_follow_the_active_timezone(self):
+        queryset = VitalSigns.objects.order_by('pk')
+        renderer = fastpath.compile_serializer(VitalSignsSerializer())
+        with timezone.override('Africa/Lagos'):
+            rendered = renderer.render(renderer.values(queryset))
+            self.assertEqual(rendered, VitalSignsSerializer(queryset, many=True).data)
+        self.assertTrue(rendered[0]['recorded_at'].endswith('+01:00'))
+
+    def test_serializers_needing_instances_have_no_renderer(self):
+        self.assertIsNone(fastpath.compile_serializer(CaseFolderSerializer()))
+
+    def test_list_responses_are_identical_with_and_without_the_fast_path(self):
+        client = APIClient()
+        for path, role in (
+            ('/records/patients/?page_size=5', 'HIM'),
+            ('/records/casefolders/?page_size=5&fields=id,folder_number,patient.first_name,created_by', 'HIM'),
+            ('/records/casefolders/?page_size=5', 'HIM'),
+            ('/records/casefolders/%d/vitals/' % self.folder.pk, 'NURSE'),
+            ('/records/casefolders/%d/notes/' % self.folder.pk, 'NURSE'),
+            ('/records/casefolders/%d/diagnoses/' % self.folder.pk, 'DOCTOR'),
+            ('/records/casefolders/%d/medical-history/' % self.folder.pk, 'DOCTOR'),
+        ):
+            client.force_authenticate(User.objects.filter(role=role).first())
+            with self.subTest(path):
+                with self.settings(FAST_LISTS=False):
+                    expected = client.get(path)
+                response = client.get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+
+    def test_pages_follow_the_keyset_cursor(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        seen, url = [], '/records/patients/?page_size=5'
+        with self.assertNumQueries(1):
+            response = client.get(url)
+        while url:
+            response = client.get(url)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [str(pk) for pk in Patient.objects.order_by('-created_at', '-id')
+                                .values_list('pk', flat=True)])
@@ -0,0 +1,110 @@
+"""
+Chronological feed of a case folder's diagnoses, vital signs and notes.
+
+Each record type is read as its own stream, newest first, from an index on
+(case_folder, timestamp, id).  A page fetches at most `page_size + 1` rows
+from every stream and lazily k-way merges them, so the cost of a page does
+not depend on how much history the folder has.  Entries are totally ordered
+by (timestamp, stream rank, id), which is what the cursor encodes along with
+the direction: a `previous` cursor reads the streams oldest first from its
+position and reverses the page.
+"""
+import heapq
+from base64 import b64decode, b64encode
+from itertools import islice
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import DiagnosisAdmission, PatientNote, VitalSigns
+from .prefetch import plan_queryset
+from .serializers import DiagnosisAdmissionSerializer, PatientNoteSerializer, VitalSignsSerializer
+
+
+class TimelineStream:
+    def __init__(self, kind, model, timestamp, serializer_class):
+        self.kind = kind
+        self.model = model
+        self.timestamp = timestamp
+        self.serializer_class = serializer_class
+
+
+STREAMS = (
+    TimelineStream('diagnosis', DiagnosisAdmission, 'created_at', DiagnosisAdmissionSerializer),
+    TimelineStream('vital_signs', VitalSigns, 'recorded_at', VitalSignsSerializer),
+    TimelineStream('note', PatientNote, 'created_at', PatientNoteSerializer),
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(position, reverse=False):
+    timestamp, rank, pk = position
+    value = '%s|%d|%d|%d' % (timestamp.isoformat(), rank, pk, reverse)
+    return b64encode(value.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(value):
+    """Return `(position, reverse)` from a cursor."""
+    try:
+        timestamp, rank, pk, reverse = b64decode(value.encode('ascii')).decode('ascii').split('|')
+        position = (parse_datetime(timestamp), int(rank), int(pk))
+    except (ValueError, UnicodeError):
+        raise InvalidCursor(value)
+    if position[0] is None or not 0 <= position[1] < len(STREAMS) or reverse not in ('0', '1'):
+        raise InvalidCursor(value)
+    return position, reverse == '1'
+
+
+def _seek(stream, rank, position, reverse):
+    """Rows of `stream` that sort strictly after `position` in the feed (before it when `reverse`)."""
+    timestamp, cursor_rank, pk = position
+    field = stream.timestamp
+    beyond = 'gt' if reverse else 'lt'
+    if rank < cursor_rank:
+        lookup = 'gt' if reverse else 'lte'
+    elif rank > cursor_rank:
+        lookup = 'gte' if reverse else 'lt'
+    else:
+        return Q(**{'%s__%s' % (field, beyond): timestamp}) | Q(**{field: timestamp, 'pk__' + beyond: pk})
+    return Q(**{'%s__%s' % (field, lookup): timestamp})
+
+
+def _entries(stream, rank, folder_id, position, limit, reverse):
+    queryset = stream.model.objects.filter(case_folder_id=folder_id)
+    if position is not None:
+        queryset = queryset.filter(_seek(stream, rank, position, reverse))
+    direction = '' if reverse else '-'
+    queryset = queryset.order_by(direction + stream.timestamp, direction + 'pk')
+    queryset = plan_queryset(queryset, stream.serializer_class())
+    for instance in queryset[:limit]:
+        yield (getattr(instance, stream.timestamp), rank, instance.pk), instance
+
+
+def timeline_page(folder_id, position=None, page_size=50, reverse=False):
+    """
+    Return `(entries, next_cursor, previous_cursor)` for one page of the
+    folder's timeline; `reverse` reads the page before `position`.
+
+    Entries are `{'type', 'timestamp', 'data'}` dicts, newest first.
+    """
+    streams = [_entries(stream, rank, folder_id, position, page_size + 1, reverse)
+               for rank, stream in enumerate(STREAMS)]
+    merged = list(islice(heapq.merge(*streams, key=lambda entry: entry[0], reverse=not reverse), page_size + 1))
+    page, more = merged[:page_size], len(merged) > page_size
+    if reverse:
+        page.reverse()
+        has_next, has_previous = position is not None, more
+    else:
+        has_next, has_previous = more, position is not None
+
+    results = []
+    for (timestamp, rank, pk), instance in page:
+        stream = STREAMS[rank]
+        data = stream.serializer_class(instance).data
+        results.append({'type': stream.kind, 'timestamp': data[stream.timestamp], 'data': data})
+    next_cursor = encode_cursor(page[-1][0]) if has_next and page else None
+    previous_cursor = encode_cursor(page[0][0], reverse=True) if has_previous and page else None
+    return results, next_cursor, previous_cursor
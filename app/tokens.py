@@ -0,0 +1,28 @@
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .blacklist import blacklist_index
+
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Refresh token that carries the user's role and approval flag as claims.
+
+    Access tokens minted from it (at login or via /api/token/refresh/) copy
+    these claims, so a request's role is known from the token alone.  The
+    blacklist check consults the in-memory `blacklist_index` rather than
+    querying BlacklistedToken, so a blacklisting made by another process is
+    seen after at most BLACKLIST_INDEX_SYNC_INTERVAL seconds.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role'] = user.role
+        token['is_authorized'] = user.is_authorized
+        return token
+
+    def check_blacklist(self):
+        if blacklist_index.is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError('Token is blacklisted')
@@ -15,6 +15,7 @@ urlpatterns = [
     path('login/', views.LoginAPIView.as_view(), name='login'),
     path('logout/', views.LogoutAPIView.as_view(), name='logout'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('metrics', views.metrics_view, name='metrics'),
     #password reset
 #     path('reset-password-email/', PasswordResetOTPEmailView.as_view(), name='reset-password-email'),
 #     path('reset-password-confirmation/', PasswordResetConfirmationView.as_view(), name='reset-passsword-confirmation'),
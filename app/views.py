@@ -1,7 +1,7 @@
 from django.shortcuts import render
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import AllowAny
 from django.contrib.auth import authenticate
@@ -9,8 +9,9 @@ from django.shortcuts import get_object_or_404
 from app.models import User, Patient, CaseFolder, MedicalHistory, DiagnosisAdmission, VitalSigns, PatientNote
 from app.serializers import *
 from app.permissions import IsHIMRole, IsNurseRole, IsDoctorRole, IsHIMOrDoctorRole, IsNurseOrDoctorRole, IsHIMNurseOrDoctorRole
+from app.permissions import IsMetricsScraper
+from app.authentication import CachedJWTAuthentication, MetricsTokenAuthentication
 
-from django.core.mail import send_mail
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
@@ -18,7 +19,8 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib import messages
 from django.shortcuts import redirect
 from django.views.generic import DetailView
-from django.http import Http404
+from django.http import Http404, HttpResponse
+from app import metrics
 
 
 
@@ -40,24 +42,21 @@ class LoginAPIView(generics.GenericAPIView):
     serializer_class = LoginSerializer
 
     def post(self, request):
-        serializer = self.serializer_class(data=request.data)
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        user = User.objects.get(username=serializer.validated_data['username'])
+        # validate() has already resolved the user and rejected unapproved accounts
+        user = serializer.user
 
-        if user.is_authorized:
-            response_data = serializer.validated_data
-            response_data['detail'] = "Logged in successfully."
-            refresh = RefreshToken.for_user(user)
-            user.refresh_token = str(refresh)
-            user.save()
+        response_data = serializer.validated_data
+        response_data['detail'] = "Logged in successfully."
+        user.refresh_token = response_data['tokens']['refresh']
+        user.save(update_fields=['refresh_token'])
 
-            response = Response(response_data, status=status.HTTP_200_OK)
-            # response.set_cookie('login_status', 'success', secure=True, samesite='None')
-            response.set_cookie('refreshToken', user.refresh_token, secure=True, samesite='None')
+        response = Response(response_data, status=status.HTTP_200_OK)
+        # response.set_cookie('login_status', 'success', secure=True, samesite='None')
+        response.set_cookie('refreshToken', user.refresh_token, secure=True, samesite='None')
 
-            return response
-        else:
-            return Response({"detail": "Your account has not been approved by an admin yet."}, status=status.HTTP_200_OK)
+        return response
 
 
 
@@ -91,6 +90,13 @@ class TokenLoginView(APIView):
         else:
             return Response({'detail': "Invalid token."}, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET'])
+@authentication_classes([MetricsTokenAuthentication, CachedJWTAuthentication])
+@permission_classes([IsMetricsScraper])
+def metrics_view(request):
+    """Prometheus scrape endpoint - staff, or `Authorization: Bearer <METRICS_TOKEN>` when one is set"""
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # class PasswordResetOTPEmailView(generics.CreateAPIView):
 #     serializer_class = PasswordResetSerializer
 
@@ -115,7 +121,9 @@ class TokenLoginView(APIView):
 #         from_email = 'webmaster@example.com'
 #         recipient_list = [email]
 
-#         send_mail(subject, message, from_email, recipient_list)
+#         # queued so SMTP latency never holds up the request (see app/tasks.py)
+#         from app.tasks import send_email
+#         send_email.delay(subject=subject, message=message, from_email=from_email, recipient_list=recipient_list)
 
 #         return Response({'message': 'Password reset OTP and confirmation link sent successfully.'}, status=status.HTTP_200_OK)
 
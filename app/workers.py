@@ -0,0 +1,23 @@
+"""
+Start-up for worker processes spawned by app/bundles.py.
+
+Spawned workers begin as fresh interpreters rather than forks of a process
+that may hold locks and open connections in other threads, so they set
+Django up themselves.  Their initializer is unpickled before the app
+registry is ready, which is why this module imports no models.
+"""
+import django
+from django.conf import settings
+from django.db import connections
+
+
+def database_names():
+    """The database file of each alias in this process, for `setup()` in a worker."""
+    return {alias: connections[alias].settings_dict['NAME'] for alias in connections}
+
+
+def setup(names):
+    """Set Django up in a spawned worker, on the same database files as its parent."""
+    for alias, name in names.items():
+        settings.DATABASES[alias]['NAME'] = name
+    django.setup()
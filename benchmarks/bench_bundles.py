@@ -0,0 +1,54 @@
+"""
+Per-patient bundle export throughput against the number of worker processes.
+
+Migrates and seeds a temporary SQLite file (worker processes need a database
+they can open themselves), then exports every patient once per entry of
+--workers into a fresh directory and reports bundles/s and the speedup over
+one worker.
+
+    python -m benchmarks.bench_bundles --patients 5000 --workers 1,2,4
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--shard-size', type=int, default=50)
+    args = parser.parse_args()
+
+    from benchmarks.common import Timer, make_user, seed_records, setup
+    setup(test_database=False)
+    from django.core.management import call_command
+    from django.db import connections
+    from app import bundles
+    from app.models import Patient
+
+    directory = tempfile.mkdtemp(prefix='ehr-bench-')
+    try:
+        connections.databases['default']['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        call_command('migrate', verbosity=0)
+        seed_records(make_user('bench-him', 'HIM'), 0, args.patients)
+        patient_ids = list(Patient.objects.order_by('pk').values_list('pk', flat=True))
+        print('%d patients, %d CPUs' % (len(patient_ids), os.cpu_count()))
+
+        baseline = None
+        for workers in (int(value) for value in args.workers.split(',')):
+            output = os.path.join(directory, 'bundles-%d' % workers)
+            with Timer() as timer:
+                totals = bundles.export_bundles(patient_ids, output, workers=workers, shard_size=args.shard_size)
+            rate = totals['written'] / timer.elapsed
+            baseline = baseline or rate
+            print('%2d workers: %d bundles in %.2fs, %.0f bundles/s, %.2fx' % (
+                workers, totals['written'], timer.elapsed, rate, rate / baseline,
+            ))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
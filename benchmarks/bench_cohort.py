@@ -0,0 +1,58 @@
+"""
+Cohort counts: one predicate per boolean column versus the packed bitmask.
+
+    python -m benchmarks.bench_cohort --population 100000
+"""
+import argparse
+import random
+
+from benchmarks.common import Timer, make_folders, make_user, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--population', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    from django.db.models import F
+    from app.models import MedicalHistory
+
+    rng = random.Random(42)
+    doctor = make_user('doctor', 'DOCTOR')
+    histories = []
+    for folder in make_folders(doctor, args.population):
+        history = MedicalHistory(case_folder=folder, recorded_by=doctor,
+                                 **{name: rng.random() < 0.15 for name in MedicalHistory.CONDITIONS})
+        history.conditions = history.compute_conditions()
+        histories.append(history)
+    MedicalHistory.objects.bulk_create(histories, batch_size=5000)
+
+    include = MedicalHistory.condition_mask(['diabetes', 'kidney_disease'])
+    exclude = MedicalHistory.condition_mask(['hypertension'])
+
+    def by_columns():
+        return MedicalHistory.objects.filter(diabetes=True, kidney_disease=True, hypertension=False).count()
+
+    def by_mask():
+        return (MedicalHistory.objects
+                .annotate(included=F('conditions').bitand(include), excluded=F('conditions').bitand(exclude))
+                .filter(included=include, excluded=0).count())
+
+    assert by_columns() == by_mask()
+    with Timer() as columns:
+        for _ in range(args.repeat):
+            by_columns()
+    with Timer() as mask:
+        for _ in range(args.repeat):
+            by_mask()
+
+    print('population: %d, cohort size: %d' % (args.population, by_mask()))
+    print('boolean columns: %7.2f ms/query' % (columns.elapsed / args.repeat * 1000))
+    print('bitmask:         %7.2f ms/query' % (mask.elapsed / args.repeat * 1000))
+    print('speedup:         %7.2fx' % (columns.elapsed / mask.elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Latency and throughput of every API endpoint under concurrent clients.
+
+Unless --database names an existing SQLite file (for instance one filled by
+`manage.py generate_data`), a temporary database is migrated and filled
+with --patients synthetic patients first.  Each scenario then sends
+--requests requests from --clients threads, each with its own test client
+and a JWT for the scenario's role, and the run is written as JSON to
+--output: per scenario the status codes, throughput and latency percentiles,
+plus the data volumes and settings it ran with.  --compare prints the change
+from an earlier report.  Scenarios that write add rows, so do not point
+--database at data you want to keep.
+
+    python -m benchmarks.bench_endpoints --patients 5000 --output before.json
+    python -m benchmarks.bench_endpoints --patients 5000 --output after.json --compare before.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from benchmarks.common import ROOT
+from benchmarks.scenarios import SCENARIOS
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Fixture:
+    """Users, tokens and sample ids shared by every scenario of a run."""
+    def __init__(self, seed):
+        from django.conf import settings
+        from django.utils import timezone
+        from app.models import BundleExportJob, CaseFolder, Patient
+        from app.synthetic import PASSWORD, create_staff
+        from app.tokens import RoleRefreshToken
+
+        rng = random.Random(seed)
+        staff = create_staff(1, rng, prefix='bench')
+        self.users = {role: users[0] for role, users in staff.items()}
+        admin = self.users['ADMIN'] = staff['HIM'][0]
+        admin.is_staff = True
+        admin.save(update_fields=['is_staff'])
+        self.password = PASSWORD
+        self.tokens = {role: 'Bearer %s' % RoleRefreshToken.for_user(user).access_token
+                       for role, user in self.users.items()}
+        # without METRICS_TOKEN /metrics is staff only
+        self.tokens['METRICS'] = ('Bearer %s' % settings.METRICS_TOKEN if settings.METRICS_TOKEN
+                                  else self.tokens['ADMIN'])
+        self.folder_ids = list(CaseFolder.objects.order_by('?').values_list('pk', flat=True)[:1000])
+        self.patient_ids = list(Patient.objects.order_by('?').values_list('pk', flat=True)[:1000])
+        if not self.folder_ids:
+            raise SystemExit('The database has no case folders; run manage.py generate_data first.')
+        self.job_id = BundleExportJob.objects.create(status='DONE', patient_ids=[], created_by=admin).pk
+        self.now = timezone.now().isoformat()
+        self.run = uuid.uuid4().hex[:4]
+        self.batch = 50
+
+    def folder(self, n):
+        return self.folder_ids[n % len(self.folder_ids)]
+
+    def patient(self, n):
+        return self.patient_ids[n % len(self.patient_ids)]
+
+
+def run_scenario(scenario, fixture, clients, requests):
+    from django.db import connections
+    from rest_framework.test import APIClient
+
+    counter = itertools.count()
+    latencies, statuses, errors = [], {}, []
+    lock = threading.Lock()
+
+    def worker():
+        client = APIClient()
+        token = fixture.tokens.get(scenario.role)
+        if token:
+            client.credentials(HTTP_AUTHORIZATION=token)
+        mine, codes, failures = [], {}, []
+        try:
+            while True:
+                n = next(counter)
+                if n >= requests:
+                    break
+                path = scenario.path(fixture, n)
+                body = scenario.body(fixture, n) if scenario.body else None
+                kwargs = {'format': 'multipart' if scenario.multipart else 'json'} if body is not None else {}
+                started = time.perf_counter()
+                try:
+                    response = getattr(client, scenario.method.lower())(path, body, **kwargs)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                except Exception as exc:
+                    failures.append(repr(exc))
+                    continue
+                mine.append(time.perf_counter() - started)
+                codes[response.status_code] = codes.get(response.status_code, 0) + 1
+                if response.status_code not in scenario.expect:
+                    failures.append('%d %s' % (response.status_code, response.content[:200].decode('utf-8', 'replace')))
+        finally:
+            connections.close_all()
+        with lock:
+            latencies.extend(mine)
+            errors.extend(failures)
+            for code, count in codes.items():
+                statuses[str(code)] = statuses.get(str(code), 0) + count
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'route': scenario.route,
+        'method': scenario.method,
+        'role': scenario.role,
+        'requests': requests,
+        'errors': len(errors),
+        'sample_errors': errors[:3],
+        'statuses': statuses,
+        'seconds': round(elapsed, 4),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 0.5) * 1000, 3),
+            'p90': round(percentile(latencies, 0.9) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'max': round(max(latencies) * 1000, 3) if latencies else 0.0,
+        },
+    }
+
+
+def uncovered_routes():
+    """Named routes in him/urls.py and app/urls.py without a scenario."""
+    from app.urls import urlpatterns as app_patterns
+    from him.urls import urlpatterns as him_patterns
+    covered = {scenario.route for scenario in SCENARIOS}
+    return sorted(pattern.name for pattern in list(him_patterns) + list(app_patterns)
+                  if pattern.name and pattern.name not in covered)
+
+
+def volumes():
+    from app.models import CaseFolder, DiagnosisAdmission, Patient, PatientNote, User, VitalSigns
+    return {model._meta.model_name: model.objects.count()
+            for model in (User, Patient, CaseFolder, DiagnosisAdmission, VitalSigns, PatientNote)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    print()
+    print('%-28s %-26s %-26s %s' % ('vs ' + os.path.basename(baseline['path']), 'p50 ms', 'p95 ms', 'req/s'))
+    for name, result in report['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        cells = []
+        for old, new in ((before['latency_ms']['p50'], result['latency_ms']['p50']),
+                         (before['latency_ms']['p95'], result['latency_ms']['p95']),
+                         (before['throughput'], result['throughput'])):
+            change = '%+6.1f%%' % ((new / old - 1) * 100) if old else '    n/a'
+            cells.append('%7.1f -> %7.1f %s' % (old, new, change))
+        print('%-28s %s' % (name, ' '.join(cells)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='Existing SQLite database to run against instead of a fresh one.')
+    parser.add_argument('--patients', type=int, default=2000, help='Synthetic patients for a fresh database.')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent client threads.')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario (scaled by its share).')
+    parser.add_argument('--only', help='Comma separated scenario name prefixes to run.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench-endpoints-%s.json' % datetime.now().strftime('%Y%m%d-%H%M%S'))
+    parser.add_argument('--compare', help='Earlier report to print the change against.')
+    args = parser.parse_args()
+
+    from benchmarks.common import setup
+    setup(test_database=False)
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connections
+    from app.synthetic import generate
+
+    # Expected 4xx responses would otherwise log a warning per request
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    directory = None
+    connections.close_all()
+    if args.database:
+        connections.databases['default']['NAME'] = os.path.abspath(args.database)
+    else:
+        directory = tempfile.mkdtemp(prefix='ehr-bench-')
+        connections.databases['default']['NAME'] = os.path.join(directory, 'endpoints.sqlite3')
+    try:
+        call_command('migrate', verbosity=0)
+        if directory:
+            totals = generate(args.patients, seed=args.seed)
+            print('Generated %(patients)d patients and %(vital_signs)d vital signs in %(seconds).1fs' % totals)
+        fixture = Fixture(args.seed)
+        connections.close_all()
+
+        prefixes = [prefix.strip() for prefix in args.only.split(',')] if args.only else None
+        report = {
+            'meta': {
+                'started_at': datetime.now().astimezone().isoformat(),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'cpus': os.cpu_count(),
+                'database': settings.DATABASES['default']['ENGINE'],
+                'clients': args.clients,
+                'requests': args.requests,
+                'seed': args.seed,
+                'settings': dict(
+                    {name: getattr(settings, name, None) for name in (
+                        'PROFILING_ENABLED', 'METRICS_ENABLED', 'SQLITE_PRAGMAS', 'CASEFOLDER_CACHE_TIMEOUT',
+                        'EXPORT_CHUNK_SIZE',
+                    )},
+                    CONN_MAX_AGE=settings.DATABASES['default'].get('CONN_MAX_AGE'),
+                ),
+                'volumes': volumes(),
+            },
+            'uncovered_routes': uncovered_routes(),
+            'scenarios': {},
+        }
+        print('%-28s %6s %6s %8s %9s %9s %9s' % ('scenario', 'reqs', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for scenario in SCENARIOS:
+            if scenario.share is None:
+                continue
+            if prefixes and not any(scenario.name.startswith(prefix) for prefix in prefixes):
+                continue
+            requests = max(args.clients, int(round(args.requests * scenario.share)))
+            result = report['scenarios'][scenario.name] = run_scenario(scenario, fixture, args.clients, requests)
+            print('%-28s %6d %6d %8.1f %9.2f %9.2f %9.2f' % (
+                scenario.name, result['requests'], result['errors'], result['throughput'],
+                result['latency_ms']['p50'], result['latency_ms']['p95'], result['latency_ms']['p99'],
+            ))
+            for error in result['sample_errors']:
+                print('    %s' % error)
+        report['meta']['finished_at'] = datetime.now().astimezone().isoformat()
+    finally:
+        connections.close_all()
+        if directory:
+            shutil.rmtree(directory)
+
+    if report['uncovered_routes']:
+        print('No scenario for: %s' % ', '.join(report['uncovered_routes']))
+    with open(args.output, 'w') as stream:
+        json.dump(report, stream, indent=2, default=str)
+    print('Wrote %s' % args.output)
+
+    if args.compare:
+        with open(args.compare) as stream:
+            baseline = dict(json.load(stream), path=args.compare)
+        compare(report, baseline)
+
+
+if __name__ == '__main__':
+    main()
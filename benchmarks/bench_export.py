@@ -0,0 +1,65 @@
+"""
+Peak memory of the streaming case folder export.
+
+Seeds case folders (each with a patient, a medical history and a vital signs
+reading) up to each of --sizes and streams the NDJSON export, recording the
+Python heap peak (tracemalloc) and the process peak RSS.  For comparison the
+same rows are also serialized the way the unpaginated list endpoint does it,
+as one list, up to --materialize-limit rows.
+
+    python -m benchmarks.bench_export --sizes 1000,5000,20000
+"""
+import argparse
+import resource
+import tracemalloc
+
+
+def measure(fn):
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,5000,20000')
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--materialize-limit', type=int, default=20000)
+    args = parser.parse_args()
+
+    from benchmarks.common import Timer, make_user, seed_records, setup
+    setup()
+    from app import export
+    from app.models import CaseFolder
+    from app.prefetch import plan_queryset
+    from app.serializers import CaseFolderSerializer
+
+    user = make_user('bench-him', 'HIM')
+    seeded = 0
+    for size in (int(value) for value in args.sizes.split(',')):
+        seed_records(user, seeded, size)
+        seeded = size
+
+        def stream():
+            return sum(len(part) for part in export.stream('ndjson', CaseFolder.objects.all(), CaseFolderSerializer(),
+                                                           chunk_size=args.chunk_size))
+
+        with Timer() as timer:
+            written, peak = measure(stream)
+        print('%7d folders: streamed %.1f MB in %.2fs, heap peak %.1f MB, process peak RSS %.0f MB' % (
+            size, written / 1024 / 1024, timer.elapsed, peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        ))
+
+        if size <= args.materialize_limit:
+            def materialize():
+                serializer = CaseFolderSerializer()
+                return len(CaseFolderSerializer(plan_queryset(CaseFolder.objects.all(), serializer), many=True).data)
+
+            _, peak = measure(materialize)
+            print('%7d folders: materialized list, heap peak %.1f MB' % (size, peak))
+
+
+if __name__ == '__main__':
+    main()
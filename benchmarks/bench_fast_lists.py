@@ -0,0 +1,72 @@
+"""
+List rendering: DRF serializers over model instances versus app.fastpath.
+
+Generates about --rows patients, vital signs and notes, then renders each
+table both ways, with the query included, and reports milliseconds per 10k
+rows.  It also times full 200-row pages of the patient and vital signs list
+endpoints with FAST_LISTS off and on.
+
+    python -m benchmarks.bench_fast_lists --rows 10000
+"""
+import argparse
+
+
+def best(fn, repeat):
+    from benchmarks.common import Timer
+    times = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            fn()
+        times.append(timer.elapsed)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    from benchmarks.common import Timer, setup
+    setup()
+    from django.db.models import Count
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from app import fastpath
+    from app.models import CaseFolder, User
+    from app.prefetch import plan_queryset
+    from app.serializers import PatientNoteSerializer, PatientSerializer, VitalSignsSerializer
+    from app.synthetic import generate
+
+    with Timer() as timer:
+        generate(args.rows, folders_per_patient=1, diagnoses_per_folder=0, vitals_per_folder=1, notes_per_folder=1,
+                 staff_per_role=1)
+    print('generated in %.1fs' % timer.elapsed)
+
+    print('%-22s %7s %12s %12s %8s' % ('serializer', 'rows', 'drf ms/10k', 'fast ms/10k', 'speedup'))
+    for serializer_class in (PatientSerializer, VitalSignsSerializer, PatientNoteSerializer):
+        queryset = serializer_class.Meta.model.objects.all()
+        renderer = fastpath.compile_serializer(serializer_class())
+        rows = queryset.count()
+        slow = best(lambda: serializer_class(plan_queryset(queryset, serializer_class()), many=True).data, args.repeat)
+        fast = best(lambda: renderer.render(renderer.values(queryset)), args.repeat)
+        print('%-22s %7d %12.1f %12.1f %7.1fx' % (
+            serializer_class.__name__, rows, slow / rows * 1e7, fast / rows * 1e7, slow / fast))
+
+    folder = CaseFolder.objects.annotate(readings=Count('vital_signs')).order_by('-readings').first()
+    for path, role in (('/records/patients/?page_size=200', 'HIM'),
+                       ('/records/casefolders/%d/vitals/' % folder.pk, 'NURSE')):
+        client = APIClient()
+        client.force_authenticate(User.objects.filter(role=role).first())
+        rates = {}
+        for enabled in (False, True):
+            with override_settings(FAST_LISTS=enabled):
+                client.get(path)
+                elapsed = best(lambda: [client.get(path) for _ in range(args.requests)], args.repeat)
+            rates[enabled] = args.requests / elapsed
+        print('%s: %.0f req/s -> %.0f req/s (%.1fx)' % (path, rates[False], rates[True], rates[True] / rates[False]))
+
+
+if __name__ == '__main__':
+    main()
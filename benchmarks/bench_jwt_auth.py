@@ -0,0 +1,50 @@
+"""
+Database round trips saved by the cached JWT user resolution.
+
+Sends bearer-token GETs to a light read endpoint with the user cache
+disabled (every request loads the user) and enabled.
+
+    python -m benchmarks.bench_jwt_auth --requests 500 --users 20
+"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--users', type=int, default=20)
+    args = parser.parse_args()
+
+    from benchmarks.common import Timer, make_user, setup
+    setup()
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+    from app.authentication import user_cache
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    tokens = [make_user('clerk%d' % n, 'HIM').tokens()['access'] for n in range(args.users)]
+    client = APIClient()
+
+    def run():
+        user_cache.clear()
+        with CaptureQueriesContext(connection) as queries, Timer() as timer:
+            for n in range(args.requests):
+                client.credentials(HTTP_AUTHORIZATION='Bearer ' + tokens[n % len(tokens)])
+                assert client.get('/records/reports/admissions/').status_code == 200
+        return len(queries), timer.elapsed
+
+    settings.JWT_USER_CACHE_SIZE = 0
+    uncached_queries, uncached_time = run()
+    settings.JWT_USER_CACHE_SIZE = 1024
+    cached_queries, cached_time = run()
+
+    print('%d requests from %d users' % (args.requests, args.users))
+    print('uncached: %5d queries, %7.1f req/s' % (uncached_queries, args.requests / uncached_time))
+    print('cached:   %5d queries, %7.1f req/s' % (cached_queries, args.requests / cached_time))
+    print('user lookups saved: %d' % (uncached_queries - cached_queries))
+
+
+if __name__ == '__main__':
+    main()
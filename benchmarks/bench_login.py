@@ -0,0 +1,44 @@
+"""
+Login throughput through POST /login/.
+
+Password hashing (PBKDF2) dominates a real login; --fast-hasher switches to
+MD5 so the rest of the login path (queries, token minting) is what is timed.
+
+    python -m benchmarks.bench_login --logins 200 --fast-hasher
+"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--fast-hasher', action='store_true')
+    args = parser.parse_args()
+
+    from benchmarks.common import Timer, make_user, setup
+    setup()
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    if args.fast_hasher:
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    for n in range(args.users):
+        make_user('staff%d' % n, 'NURSE')
+
+    client = APIClient()
+    with CaptureQueriesContext(connection) as queries, Timer() as timer:
+        for n in range(args.logins):
+            response = client.post('/login/', {'username': 'staff%d' % (n % args.users), 'password': 'password123'},
+                                   format='json')
+            assert response.status_code == 200, response.data
+
+    print('hasher: %s' % settings.PASSWORD_HASHERS[0].rsplit('.', 1)[-1])
+    print('logins/s:      %8.1f' % (args.logins / timer.elapsed))
+    print('queries/login: %8.1f' % (len(queries) / args.logins))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Cost of the Prometheus request metrics.
+
+Times `app.metrics.record_request` on its own (the work MetricsMiddleware
+adds to every request), then serves --requests GETs of a small patient page
+with the middleware off and on, alternating rounds, and finally times one
+/metrics scrape.
+
+    python -m benchmarks.bench_metrics --requests 500
+"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    from benchmarks.common import Timer, make_user, seed_records, setup
+    setup()
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from app import metrics
+
+    calls = 100000
+    with Timer() as timer:
+        for n in range(calls):
+            metrics.record_request('patient-list-create', 'GET', 200, 'HIM', 0.012, 2, 0.001)
+    print('record_request: %.2f us per request' % (timer.elapsed / calls * 1e6))
+
+    user = make_user('bench-him', 'HIM')
+    seed_records(user, 0, 50)
+    elapsed = {False: 0.0, True: 0.0}
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            with override_settings(METRICS_ENABLED=enabled):
+                client = APIClient()
+                client.force_authenticate(user)
+                client.get('/records/patients/?page_size=5')
+                with Timer() as timer:
+                    for _ in range(args.requests):
+                        client.get('/records/patients/?page_size=5')
+            elapsed[enabled] += timer.elapsed
+    total = args.requests * args.rounds
+    off, on = total / elapsed[False], total / elapsed[True]
+    print('metrics off: %.0f req/s' % off)
+    print('metrics on:  %.0f req/s (%.1f%% overhead)' % (on, (off / on - 1) * 100))
+
+    with Timer() as timer:
+        body = client.get('/metrics').content
+    print('scrape: %d series lines in %.1f ms' % (body.count(b'\n'), timer.elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
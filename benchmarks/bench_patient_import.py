@@ -0,0 +1,77 @@
+"""
+Bulk patient import throughput.
+
+Writes a --rows row CSV intake (1% invalid, 1% duplicate matric numbers) to a
+temporary file, imports it with `app.patient_import`, and reports rows/s and
+peak resident memory.  For comparison, --baseline rows are first created one
+serializer.save() at a time, which is what one POST per patient costs before
+HTTP overhead.
+
+    python -m benchmarks.bench_patient_import --rows 50000
+"""
+import argparse
+import csv
+import os
+import resource
+import tempfile
+from types import SimpleNamespace
+
+FIELDS = ('first_name', 'last_name', 'dob', 'gender', 'matric_no', 'jamb_no', 'address', 'phone', 'email',
+          'xray_no', 'religion', 'state_of_origin', 'tribe')
+
+
+def make_row(n):
+    return {
+        'first_name': 'First%d' % n, 'last_name': 'Last%d' % n, 'dob': '2005-01-01',
+        'gender': 'X' if n % 100 == 7 else 'MF'[n % 2],
+        'matric_no': 'IM%07d' % (n - 1 if n % 100 == 50 else n), 'jamb_no': 'IJ%07d' % n,
+        'address': 'Hall %d' % (n % 40), 'phone': '081%08d' % n, 'email': '', 'xray_no': 'IX%07d' % n,
+        'religion': 'OTHER', 'state_of_origin': 'Oyo', 'tribe': 'Yoruba',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--baseline', type=int, default=1000)
+    args = parser.parse_args()
+
+    from benchmarks.common import Timer, make_user, setup
+    setup()
+    from app.patient_import import import_patients, iter_rows
+    from app.serializers import PatientSerializer
+
+    user = make_user('bench-him', 'HIM')
+    with Timer() as baseline:
+        for n in range(args.baseline):
+            row = make_row(n)
+            row.update(matric_no='BM%07d' % n, jamb_no='BJ%07d' % n, gender='M')
+            serializer = PatientSerializer(data=row, context={'request': SimpleNamespace(user=user)})
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+    print('one at a time: %d rows in %.2fs, %.0f rows/s' % (args.baseline, baseline.elapsed,
+                                                           args.baseline / baseline.elapsed))
+
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(handle, 'w', newline='') as out:
+            writer = csv.DictWriter(out, FIELDS)
+            writer.writeheader()
+            for n in range(args.rows):
+                writer.writerow(make_row(n))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        with open(path, 'rb') as stream:
+            totals = import_patients(iter_rows(stream, 'csv'), user, batch_size=args.batch_size)
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    finally:
+        os.remove(path)
+
+    print('streamed import: %(rows)d rows, %(created)d created, %(rejected)d rejected in %(seconds).2fs' % totals)
+    print('  %.0f rows/s, peak RSS %.1f MB (+%.1f MB during import)' % (
+        totals['rows'] / totals['seconds'], rss_after / 1024, (rss_after - rss_before) / 1024,
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Overhead of ProfilingMiddleware on a case folder list.
+
+Serves --requests GETs of /records/casefolders/ (--page-size folders a page, with
+patients, histories and children) with profiling off and on, alternating
+rounds to even out noise, and reports requests per second for each.
+
+    python -m benchmarks.bench_profiling --requests 300
+"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    from benchmarks.common import Timer, make_user, seed_records, setup
+    setup()
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from app.profiling import profiler
+
+    user = make_user('bench-him', 'HIM')
+    seed_records(user, 0, 200)
+
+    url = '/records/casefolders/?page_size=%d' % args.page_size
+    elapsed = {False: 0.0, True: 0.0}
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            with override_settings(PROFILING_ENABLED=enabled):
+                client = APIClient()
+                client.force_authenticate(user)
+                client.get(url)
+                with Timer() as timer:
+                    for _ in range(args.requests):
+                        client.get(url)
+            elapsed[enabled] += timer.elapsed
+
+    total = args.requests * args.rounds
+    off, on = total / elapsed[False], total / elapsed[True]
+    print('profiling off: %.0f req/s' % off)
+    print('profiling on:  %.0f req/s (%.1f%% overhead)' % (on, (off / on - 1) * 100))
+    print(profiler.stats()['casefolder-list-create'])
+
+
+if __name__ == '__main__':
+    main()
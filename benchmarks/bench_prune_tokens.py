@@ -0,0 +1,50 @@
+"""
+Pruning a large backlog of JWT tokens with `prune_expired_tokens`.
+
+Seeds --tokens outstanding tokens (half expired, a tenth blacklisted and expired) and
+reports rows removed, total time and the longest single batch, which is how
+long other writers can be kept waiting for the SQLite write lock.
+
+    python -m benchmarks.bench_prune_tokens --tokens 2000000 --batch-size 5000
+"""
+import argparse
+from datetime import timedelta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tokens', type=int, default=2000000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    from benchmarks.common import Timer, setup
+    setup()
+    from django.utils import timezone
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+    from app.blacklist import prune_expired_tokens
+
+    now = timezone.now()
+    with Timer() as seeding:
+        for start in range(0, args.tokens, 50000):
+            tokens = OutstandingToken.objects.bulk_create([
+                OutstandingToken(jti='jti-%d' % n, token='x' * 200,
+                                 expires_at=now + timedelta(hours=-1 if n % 2 else 1))
+                for n in range(start, min(start + 50000, args.tokens))
+            ], batch_size=5000)
+            first = OutstandingToken.objects.get(jti='jti-%d' % start).pk
+            BlacklistedToken.objects.bulk_create([
+                BlacklistedToken(token_id=first + offset) for offset in range(1, len(tokens), 10)
+            ], batch_size=5000)
+
+    totals = prune_expired_tokens(batch_size=args.batch_size)
+    print('seeded %d tokens in %.1fs' % (args.tokens, seeding.elapsed))
+    print('removed %(outstanding)d outstanding, %(blacklisted)d blacklisted in %(batches)d batches' % totals)
+    print('total %.2fs, %.0f rows/s, slowest batch %.1f ms' % (
+        totals['seconds'], (totals['outstanding'] + totals['blacklisted']) / totals['seconds'],
+        totals['slowest_batch'] * 1000,
+    ))
+    assert not OutstandingToken.objects.filter(expires_at__lte=now).exists()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Concurrent readers and writers against a file-backed SQLite database.
+
+For each pragma profile a fresh database file is migrated and seeded, then
+--threads workers (a --write-ratio share of them writing vital signs, the
+rest reading case folder pages) run for --seconds.  Reports throughput,
+p50/p99 latency and the rate of "database is locked" errors per profile.
+
+    python -m benchmarks.bench_sqlite_concurrency --threads 16 --seconds 10
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_profile(name, pragmas, args, directory):
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import OperationalError, connection, connections
+    from app.models import CaseFolder, VitalSigns
+    from benchmarks.common import make_folders, make_user
+
+    connections.close_all()
+    settings.SQLITE_PRAGMAS = pragmas
+    connections.databases['default']['NAME'] = os.path.join(directory, '%s.sqlite3' % name)
+    call_command('migrate', verbosity=0)
+    user = make_user('bench-%s' % name, 'NURSE')
+    folder_ids = [folder.pk for folder in make_folders(user, 200)]
+    journal_mode = connection.cursor().execute('PRAGMA journal_mode').fetchone()[0]
+    connections.close_all()
+
+    results = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    writers = max(1, int(round(args.threads * args.write_ratio)))
+
+    def worker(n):
+        kind = 'write' if n < writers else 'read'
+        latencies, failed = [], 0
+        i = 0
+        try:
+            while time.perf_counter() < deadline:
+                i += 1
+                started = time.perf_counter()
+                try:
+                    if kind == 'write':
+                        VitalSigns.objects.create(
+                            case_folder_id=folder_ids[(n * 7919 + i) % len(folder_ids)],
+                            blood_pressure='120/80', pulse='72', weight='70kg', height='175cm',
+                            recorded_by_id=user.pk,
+                        )
+                    else:
+                        list(CaseFolder.objects.select_related('patient').order_by('-created_at', '-id')[:50])
+                except OperationalError as exc:
+                    if 'locked' not in str(exc):
+                        raise
+                    failed += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+        with lock:
+            results[kind].extend(latencies)
+            errors[kind] += failed
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print('%s (journal_mode=%s, %d writers, %d readers)' % (name, journal_mode, writers, args.threads - writers))
+    for kind in ('write', 'read'):
+        done, failed = len(results[kind]), errors[kind]
+        attempts = done + failed
+        print('  %-5s %7.0f ops/s  p50 %7.2f ms  p99 %8.2f ms  locked %5.2f%%' % (
+            kind, done / args.seconds, percentile(results[kind], 0.5) * 1000,
+            percentile(results[kind], 0.99) * 1000, 100.0 * failed / attempts if attempts else 0.0,
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.25)
+    args = parser.parse_args()
+
+    from benchmarks.common import setup
+    setup(test_database=False)
+    from django.conf import settings
+
+    profiles = (('defaults', {}), ('tuned', dict(settings.SQLITE_PRAGMAS)))
+    directory = tempfile.mkdtemp(prefix='ehr-bench-')
+    try:
+        for name, pragmas in profiles:
+            run_profile(name, pragmas, args, directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Ward-round ingestion: one POST per reading versus /records/vitals/bulk/.
+
+    python -m benchmarks.bench_vitals_bulk --readings 500 --folders 40
+"""
+import argparse
+
+from benchmarks.common import Timer, make_folders, make_user, setup
+
+
+def reading(folder_id, n):
+    return {
+        'case_folder': folder_id, 'blood_pressure': '%d/80' % (110 + n % 30), 'pulse': str(60 + n % 40),
+        'weight': '70', 'height': '170', 'urine_albumin': 'NIL', 'urine_sugar': 'NIL',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readings', type=int, default=500)
+    parser.add_argument('--folders', type=int, default=40)
+    args = parser.parse_args()
+
+    setup()
+    from rest_framework.test import APIClient
+    from app.models import VitalSigns
+
+    nurse = make_user('nurse', 'NURSE')
+    folders = make_folders(nurse, args.folders)
+    payload = [reading(folders[n % len(folders)].pk, n) for n in range(args.readings)]
+    client = APIClient()
+    client.force_authenticate(nurse)
+
+    with Timer() as single:
+        for item in payload:
+            item = dict(item)
+            url = '/records/casefolders/%d/vitals/' % item.pop('case_folder')
+            assert client.post(url, item, format='json').status_code == 201
+    with Timer() as bulk:
+        for start in range(0, len(payload), 1000):
+            assert client.post('/records/vitals/bulk/', payload[start:start + 1000], format='json').status_code == 201
+    assert VitalSigns.objects.count() == 2 * args.readings
+
+    print('readings: %d across %d folders' % (args.readings, args.folders))
+    print('one POST per reading: %8.1f readings/s' % (args.readings / single.elapsed))
+    print('bulk endpoint:        %8.1f readings/s' % (args.readings / bulk.elapsed))
+    print('speedup:              %8.1fx' % (single.elapsed / bulk.elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Shared setup for the scripts in this package.
+
+Each benchmark runs against a throwaway test database (in-memory for SQLite),
+never against db.sqlite3.  Run them from the repository root, e.g.
+
+    python -m benchmarks.bench_vitals_bulk
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup(test_database=True):
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ehr.settings')
+    # cached documents from another database must not be served here; set in
+    # the environment so spawned workers share the directory
+    os.environ['EHR_CACHE_DIR'] = tempfile.mkdtemp(prefix='ehr-bench-cache-')
+    atexit.register(shutil.rmtree, os.environ['EHR_CACHE_DIR'], True)
+    import django
+    django.setup()
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    if test_database:
+        from django.db import connection
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def make_user(username, role):
+    from app.models import User
+    return User.objects.create_user(
+        username=username, email='%s@example.com' % username, password='password123',
+        role=role, is_authorized=True,
+    )
+
+
+def make_folders(user, count):
+    from app.models import CaseFolder, Patient
+    patients = Patient.objects.bulk_create([
+        Patient(
+            first_name='First%d' % n, last_name='Last%d' % n, dob=date(2000, 1, 1), gender='M',
+            matric_no='MAT%06d' % n, jamb_no='JAMB%06d' % n, address='Hall', phone='080%08d' % n,
+            xray_no='XR%06d' % n, religion='OTHER', state_of_origin='Oyo', Tribe='Yoruba', created_by=user,
+        )
+        for n in range(count)
+    ])
+    CaseFolder.objects.bulk_create([
+        CaseFolder(patient=patient, folder_number='BF%06d' % n, created_by=user)
+        for n, patient in enumerate(patients)
+    ])
+    return list(CaseFolder.objects.order_by('pk'))
+
+
+def seed_records(user, start, stop):
+    """Folders start..stop, each with a patient, a medical history and a vital signs reading."""
+    from app.models import CaseFolder, MedicalHistory, Patient, VitalSigns
+    for low in range(start, stop, 5000):
+        high = min(low + 5000, stop)
+        patients = Patient.objects.bulk_create([
+            Patient(first_name='First%d' % n, last_name='Last%d' % n, dob=date(2000, 1, 1), gender='M',
+                    matric_no='MAT%07d' % n, jamb_no='JAMB%07d' % n, address='Hall', phone='080%08d' % n,
+                    xray_no='XR%07d' % n, religion='OTHER', state_of_origin='Oyo', Tribe='Yoruba', created_by=user)
+            for n in range(low, high)
+        ])
+        CaseFolder.objects.bulk_create([
+            CaseFolder(patient=patient, folder_number='EF%07d' % (low + i), created_by=user)
+            for i, patient in enumerate(patients)
+        ])
+        folders = list(CaseFolder.objects.filter(folder_number__gte='EF%07d' % low, folder_number__lt='EF%07d' % high))
+        MedicalHistory.objects.bulk_create([MedicalHistory(case_folder=f, recorded_by=user) for f in folders])
+        VitalSigns.objects.bulk_create([
+            VitalSigns(case_folder=f, blood_pressure='120/80', pulse='72', weight='70', height='175',
+                       urine_albumin='NIL', urine_sugar='NIL', recorded_by=user)
+            for f in folders
+        ])
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,150 @@
+"""
+One request per API endpoint, shared by bench_endpoints and the query budget
+test (app.tests.QueryBudgetTests), so both exercise the same requests.
+
+A scenario builds its n-th request from a fixture, which provides:
+
+    users       role -> User, including 'ADMIN' (staff)
+    password    the users' password
+    run         a short string that keeps created rows unique across runs
+    now         an ISO timestamp for dated bodies
+    batch       rows per bulk request (patient import, vitals.bulk)
+    job_id      a finished bundle export job
+    folder(n)   the n-th sample case folder id
+    patient(n)  the n-th sample patient id
+
+Django is imported lazily, so this module can be imported before
+`benchmarks.common.setup()` runs.
+"""
+
+
+def url(name, **kwargs):
+    from django.urls import reverse
+    return reverse(name, kwargs=kwargs)
+
+
+class Scenario:
+    """
+    One request shape.  `path(fixture, n)` and `body(fixture, n)` build the
+    n-th request; `share` scales --requests for expensive endpoints, and a
+    share of None leaves the scenario out of benchmark runs.
+    """
+    def __init__(self, name, route, method, role, path, body=None, expect=(200,), share=1.0, multipart=False):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.role = role
+        self.path = path
+        self.body = body
+        self.expect = expect
+        self.share = share
+        self.multipart = multipart
+
+
+def patient_body(fixture, n):
+    return {
+        'first_name': 'Bench', 'last_name': 'Patient%d' % n, 'dob': '2004-05-06', 'gender': 'F',
+        'matric_no': 'B%s%06d' % (fixture.run, n), 'jamb_no': 'BJ%s%06d' % (fixture.run, n), 'address': 'Hall',
+        'phone': '0810%07d' % n, 'xray_no': 'BX%s%06d' % (fixture.run, n), 'religion': 'OTHER',
+        'state_of_origin': 'Oyo', 'tribe': 'Yoruba',
+    }
+
+
+def import_body(fixture, n):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    header = 'first_name,last_name,dob,gender,matric_no,jamb_no,address,phone,xray_no,religion,state_of_origin,tribe\n'
+    rows = ''.join(
+        'Bench,Import,2004-05-06,M,I%s%07d,IJ%s%07d,Hall,0810%07d,IX%s%07d,OTHER,Oyo,Yoruba\n'
+        % (fixture.run, n * fixture.batch + i, fixture.run, n * fixture.batch + i, i, fixture.run,
+           n * fixture.batch + i)
+        for i in range(fixture.batch)
+    )
+    return {'file': SimpleUploadedFile('patients.csv', (header + rows).encode(), content_type='text/csv')}
+
+
+def vitals_body(fixture, n):
+    return {'blood_pressure': '%d/80' % (110 + n % 30), 'pulse': '%d bpm' % (60 + n % 40), 'weight': '70kg',
+            'height': '175cm', 'urine_albumin': 'NIL', 'urine_sugar': 'NIL'}
+
+
+def refresh_body(fixture, n):
+    from app.tokens import RoleRefreshToken
+    return {'refresh': str(RoleRefreshToken.for_user(fixture.users['HIM']))}
+
+
+SCENARIOS = (
+    # him/urls.py
+    Scenario('patients.list', 'patient-list-create', 'GET', 'HIM',
+             lambda f, n: url('patient-list-create') + '?page_size=50'),
+    Scenario('patients.create', 'patient-list-create', 'POST', 'HIM',
+             lambda f, n: url('patient-list-create'), patient_body, expect=(201,)),
+    Scenario('patients.import', 'patient-import', 'POST', 'HIM',
+             lambda f, n: url('patient-import'), import_body, expect=(201,), share=0.2, multipart=True),
+    Scenario('patients.detail', 'patient-detail', 'GET', 'HIM',
+             lambda f, n: url('patient-detail', pk=f.patient(n))),
+    Scenario('casefolders.list', 'casefolder-list-create', 'GET', 'HIM',
+             lambda f, n: url('casefolder-list-create') + '?page_size=20'),
+    Scenario('casefolders.create', 'casefolder-list-create', 'POST', 'HIM',
+             lambda f, n: url('casefolder-list-create'), lambda f, n: {'patient_id': str(f.patient(n))},
+             expect=(201,)),
+    Scenario('casefolders.detail', 'casefolder-detail', 'GET', 'HIM',
+             lambda f, n: url('casefolder-detail', pk=f.folder(n))),
+    Scenario('casefolders.cache_stats', 'casefolder-cache-stats', 'GET', 'ADMIN',
+             lambda f, n: url('casefolder-cache-stats')),
+    Scenario('casefolders.timeline', 'casefolder-timeline', 'GET', 'NURSE',
+             lambda f, n: url('casefolder-timeline', pk=f.folder(n)) + '?page_size=50'),
+    Scenario('export.patients_csv', 'export', 'GET', 'HIM',
+             lambda f, n: url('export', resource='patients', fmt='csv'), share=0.02),
+    Scenario('export.casefolders_ndjson', 'export', 'GET', 'HIM',
+             lambda f, n: url('export', resource='casefolders', fmt='ndjson') + '?fields=id,folder_number,patient',
+             share=0.02),
+    Scenario('bundles.list', 'bundle-export-list-create', 'GET', 'HIM', lambda f, n: url('bundle-export-list-create')),
+    # exports every patient in the background
+    Scenario('bundles.create', 'bundle-export-list-create', 'POST', 'HIM',
+             lambda f, n: url('bundle-export-list-create'), lambda f, n: {}, expect=(201,), share=None),
+    Scenario('bundles.detail', 'bundle-export-detail', 'GET', 'HIM',
+             lambda f, n: url('bundle-export-detail', pk=f.job_id)),
+    Scenario('bundles.resume_conflict', 'bundle-export-resume', 'POST', 'HIM',
+             lambda f, n: url('bundle-export-resume', pk=f.job_id), lambda f, n: {}, expect=(409,)),
+    Scenario('medical_history.list', 'medical-history-list-create', 'GET', 'DOCTOR',
+             lambda f, n: url('medical-history-list-create', case_folder_id=f.folder(n))),
+    Scenario('profiling.stats', 'profiling-stats', 'GET', 'ADMIN', lambda f, n: url('profiling-stats')),
+    Scenario('cohort', 'cohort', 'GET', 'DOCTOR',
+             lambda f, n: url('cohort') + '?include=%s&limit=100' % ('hypertension', 'allergies', 'measles')[n % 3]),
+    Scenario('reports.conditions', 'report-conditions', 'GET', 'HIM',
+             lambda f, n: url('report-conditions') + '?group_by=gender,age_band'),
+    Scenario('reports.admissions', 'report-admissions', 'GET', 'HIM', lambda f, n: url('report-admissions')),
+    Scenario('diagnoses.list', 'diagnosis-list-create', 'GET', 'DOCTOR',
+             lambda f, n: url('diagnosis-list-create', case_folder_id=f.folder(n))),
+    Scenario('diagnoses.create', 'diagnosis-list-create', 'POST', 'DOCTOR',
+             lambda f, n: url('diagnosis-list-create', case_folder_id=f.folder(n)),
+             lambda f, n: {'date': f.now, 'diagnosis': 'Malaria', 'date_of_admission': f.now,
+                           'recorded_by': f.users['DOCTOR'].pk},
+             expect=(201,)),
+    Scenario('vitals.list', 'vitals-list-create', 'GET', 'NURSE',
+             lambda f, n: url('vitals-list-create', case_folder_id=f.folder(n))),
+    Scenario('vitals.create', 'vitals-list-create', 'POST', 'NURSE',
+             lambda f, n: url('vitals-list-create', case_folder_id=f.folder(n)), vitals_body, expect=(201,)),
+    Scenario('vitals.bulk', 'vitals-bulk-create', 'POST', 'NURSE', lambda f, n: url('vitals-bulk-create'),
+             lambda f, n: [dict(vitals_body(f, n), case_folder=f.folder(n * f.batch + i)) for i in range(f.batch)],
+             expect=(201,), share=0.2),
+    Scenario('vitals.series', 'vitals-series', 'GET', 'NURSE',
+             lambda f, n: url('vitals-series') + '?case_folder=%d&interval=month' % f.folder(n)),
+    Scenario('notes.list', 'notes-list-create', 'GET', 'NURSE',
+             lambda f, n: url('notes-list-create', case_folder_id=f.folder(n))),
+    Scenario('notes.create', 'notes-list-create', 'POST', 'NURSE',
+             lambda f, n: url('notes-list-create', case_folder_id=f.folder(n)),
+             lambda f, n: {'surname': 'Bench', 'other_names': 'Nurse', 'date': f.now, 'notes': 'Vitals stable.'},
+             expect=(201,)),
+    # app/urls.py
+    Scenario('auth.register', 'register', 'POST', None, lambda f, n: url('app:register'),
+             lambda f, n: {'username': 'bench%s%d' % (f.run, n), 'email': 'bench%s%d@example.com' % (f.run, n),
+                           'first_name': 'Bench', 'last_name': 'Nurse', 'phone': '0810%07d' % n, 'role': 'NURSE',
+                           'password': 'password123', 'password_confirm': 'password123'},
+             expect=(201,), share=0.2),
+    Scenario('auth.login', 'login', 'POST', None, lambda f, n: url('app:login'),
+             lambda f, n: {'username': f.users['HIM'].username, 'password': f.password}, share=0.2),
+    Scenario('auth.logout', 'logout', 'POST', None, lambda f, n: url('app:logout'), refresh_body),
+    Scenario('auth.refresh', 'token_refresh', 'POST', None, lambda f, n: url('app:token_refresh'), refresh_body),
+    Scenario('metrics', 'metrics', 'GET', 'METRICS', lambda f, n: url('app:metrics')),
+)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -51,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.middleware.ProfilingMiddleware',
+    'app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,8 +62,22 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'app.middleware.ReplicaStickinessMiddleware',
 ]
 
+# Server-Timing headers and per-URL latency histograms (app/profiling.py),
+# read at /records/profiling/ by staff
+PROFILING_ENABLED = os.environ.get('EHR_PROFILING', '0') == '1'
+
+# Prometheus metrics served at /metrics (app/metrics.py) to staff users.  Set
+# EHR_METRICS_DIR to a directory shared by all worker processes on the host to
+# report them together, and EHR_METRICS_TOKEN to also accept a scraper's
+# bearer token.
+METRICS_ENABLED = os.environ.get('EHR_METRICS', '1') == '1'
+METRICS_DIR = os.environ.get('EHR_METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 5  # seconds between writes of a process's counters
+METRICS_TOKEN = os.environ.get('EHR_METRICS_TOKEN') or None
+
 ROOT_URLCONF = 'ehr.urls'
 
 TEMPLATES = [
@@ -100,13 +117,87 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections (and their applied pragmas) across requests
+        'CONN_MAX_AGE': int(os.environ.get('EHR_CONN_MAX_AGE', 60)),
     }
 }
 
+# Patients validated and inserted per transaction by the bulk import
+PATIENT_IMPORT_BATCH_SIZE = 1000
+
+# Rows read, prefetched and rendered per round trip by the streaming exports
+EXPORT_CHUNK_SIZE = 500
+
+# Render GET lists from values() rows when the serializer allows it (app/fastpath.py)
+FAST_LISTS = True
+
+# Most buckets one /records/vitals/series/ request may return
+VITALS_SERIES_MAX_BUCKETS = 1000
+
+# Per-patient bundle exports (see app/bundles.py); workers default to the CPU count
+BUNDLE_EXPORT_ROOT = BASE_DIR / 'exports'
+BUNDLE_EXPORT_SHARD_SIZE = 50
+BUNDLE_EXPORT_LEASE = 600  # seconds without progress before a pending or running job may be resumed
+
+# Optional read replica: a second SQLite file kept current with
+# `manage.py sync_replica`.  Reads are routed to it by app/routers.py.
+REPLICA_DATABASE = os.environ.get('EHR_REPLICA_DATABASE')
+if REPLICA_DATABASE:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': REPLICA_DATABASE,
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'TEST': {'MIRROR': 'default'},
+    }
+READ_REPLICA_ALIAS = 'replica' if REPLICA_DATABASE else None
+DATABASE_ROUTERS = ['app.routers.PrimaryReplicaRouter']
+# Seconds a client's reads stay on the primary after it writes
+REPLICA_STICKY_SECONDS = 5
+
+# Applied to every new SQLite connection by app/db.py; set EHR_SQLITE_TUNING=0
+# to run with SQLite's defaults.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,  # ms
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,  # KiB
+    'mmap_size': 134217728,  # bytes
+} if os.environ.get('EHR_SQLITE_TUNING', '1') == '1' else {}
+
+# Shared by every worker process, so that invalidations (app/cache.py) and
+# user revocation stamps (app/authentication.py) reach all of them: memcached
+# at EHR_MEMCACHED (host:port) when set, otherwise files in EHR_CACHE_DIR,
+# which every worker on the host must share.  Tests and benchmarks run against
+# a throwaway directory instead (app/runner.py, benchmarks/common.py).
+if os.environ.get('EHR_MEMCACHED'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ['EHR_MEMCACHED'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('EHR_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'ehr-cache'),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+TEST_RUNNER = 'app.runner.DiscoverRunner'
+
+# Server-assigned case folder numbers (app/numbering.py); every placeholder
+# other than seq picks the sequence, so '{year}' restarts numbering yearly
+CASEFOLDER_NUMBER_FORMAT = '{year}/{seq:06d}'
+CASEFOLDER_NUMBER_BLOCK = 20  # numbers reserved per counter update
+
+# Seconds a serialized case folder document stays cached (see app/cache.py)
+CASEFOLDER_CACHE_TIMEOUT = 300
+
 import datetime
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'app.authentication.CachedJWTAuthentication',
     ),
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
@@ -117,8 +208,29 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     # 'ROTATE_REFRESH_TOKENS': True,
+    'TOKEN_REFRESH_SERIALIZER': 'app.serializers.RefreshSerializer',
 }
 
+# In-process cache of JWT-authenticated users (see app/authentication.py).
+# Changing a user's active flag, approval, role or password replaces a stamp
+# in the default cache, which evicts the user in every worker sharing it
+# (see CACHES); a worker on another cache store keeps its copy for up to the
+# TTL, which bounds revocation there.
+JWT_USER_CACHE_SIZE = 1024
+JWT_USER_CACHE_TTL = 60  # seconds
+
+# In-process refresh token blacklist (see app/blacklist.py). Blacklistings made
+# by other workers are pulled at most this often, so a token revoked in one
+# worker is still accepted by the others for up to the sync interval;
+# deletions are picked up on full reload.
+BLACKLIST_INDEX_SYNC_INTERVAL = 5  # seconds
+BLACKLIST_INDEX_RELOAD_INTERVAL = 600  # seconds
+
+# Seconds between in-process prunes of expired JWT tokens; None leaves it to
+# `manage.py prune_tokens` (e.g. from cron).
+TOKEN_PRUNE_INTERVAL = None
+TOKEN_PRUNE_BATCH_SIZE = 5000
+
 AUTH_USER_MODEL = 'app.User'
 
 
@@ -168,6 +280,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Background task queue (app/tasks.py); 0 threads leaves tasks to `manage.py drain_tasks`
+TASK_RUNNER_THREADS = 2
+TASK_POLL_INTERVAL = 1  # seconds between checks for due tasks
+TASK_RETRY_BACKOFF = 2  # seconds before the first retry, doubled per attempt
+TASK_RETRY_MAX_DELAY = 300
+TASK_LEASE = 600  # seconds before a task stuck RUNNING is claimed again
+
 # auth_project/settings.py
 
 # EMAIl_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
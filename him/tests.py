@@ -1,3 +1,840 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db import close_old_connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from app import aggregates, bundles, numbering, tasks, cache as document_cache
+from app.profiling import Histogram, profiler
+from app.models import (
+    User, Patient, CaseFolder, MedicalHistory, DiagnosisAdmission, VitalSigns, PatientNote, BundleExportJob,
+    Counter, Task,
+)
+
+
+def make_user(username='him', role='HIM'):
+    return User.objects.create_user(
+        username=username, email='%s@example.com' % username, password='password123',
+        role=role, is_authorized=True,
+    )
+
+
+def make_patient(user, n=0):
+    return Patient.objects.create(
+        first_name='First%d' % n, last_name='Last%d' % n, dob=date(2000, 1, 1), gender='M',
+        matric_no='MAT%05d' % n, jamb_no='JAMB%05d' % n, address='Hall %d' % n, phone='0800000%04d' % n,
+        xray_no='XR%05d' % n, religion='OTHER', state_of_origin='Oyo', Tribe='Yoruba', created_by=user,
+    )
+
+
+def make_folder(user, n=0, children=2):
+    folder = CaseFolder.objects.create(patient=make_patient(user, n), folder_number='CF%05d' % n, created_by=user)
+    MedicalHistory.objects.create(case_folder=folder, diabetes=True, recorded_by=user)
+    now = timezone.now()
+    for _ in range(children):
+        DiagnosisAdmission.objects.create(
+            case_folder=folder, date=now, diagnosis='Malaria', date_of_admission=now, recorded_by=user, created_by=user,
+        )
+        VitalSigns.objects.create(
+            case_folder=folder, blood_pressure='120/80', pulse='72', weight='70', height='175',
+            urine_albumin='NIL', urine_sugar='NIL', recorded_by=user,
+        )
+        PatientNote.objects.create(
+            case_folder=folder, surname='Last', other_names='First', date=now, notes='Stable', user_type='NURSE',
+            recorded_by=user,
+        )
+    return folder
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.patients = [make_patient(self.user, n) for n in range(7)]
+        for n, patient in enumerate(self.patients):
+            CaseFolder.objects.create(patient=patient, folder_number='CF%03d' % n, created_by=self.user)
+
+    def walk(self, url):
+        seen, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+            pages += 1
+        return seen, pages
+
+    def test_patient_pages_cover_every_row_once_newest_first(self):
+        seen, pages = self.walk('/records/patients/?page_size=3')
+        self.assertEqual(pages, 3)
+        expected = Patient.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, [str(pk) for pk in expected])
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        Patient.objects.update(created_at=self.patients[0].created_at)
+        seen, _ = self.walk('/records/patients/?page_size=2')
+        self.assertEqual(seen, sorted((str(p.id) for p in self.patients), reverse=True))
+
+    def test_casefolder_previous_link_returns_prior_page(self):
+        first = self.client.get('/records/casefolders/?page_size=3').data
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual([r['id'] for r in back['results']], [r['id'] for r in first['results']])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get('/records/casefolders/?cursor=bogus')
+        self.assertEqual(response.status_code, 404)
+
+
+class CaseFolderQueryPlanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        for n in range(2):
+            make_folder(self.user, n)
+        small = self.count_queries('/records/casefolders/')
+        for n in range(2, 8):
+            make_folder(self.user, n, children=4)
+        self.assertEqual(self.count_queries('/records/casefolders/'), small)
+        # folders (+patient, creators, history) and one per child collection
+        self.assertEqual(small, 4)
+
+    def test_detail_renders_nested_children(self):
+        folder = make_folder(self.user)
+        with self.assertNumQueries(4):
+            data = self.client.get('/records/casefolders/%d/' % folder.pk).data
+        self.assertEqual(data['patient']['created_by']['username'], 'him')
+        self.assertTrue(data['medical_history']['diabetes'])
+        self.assertEqual(len(data['notes']), 2)
+        self.assertEqual(data['notes'][0]['recorded_by']['username'], 'him')
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for n in range(3):
+            make_folder(self.user, n)
+
+    def test_picker_fields_only_join_patient(self):
+        url = '/records/casefolders/?fields=id,folder_number,patient.first_name,patient.last_name'
+        with self.assertNumQueries(1):
+            results = self.client.get(url).data['results']
+        self.assertEqual(set(results[0]), {'id', 'folder_number', 'patient'})
+        self.assertEqual(set(results[0]['patient']), {'first_name', 'last_name'})
+
+    def test_unexpanded_relations_collapse_or_disappear(self):
+        with self.assertNumQueries(2):
+            results = self.client.get('/records/casefolders/?expand=notes').data['results']
+        row = results[0]
+        self.assertNotIn('diagnoses', row)
+        self.assertNotIn('medical_history', row)
+        self.assertEqual(row['created_by'], self.user.pk)
+        self.assertEqual(row['patient'], CaseFolder.objects.get(pk=row['id']).patient_id)
+        self.assertEqual(len(row['notes']), 2)
+
+    def test_no_parameters_render_full_document(self):
+        row = self.client.get('/records/casefolders/').data['results'][0]
+        self.assertEqual(set(row), {
+            'id', 'patient', 'folder_number', 'medical_history', 'diagnoses', 'vital_signs', 'notes',
+            'created_by', 'created_at',
+        })
+
+
+class CaseFolderDocumentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.folder = make_folder(self.user)
+        self.url = '/records/casefolders/%d/' % self.folder.pk
+
+    def test_second_read_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(document_cache.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_projections_are_cached_separately(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url + '?fields=id,folder_number')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(set(response.data), {'id', 'folder_number'})
+
+    def test_child_and_patient_writes_invalidate(self):
+        self.client.get(self.url)
+        VitalSigns.objects.create(
+            case_folder=self.folder, blood_pressure='130/85', pulse='80', weight='71', height='175',
+            urine_albumin='NIL', urine_sugar='NIL', recorded_by=self.user,
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['vital_signs']), 3)
+
+        patient = self.folder.patient
+        patient.first_name = 'Renamed'
+        patient.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['patient']['first_name'], 'Renamed')
+
+        MedicalHistory.objects.filter(case_folder=self.folder).get().delete()
+        self.assertIsNone(self.client.get(self.url).data['medical_history'])
+
+    def test_invalidation_by_another_process_is_seen(self):
+        self.client.get(self.url)
+        # another worker has its own cache connection to the same store
+        with mock.patch.object(document_cache, 'cache', caches.create_connection('default')):
+            patient = self.folder.patient
+            patient.first_name = 'Renamed'
+            patient.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['patient']['first_name'], 'Renamed')
+
+
+class CaseFolderTimelineTests(TestCase):
+    def setUp(self):
+        self.user = make_user(role='NURSE')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.folder = make_folder(self.user, children=5)
+        self.url = '/records/casefolders/%d/timeline/' % self.folder.pk
+
+    def walk(self, url):
+        entries = []
+        while url:
+            with self.assertNumQueries(4):
+                data = self.client.get(url).data
+            entries.extend(data['results'])
+            url = data['next']
+        return entries
+
+    def test_feed_merges_all_streams_newest_first(self):
+        entries = self.walk(self.url + '?page_size=4')
+        self.assertEqual(len(entries), 15)
+        self.assertEqual({e['type'] for e in entries}, {'diagnosis', 'vital_signs', 'note'})
+        self.assertEqual([e['timestamp'] for e in entries], sorted((e['timestamp'] for e in entries), reverse=True))
+
+    def test_identical_timestamps_page_without_gaps_or_repeats(self):
+        moment = timezone.now()
+        DiagnosisAdmission.objects.update(created_at=moment)
+        VitalSigns.objects.update(recorded_at=moment)
+        PatientNote.objects.update(created_at=moment)
+        entries = self.walk(self.url + '?page_size=2')
+        keys = [(e['type'], e['data']['id']) for e in entries]
+        self.assertEqual(len(keys), 15)
+        self.assertEqual(len(set(keys)), 15)
+
+        first = self.client.get(self.url + '?page_size=2').data
+        third = self.client.get(self.client.get(first['next']).data['next']).data
+        back = self.client.get(self.client.get(third['previous']).data['previous']).data
+        self.assertEqual(back['results'], first['results'])
+
+    def test_previous_links_walk_back_to_the_first_page(self):
+        pages = [self.client.get(self.url + '?page_size=4').data]
+        self.assertIsNone(pages[0]['previous'])
+        while pages[-1]['next']:
+            pages.append(self.client.get(pages[-1]['next']).data)
+        self.assertEqual([len(page['results']) for page in pages], [4, 4, 4, 3])
+
+        url = pages[-1]['previous']
+        for page in reversed(pages[:-1]):
+            with self.assertNumQueries(4):
+                data = self.client.get(url).data
+            self.assertEqual(data['results'], page['results'])
+            url = data['previous']
+        self.assertIsNone(url)
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get(self.url + '?cursor=nope').status_code, 404)
+
+
+class VitalSignsSeriesTests(TestCase):
+    def setUp(self):
+        self.user = make_user(role='DOCTOR')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.folder = make_folder(self.user, children=0)
+
+    def record(self, when, blood_pressure, pulse, weight='70kg'):
+        vitals = VitalSigns.objects.create(
+            case_folder=self.folder, blood_pressure=blood_pressure, pulse=pulse, weight=weight, height='175 cm',
+            urine_albumin='NIL', urine_sugar='NIL', recorded_by=self.user,
+        )
+        VitalSigns.objects.filter(pk=vitals.pk).update(recorded_at=when)
+        return vitals
+
+    def test_readings_are_parsed_into_numeric_columns(self):
+        vitals = self.record(timezone.now(), '120 / 80', '72 bpm', weight='70.5kg')
+        self.assertEqual((vitals.systolic, vitals.diastolic, vitals.pulse_rate), (120, 80, 72))
+        self.assertEqual((vitals.weight_kg, vitals.height_cm), (70.5, 175.0))
+        vitals.blood_pressure = 'not taken'
+        vitals.save()
+        vitals.refresh_from_db()
+        self.assertIsNone(vitals.systolic)
+
+    def test_series_buckets_by_interval(self):
+        day1 = timezone.now().replace(year=2026, month=3, day=1, hour=9)
+        self.record(day1, '120/80', '70')
+        self.record(day1.replace(hour=15), '140/90', '90')
+        self.record(day1.replace(day=2), '110/70', '60')
+        response = self.client.get('/records/vitals/series/', {'case_folder': self.folder.pk, 'interval': 'day'})
+        self.assertEqual(response.status_code, 200)
+        first, second = response.data['results']
+        self.assertEqual(first['count'], 2)
+        self.assertEqual(first['systolic'], {'min': 120, 'max': 140, 'avg': 130.0})
+        self.assertEqual(second['pulse_rate']['avg'], 60.0)
+
+        month = self.client.get('/records/vitals/series/', {'case_folder': self.folder.pk, 'interval': 'month'})
+        self.assertEqual([point['count'] for point in month.data['results']], [3])
+
+    def test_series_is_limited_in_buckets(self):
+        start = timezone.now().replace(year=2026, month=3, day=1, hour=0)
+        url = '/records/vitals/series/'
+        query = {'case_folder': self.folder.pk, 'interval': 'hour', 'start': start.isoformat()}
+        with self.settings(VITALS_SERIES_MAX_BUCKETS=48):
+            response = self.client.get(url, dict(query, end=(start + timedelta(days=2)).isoformat()))
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(url, dict(query, end=(start + timedelta(days=3)).isoformat()))
+            self.assertEqual(response.status_code, 400)
+
+        for hour in range(3):
+            self.record(start + timedelta(hours=hour), '120/80', '70')
+        with self.settings(VITALS_SERIES_MAX_BUCKETS=2):
+            response = self.client.get(url, {'case_folder': self.folder.pk, 'interval': 'hour'})
+            self.assertEqual(response.status_code, 400)
+            response = self.client.get(url, {'case_folder': self.folder.pk, 'interval': 'day'})
+            self.assertEqual([point['count'] for point in response.data['results']], [3])
+
+    def test_invalid_interval_is_rejected(self):
+        response = self.client.get('/records/vitals/series/', {'case_folder': self.folder.pk, 'interval': 'decade'})
+        self.assertEqual(response.status_code, 400)
+
+
+class VitalSignsBulkCreateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user(role='NURSE')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.folders = [make_folder(self.user, n, children=0) for n in range(3)]
+
+    def reading(self, folder_id, blood_pressure='120/80'):
+        return {
+            'case_folder': folder_id, 'blood_pressure': blood_pressure, 'pulse': '72', 'weight': '70',
+            'height': '170', 'urine_albumin': 'NIL', 'urine_sugar': 'NIL',
+        }
+
+    def test_ward_round_is_one_lookup_and_one_insert(self):
+        payload = [self.reading(folder.pk) for folder in self.folders for _ in range(20)]
+        with self.assertNumQueries(4):  # folder lookup, savepoint, insert, release
+            response = self.client.post('/records/vitals/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'created': 60, 'errors': []})
+        self.assertEqual(VitalSigns.objects.filter(systolic=120, recorded_by=self.user).count(), 60)
+
+    def test_errors_are_reported_per_item(self):
+        bad = self.reading(self.folders[0].pk)
+        del bad['pulse']
+        payload = [self.reading(self.folders[0].pk), bad, self.reading(99999)]
+        response = self.client.post('/records/vitals/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('pulse', response.data['errors'][0]['errors'])
+
+    def test_cached_folder_document_is_invalidated(self):
+        doctor = make_user('doc', role='DOCTOR')
+        reader = APIClient()
+        reader.force_authenticate(doctor)
+        url = '/records/casefolders/%d/' % self.folders[0].pk
+        reader.get(url)
+        self.client.post('/records/vitals/bulk/', [self.reading(self.folders[0].pk)], format='json')
+        self.assertEqual(len(reader.get(url).data['vital_signs']), 1)
+
+
+class CohortTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        profiles = [
+            {'diabetes': True, 'kidney_disease': True},
+            {'diabetes': True, 'kidney_disease': True, 'hypertension': True},
+            {'diabetes': True},
+            {'allergies': True, 'hiv': True},
+        ]
+        self.folders = []
+        for n, conditions in enumerate(profiles):
+            folder = CaseFolder.objects.create(patient=make_patient(self.user, n), folder_number='C%d' % n,
+                                               created_by=self.user)
+            MedicalHistory.objects.create(case_folder=folder, recorded_by=self.user, **conditions)
+            self.folders.append(folder)
+
+    def test_mask_tracks_boolean_columns(self):
+        history = self.folders[3].medical_history
+        self.assertEqual(history.conditions, MedicalHistory.condition_mask(['allergies', 'hiv']))
+        history.hiv = False
+        history.save(update_fields=['hiv'])
+        history.refresh_from_db()
+        self.assertEqual(history.conditions, MedicalHistory.condition_mask(['allergies']))
+
+    def test_include_and_exclude(self):
+        response = self.client.get('/records/cohorts/', {'include': 'diabetes,kidney_disease', 'exclude': 'hypertension'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['case_folders'], [self.folders[0].pk])
+        self.assertEqual(self.client.get('/records/cohorts/', {'include': 'diabetes'}).data['count'], 3)
+        self.assertEqual(self.client.get('/records/cohorts/', {'exclude': 'diabetes'}).data['count'], 1)
+
+    def test_unknown_condition_is_rejected(self):
+        response = self.client.get('/records/cohorts/', {'include': 'gout'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AggregateReportTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def report(self, **params):
+        response = self.client.get('/records/reports/conditions/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def snapshot(self):
+        conditions = sorted(self.report(group_by='gender,state_of_origin,religion,age_band'), key=repr)
+        return conditions, self.client.get('/records/reports/admissions/').data['results']
+
+    def assertMatchesRebuild(self):
+        live = self.snapshot()
+        aggregates.rebuild()
+        self.assertEqual(self.snapshot(), live)
+
+    def test_counts_follow_saves_and_deletes(self):
+        first = make_folder(self.user, 0, children=0)
+        second = make_folder(self.user, 1, children=0)
+        self.assertEqual(self.report(), [{'condition': 'diabetes', 'count': 2}])
+
+        history = second.medical_history
+        history.diabetes, history.hiv = False, True
+        history.save()
+        self.assertEqual(self.report(), [{'condition': 'diabetes', 'count': 1}, {'condition': 'hiv', 'count': 1}])
+
+        patient = first.patient
+        patient.gender = 'F'
+        patient.save()
+        self.assertEqual(self.report(condition='diabetes', group_by='gender'),
+                         [{'condition': 'diabetes', 'gender': 'F', 'count': 1}])
+
+        first.patient.delete()
+        self.assertEqual(self.report(), [{'condition': 'hiv', 'count': 1}])
+        self.assertMatchesRebuild()
+
+    def test_age_band_is_age_when_recorded(self):
+        make_folder(self.user, children=0)
+        band = self.report(group_by='age_band')[0]['age_band']
+        self.assertEqual(band, aggregates.age_band(date(2000, 1, 1), timezone.localdate()))
+
+    def test_admissions_by_month(self):
+        folder = make_folder(self.user, children=0)
+        march = timezone.now().replace(year=2026, month=3, day=10)
+        diagnoses = [
+            DiagnosisAdmission.objects.create(case_folder=folder, date=when, diagnosis='Malaria', date_of_admission=when,
+                                              recorded_by=self.user, created_by=self.user)
+            for when in (march, march.replace(day=20), march.replace(month=4))
+        ]
+        diagnoses[1].date_of_admission = march.replace(month=5)
+        diagnoses[1].save()
+        diagnoses[2].delete()
+        response = self.client.get('/records/reports/admissions/')
+        self.assertEqual(response.data['results'], [{'month': '2026-03', 'count': 1}, {'month': '2026-05', 'count': 1}])
+        self.assertMatchesRebuild()
+
+
+PATIENT_CSV_HEADER = 'first_name,last_name,dob,gender,matric_no,jamb_no,address,phone,email,xray_no,religion,state_of_origin,tribe\n'
+
+
+def patient_csv_row(n, **overrides):
+    row = {
+        'first_name': 'New%d' % n, 'last_name': 'Student', 'dob': '2005-02-01', 'gender': 'F',
+        'matric_no': 'NEW%05d' % n, 'jamb_no': 'NJ%05d' % n, 'address': 'Hall', 'phone': '0810000%04d' % n,
+        'email': '', 'xray_no': 'NX%05d' % n, 'religion': 'CHRISTIAN', 'state_of_origin': 'Lagos', 'tribe': 'Yoruba',
+    }
+    row.update(overrides)
+    return ','.join(row[name] for name in PATIENT_CSV_HEADER.strip().split(',')) + '\n'
+
+
+class PatientImportTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_patient(self.user, 0)
+
+    def upload(self, name, content):
+        return self.client.post('/records/patients/import/',
+                                {'file': SimpleUploadedFile(name, content.encode('utf-8'))}, format='multipart')
+
+    def test_csv_rows_are_validated_and_deduplicated(self):
+        content = PATIENT_CSV_HEADER + ''.join([
+            patient_csv_row(1),
+            patient_csv_row(2, gender='X'),
+            patient_csv_row(3, matric_no='NEW00001'),
+            patient_csv_row(4, jamb_no='JAMB00000'),
+            patient_csv_row(5),
+        ])
+        response = self.upload('intake.csv', content)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data['rows'], response.data['created'], response.data['rejected']), (5, 2, 3))
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4, 5])
+        self.assertIn('gender', response.data['errors'][0]['errors'])
+        self.assertIn('matric_no', response.data['errors'][1]['errors'])
+        self.assertIn('jamb_no', response.data['errors'][2]['errors'])
+        patient = Patient.objects.get(matric_no='NEW00005')
+        self.assertEqual((patient.Tribe, patient.created_by), ('Yoruba', self.user))
+
+    def test_ndjson_batches_see_earlier_batches(self):
+        rows = [dict(zip(PATIENT_CSV_HEADER.strip().split(','), patient_csv_row(n).strip().split(',')))
+                for n in range(1, 4)]
+        lines = [json.dumps(row) for row in rows] + ['not json', json.dumps(rows[0])]
+        with self.settings(PATIENT_IMPORT_BATCH_SIZE=2):
+            response = self.upload('intake.ndjson', '\n'.join(lines) + '\n')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data['created'], response.data['rejected']), (3, 2))
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5])
+
+    def test_unknown_format_is_rejected(self):
+        response = self.upload('intake.xlsx', 'x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_writes_rejects_report(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        source, rejects = os.path.join(directory, 'intake.csv'), os.path.join(directory, 'rejects.ndjson')
+        with open(source, 'w') as handle:
+            handle.write(PATIENT_CSV_HEADER + patient_csv_row(1) + patient_csv_row(2, dob='yesterday'))
+        out = StringIO()
+        call_command('import_patients', source, user=self.user.username, rejects=rejects, stdout=out)
+        self.assertIn('Imported 1 of 2 rows (1 rejected)', out.getvalue())
+        with open(rejects) as handle:
+            report = [json.loads(line) for line in handle]
+        self.assertEqual(report[0]['line'], 3)
+        self.assertIn('dob', report[0]['errors'])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.folders = [make_folder(self.user, n) for n in range(5)]
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_streams_full_documents_in_chunks(self):
+        with self.settings(EXPORT_CHUNK_SIZE=2), CaptureQueriesContext(connection) as queries:
+            body = self.export('/records/export/casefolders.ndjson')
+        # three chunks of (folders + joins, diagnoses, vitals, notes) and the final empty read
+        self.assertEqual(len(queries), 3 * 4 + 1)
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [folder.pk for folder in self.folders])
+        detail = self.client.get('/records/casefolders/%d/' % self.folders[0].pk)
+        self.assertEqual(rows[0], json.loads(detail.content))
+
+    def test_csv_flattens_nested_objects(self):
+        rows = list(csv.DictReader(StringIO(self.export('/records/export/patients.csv'))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['created_by.username'], 'him')
+        self.assertEqual(rows[0]['tribe'], 'Yoruba')
+
+        rows = list(csv.DictReader(StringIO(self.export('/records/export/casefolders.csv?fields=id,patient.matric_no,notes'))))
+        self.assertEqual(set(rows[0]), {'id', 'patient.matric_no', 'notes'})
+        self.assertEqual(len(json.loads(rows[0]['notes'])), 2)
+
+    def test_unknown_export_is_404(self):
+        self.assertEqual(self.client.get('/records/export/users.csv').status_code, 404)
+        self.assertEqual(self.client.get('/records/export/patients.xml').status_code, 404)
+
+
+class BundleExportTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.folders = [make_folder(self.user, n) for n in range(3)]
+        self.patient_ids = [str(folder.patient_id) for folder in self.folders]
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def read_bundle(self, patient_id):
+        with gzip.open(os.path.join(self.directory, bundles.bundle_name(patient_id))) as handle:
+            return json.load(handle)
+
+    def test_one_bundle_per_patient_with_every_child(self):
+        totals = bundles.export_bundles(self.patient_ids, self.directory, shard_size=2)
+        self.assertEqual(totals, {'patients': 3, 'written': 3, 'skipped': 0, 'missing': []})
+        bundle = self.read_bundle(self.patient_ids[0])
+        self.assertEqual(bundle['matric_no'], 'MAT00000')
+        folder = bundle['case_folders'][0]
+        self.assertTrue(folder['medical_history']['diabetes'])
+        self.assertEqual([len(folder[name]) for name in ('diagnoses', 'vital_signs', 'notes')], [2, 2, 2])
+        with open(os.path.join(self.directory, 'manifest.json')) as handle:
+            manifest = json.load(handle)
+        self.assertEqual(sorted(entry['patient'] for entry in manifest['bundles']), sorted(self.patient_ids))
+
+    def test_shard_query_count_does_not_depend_on_patients(self):
+        with CaptureQueriesContext(connection) as small:
+            bundles.write_shard(self.directory, self.patient_ids[:1])
+        with CaptureQueriesContext(connection) as large:
+            bundles.write_shard(self.directory, self.patient_ids)
+        self.assertEqual(len(small), len(large))
+
+    def test_rerun_resumes_after_finished_patients(self):
+        bundles.export_bundles(self.patient_ids[:2], self.directory)
+        totals = bundles.export_bundles(self.patient_ids, self.directory)
+        self.assertEqual(totals, {'patients': 3, 'written': 1, 'skipped': 2, 'missing': []})
+
+    def test_unknown_patients_are_reported_missing(self):
+        unknown = str(uuid.uuid4())
+        totals = bundles.export_bundles(self.patient_ids + [unknown], self.directory)
+        self.assertEqual((totals['written'], totals['missing']), (3, [unknown]))
+        with open(os.path.join(self.directory, 'manifest.json')) as handle:
+            self.assertEqual(json.load(handle)['missing'], [unknown])
+
+    def test_job_api(self):
+        unknown = str(uuid.uuid4())
+        response = self.client.post('/records/bundles/', {'patient_ids': self.patient_ids[:2] + [unknown]},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], 'PENDING')
+        queued = Task.objects.get(name='app.export_bundles')
+        self.assertEqual(queued.kwargs, {'job_id': response.data['id']})
+        with self.settings(BUNDLE_EXPORT_ROOT=self.directory, BUNDLE_EXPORT_WORKERS=1), \
+                self.assertLogs('app.bundles', 'WARNING'):
+            self.assertTrue(tasks.run_task(queued.pk))
+        job = self.client.get('/records/bundles/%d/' % response.data['id']).data
+        self.assertEqual((job['status'], job['total'], job['completed']), ('DONE', 3, 2))
+        self.assertEqual(job['missing_patient_ids'], [unknown])
+        self.assertTrue(os.path.exists(os.path.join(job['output_dir'], 'manifest.json')))
+        resume = self.client.post('/records/bundles/%d/resume/' % job['id'])
+        self.assertEqual(resume.status_code, 409)
+
+    def test_abandoned_jobs_can_be_resumed(self):
+        job = BundleExportJob.objects.create(status='RUNNING', patient_ids=self.patient_ids, created_by=self.user)
+        self.assertEqual(self.client.post('/records/bundles/%d/resume/' % job.pk).status_code, 409)
+        with self.assertLogs('app.bundles', 'WARNING'):
+            bundles.run_job(job.pk, workers=1)  # a live job is not run twice
+        self.assertEqual(BundleExportJob.objects.get(pk=job.pk).completed, 0)
+
+        BundleExportJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=601))
+        resume = self.client.post('/records/bundles/%d/resume/' % job.pk)
+        self.assertEqual((resume.status_code, resume.data['status']), (202, 'PENDING'))
+        self.assertEqual(Task.objects.filter(name='app.export_bundles', kwargs__job_id=job.pk).count(), 1)
+
+
+class CaseFolderNumberTests(TestCase):
+    def setUp(self):
+        numbering.reset()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_numbers_are_assigned_from_reserved_blocks(self):
+        year = timezone.localtime().year
+        numbers = []
+        with self.settings(CASEFOLDER_NUMBER_BLOCK=3):
+            for n in range(4):
+                # as if each request committed, which keeps the rest of its block
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = self.client.post('/records/casefolders/',
+                                                {'patient_id': str(make_patient(self.user, n).pk)}, format='json')
+                self.assertEqual(response.status_code, 201)
+                numbers.append(response.data['folder_number'])
+        self.assertEqual(numbers, ['%d/%06d' % (year, seq) for seq in range(1, 5)])
+        # two blocks of three reserved
+        self.assertEqual(Counter.objects.get(name='casefolder:%d' % year).value, 6)
+
+    def test_block_reserved_in_a_rolled_back_transaction_is_dropped(self):
+        with self.settings(CASEFOLDER_NUMBER_BLOCK=3, CASEFOLDER_NUMBER_FORMAT='CF{seq:05d}'):
+            try:
+                with transaction.atomic():
+                    self.assertEqual(numbering.next_folder_number(), 'CF00001')
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            # the counter update was rolled back with the folder, so 1 is free again,
+            # but 2 and 3 must not be handed out from a block nobody holds
+            self.assertEqual(numbering.next_folder_number(), 'CF00001')
+            self.assertEqual(Counter.objects.get(name='casefolder').value, 3)
+
+    def test_supplied_number_is_kept(self):
+        patient = make_patient(self.user)
+        response = self.client.post('/records/casefolders/', {'patient_id': str(patient.pk), 'folder_number': 'OLD/1'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['folder_number'], 'OLD/1')
+        self.assertFalse(Counter.objects.exists())
+
+    def test_supplied_number_in_the_server_format_is_rejected(self):
+        year = timezone.localtime().year
+        for number in ('%d/000001' % year, '2001/7'):
+            response = self.client.post('/records/casefolders/',
+                                        {'patient_id': str(make_patient(self.user).pk), 'folder_number': number},
+                                        format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('folder_number', response.data)
+        response = self.client.post('/records/casefolders/', {'patient_id': str(make_patient(self.user).pk)},
+                                    format='json')
+        self.assertEqual(response.data['folder_number'], '%d/000001' % year)
+
+    def test_reservation_does_not_hold_the_allocator_lock(self):
+        allocator = numbering.HiLoAllocator('unlocked', block_size=5)
+        reserving, release = threading.Event(), threading.Event()
+
+        def reserve():
+            reserving.set()
+            release.wait(5)
+            return 1, 5
+
+        with mock.patch.object(allocator, 'reserve', reserve):
+            thread = threading.Thread(target=allocator.allocate)
+            thread.start()
+            reserving.wait(5)
+            self.assertTrue(allocator._lock.acquire(blocking=False))
+            allocator._lock.release()
+            release.set()
+            thread.join()
+        self.assertEqual(allocator.allocate(), 2)
+
+    def test_format_without_year_is_one_sequence(self):
+        with self.settings(CASEFOLDER_NUMBER_FORMAT='CF{seq:05d}'):
+            self.assertEqual(numbering.next_folder_number(), 'CF00001')
+        self.assertTrue(Counter.objects.filter(name='casefolder').exists())
+
+
+class CaseFolderNumberConcurrencyTests(TransactionTestCase):
+    def test_concurrent_allocators_never_repeat_a_number(self):
+        # Each allocator stands in for a process; its threads share its blocks
+        allocators = [numbering.HiLoAllocator('concurrency', block_size=10) for _ in range(4)]
+        numbers, errors = [], []
+        lock = threading.Lock()
+
+        def clerk(allocator):
+            try:
+                taken = [allocator.allocate() for _ in range(50)]
+                with lock:
+                    numbers.extend(taken)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=clerk, args=(allocators[n % 4],)) for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(numbers), 800)
+        self.assertEqual(len(set(numbers)), 800)
+        # 80 blocks: one counter update per ten numbers, not one per folder
+        self.assertEqual(Counter.objects.get(name='concurrency').value, 800)
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profiler.reset()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_folder(self.user)
+
+    def test_server_timing_reports_queries_and_phases(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/records/casefolders/')
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="%d queries"' % len(queries), timing)
+        for phase in ('view;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(phase, timing)
+
+    def test_stats_endpoint_reports_percentiles_per_url_name(self):
+        for _ in range(3):
+            self.client.get('/records/casefolders/')
+        staff = make_user('admin')
+        staff.is_staff = True
+        staff.save()
+        self.client.force_authenticate(staff)
+        routes = self.client.get('/records/profiling/').data['routes']
+        stats = routes['casefolder-list-create']
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['mean_queries'], 4)
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get('/records/profiling/').status_code, 403)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/records/casefolders/'))
+
+    def test_histogram_percentiles_are_within_a_bucket(self):
+        histogram = Histogram()
+        for value in range(1, 101):
+            histogram.add(float(value))
+        self.assertAlmostEqual(histogram.percentile(0.5), 50, delta=50 * 0.25)
+        self.assertAlmostEqual(histogram.percentile(0.99), 99, delta=99 * 0.25)
+        self.assertEqual(histogram.percentile(1.0), 100)
+
+
+class PatientDetailTests(TestCase):
+    def test_patient_is_addressed_by_uuid(self):
+        user = make_user()
+        patient = make_patient(user)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/records/patients/%s/' % patient.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['id'], str(patient.pk))
@@ -8,20 +8,43 @@ urlpatterns = [
     
     # Patients (HIM only)
     path('patients/', views.PatientListCreateView.as_view(), name='patient-list-create'),
-    path('patients/<int:pk>/', views.PatientDetailView.as_view(), name='patient-detail'),
+    path('patients/import/', views.PatientImportView.as_view(), name='patient-import'),
+    path('patients/<uuid:pk>/', views.PatientDetailView.as_view(), name='patient-detail'),
     
     # Case Folders (HIM only for creation, HIM/Doctor for viewing)
     path('casefolders/', views.CaseFolderListCreateView.as_view(), name='casefolder-list-create'),
     path('casefolders/<int:pk>/', views.CaseFolderDetailView.as_view(), name='casefolder-detail'),
+    path('casefolders/cache-stats/', views.CaseFolderCacheStatsView.as_view(), name='casefolder-cache-stats'),
+    path('casefolders/<int:pk>/timeline/', views.CaseFolderTimelineView.as_view(), name='casefolder-timeline'),
+    
+    # Full exports (HIM only)
+    path('export/<slug:resource>.<slug:fmt>', views.ExportView.as_view(), name='export'),
+    
+    # Per-patient bundle exports (HIM only)
+    path('bundles/', views.BundleExportJobListCreateView.as_view(), name='bundle-export-list-create'),
+    path('bundles/<int:pk>/', views.BundleExportJobDetailView.as_view(), name='bundle-export-detail'),
+    path('bundles/<int:pk>/resume/', views.BundleExportJobResumeView.as_view(), name='bundle-export-resume'),
     
     # Medical History (Doctors only)
     path('casefolders/<int:case_folder_id>/medical-history/', views.MedicalHistoryListCreateView.as_view(), name='medical-history-list-create'),
     
+    # Request profiling (staff only)
+    path('profiling/', views.ProfilingStatsView.as_view(), name='profiling-stats'),
+    
+    # Condition cohorts (HIM and Doctors)
+    path('cohorts/', views.CohortView.as_view(), name='cohort'),
+    
+    # Reports (HIM only)
+    path('reports/conditions/', views.ConditionReportView.as_view(), name='report-conditions'),
+    path('reports/admissions/', views.AdmissionReportView.as_view(), name='report-admissions'),
+    
     # Diagnoses (Doctors only)
     path('casefolders/<int:case_folder_id>/diagnoses/', views.DiagnosisAdmissionListCreateView.as_view(), name='diagnosis-list-create'),
     
     # Vital Signs (Nurses only)
     path('casefolders/<int:case_folder_id>/vitals/', views.VitalSignsListCreateView.as_view(), name='vitals-list-create'),
+    path('vitals/bulk/', views.VitalSignsBulkCreateView.as_view(), name='vitals-bulk-create'),
+    path('vitals/series/', views.VitalSignsSeriesView.as_view(), name='vitals-series'),
     
     # Patient Notes (Nurses and Doctors)
     path('casefolders/<int:case_folder_id>/notes/', views.PatientNoteListCreateView.as_view(), name='notes-list-create'),
@@ -1,15 +1,36 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
+from rest_framework.exceptions import NotFound
+from rest_framework.parsers import MultiPartParser
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from app.models import User, Patient, CaseFolder, MedicalHistory, DiagnosisAdmission, VitalSigns, PatientNote
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Min, Sum
+from django.db.models.functions import Trunc
+from app.models import (
+    User, Patient, CaseFolder, MedicalHistory, DiagnosisAdmission, VitalSigns, PatientNote,
+    ConditionAggregate, AdmissionAggregate, BundleExportJob,
+)
 from app.serializers import (
     RegisterSerializer, PatientSerializer, CaseFolderSerializer,
-    MedicalHistorySerializer, DiagnosisAdmissionSerializer, VitalSignsSerializer, PatientNoteSerializer
+    MedicalHistorySerializer, DiagnosisAdmissionSerializer, VitalSignsSerializer, PatientNoteSerializer,
+    VitalSignsBulkItemSerializer, VitalSignsSeriesQuerySerializer, CohortQuerySerializer,
+    ConditionReportQuerySerializer, AdmissionReportQuerySerializer, BundleExportJobSerializer, max_series_buckets,
 )
+from app import cache as document_cache
+from app import patient_import
+from app import export
+from app import bundles
+from app import numbering
+from app.profiling import profiler
 from app.permissions import IsHIMRole, IsNurseRole, IsDoctorRole, IsHIMOrDoctorRole, IsNurseOrDoctorRole, IsHIMNurseOrDoctorRole
+from app.pagination import KeysetPagination, TimelinePagination
+from app.prefetch import plan_queryset
+from app.fastpath import FastListMixin
 
 
 # @api_view(['POST'])
@@ -36,59 +57,286 @@ from app.permissions import IsHIMRole, IsNurseRole, IsDoctorRole, IsHIMOrDoctorR
 
 
 # Patient Views (HIM Only)
-class PatientListCreateView(generics.ListCreateAPIView):
+class PatientListCreateView(FastListMixin, generics.ListCreateAPIView):
     """List and create patients - HIM role only"""
     serializer_class = PatientSerializer
     permission_classes = [IsHIMRole]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        return Patient.objects.all()
+        return plan_queryset(Patient.objects.all(), self.get_serializer())
 
 class PatientDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, delete patient - HIM role only"""
     serializer_class = PatientSerializer
     permission_classes = [IsHIMRole]
-    queryset = Patient.objects.all()
+
+    def get_queryset(self):
+        return plan_queryset(Patient.objects.all(), self.get_serializer())
+
+class PatientImportView(generics.GenericAPIView):
+    """Register a whole intake of patients from an uploaded CSV or NDJSON file - HIM role only
+
+    The upload is streamed through `app.patient_import` in batches. The first
+    `max_reported_rejects` rejected rows are returned with their line numbers.
+    """
+    permission_classes = [IsHIMRole]
+    parser_classes = [MultiPartParser]
+    max_reported_rejects = 1000
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': 'Upload the patients as `file`.'}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or patient_import.detect_format(upload.name)
+        if fmt not in patient_import.FORMATS:
+            return Response({'detail': 'Expected a .csv or .ndjson file, or format=csv|ndjson.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        errors = []
+
+        def on_reject(line, row, row_errors):
+            if len(errors) < self.max_reported_rejects:
+                errors.append({'line': line, 'errors': row_errors})
+
+        upload.seek(0)
+        totals = patient_import.import_patients(
+            patient_import.iter_rows(upload.file, fmt), request.user,
+            batch_size=getattr(settings, 'PATIENT_IMPORT_BATCH_SIZE', 1000), on_reject=on_reject,
+        )
+        if not totals['rejected']:
+            response_status = status.HTTP_201_CREATED
+        elif totals['created']:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({
+            'rows': totals['rows'],
+            'created': totals['created'],
+            'rejected': totals['rejected'],
+            'errors': errors,
+        }, status=response_status)
 
 # Case Folder Views
-class CaseFolderListCreateView(generics.ListCreateAPIView):
+class CaseFolderListCreateView(FastListMixin, generics.ListCreateAPIView):
     """List and create case folders - HIM role only"""
     serializer_class = CaseFolderSerializer
     permission_classes = [IsHIMRole]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        return CaseFolder.objects.all()
+        return plan_queryset(CaseFolder.objects.all(), self.get_serializer())
+
+    def perform_create(self, serializer):
+        if 'folder_number' in serializer.validated_data:
+            serializer.save()
+        else:
+            serializer.save(folder_number=numbering.next_folder_number())
 
 class CaseFolderDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, update, delete case folder - HIM or assigned doctor only"""
     serializer_class = CaseFolderSerializer
     permission_classes = [IsHIMOrDoctorRole]
-    queryset = CaseFolder.objects.all()
+
+    def get_queryset(self):
+        return plan_queryset(CaseFolder.objects.all(), self.get_serializer())
+
+    def retrieve(self, request, *args, **kwargs):
+        key = document_cache.document_key(self.kwargs['pk'], request.query_params)
+        data = document_cache.get_document(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response = super().retrieve(request, *args, **kwargs)
+        document_cache.set_document(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+class CaseFolderCacheStatsView(generics.GenericAPIView):
+    """Hit/miss counters for cached case folder documents - staff only"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(document_cache.stats())
+
+class ProfilingStatsView(generics.GenericAPIView):
+    """Latency percentiles, DB time and query counts per URL name - staff only
+
+    Requires PROFILING_ENABLED; DELETE clears the histograms.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({'enabled': settings.PROFILING_ENABLED, 'routes': profiler.stats()})
+
+    def delete(self, request):
+        profiler.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class CaseFolderTimelineView(generics.GenericAPIView):
+    """Merged, newest-first feed of a folder's diagnoses, vitals and notes - HIM, Nurses and Doctors"""
+    permission_classes = [IsHIMNurseOrDoctorRole]
+    pagination_class = TimelinePagination
+
+    def get(self, request, pk):
+        folder = get_object_or_404(CaseFolder.objects.only('pk'), pk=pk)
+        return self.get_paginated_response(self.paginator.paginate_timeline(folder.pk, request))
+
+class ExportView(generics.GenericAPIView):
+    """Stream every patient or case folder as CSV or NDJSON - HIM role only
+
+    `/records/export/casefolders.ndjson` streams full folder documents,
+    children included; `?fields=` and `?expand=` trim case folders as they do
+    on the detail endpoint.
+    """
+    permission_classes = [IsHIMRole]
+    resources = {
+        'patients': (Patient, PatientSerializer),
+        'casefolders': (CaseFolder, CaseFolderSerializer),
+    }
+
+    def get(self, request, resource, fmt):
+        if resource not in self.resources or fmt not in export.FORMATS:
+            raise NotFound()
+        model, serializer_class = self.resources[resource]
+        serializer = serializer_class(context=self.get_serializer_context())
+        rows = export.stream(fmt, model.objects.all(), serializer,
+                             chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 500))
+        response = StreamingHttpResponse(rows, content_type=export.FORMATS[fmt])
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (resource, fmt)
+        return response
+
+class BundleExportJobListCreateView(FastListMixin, generics.ListCreateAPIView):
+    """List and start per-patient bundle exports - HIM role only
+
+    POST `{"patient_ids": [...]}` (or `{}` for every patient) creates a job
+    that the task runner picks up once the request commits; poll the job for
+    progress.
+    """
+    serializer_class = BundleExportJobSerializer
+    permission_classes = [IsHIMRole]
+
+    def get_queryset(self):
+        return plan_queryset(BundleExportJob.objects.all(), self.get_serializer())
+
+    def perform_create(self, serializer):
+        bundles.start_job(serializer.save(created_by=self.request.user))
+
+class BundleExportJobDetailView(generics.RetrieveAPIView):
+    """Progress of a bundle export - HIM role only"""
+    serializer_class = BundleExportJobSerializer
+    permission_classes = [IsHIMRole]
+    queryset = BundleExportJob.objects.all()
+
+class BundleExportJobResumeView(generics.GenericAPIView):
+    """Restart a failed or abandoned bundle export; bundles already written are skipped - HIM role only
+
+    A PENDING or RUNNING job counts as abandoned once it has made no progress
+    for BUNDLE_EXPORT_LEASE seconds.
+    """
+    serializer_class = BundleExportJobSerializer
+    permission_classes = [IsHIMRole]
+    queryset = BundleExportJob.objects.all()
+
+    def post(self, request, pk):
+        job = self.get_object()
+        if not bundles.resume_job(job):
+            return Response({'detail': 'Only failed or abandoned exports can be resumed.'},
+                            status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 # Medical History Views
-class MedicalHistoryListCreateView(generics.ListCreateAPIView):
+class MedicalHistoryListCreateView(FastListMixin, generics.ListCreateAPIView):
     """List and create medical history - Doctors only"""
     serializer_class = MedicalHistorySerializer
     permission_classes = [IsNurseOrDoctorRole]
     
     def get_queryset(self):
         case_folder_id = self.kwargs.get('case_folder_id')
-        return MedicalHistory.objects.filter(case_folder_id=case_folder_id)
+        return plan_queryset(MedicalHistory.objects.filter(case_folder_id=case_folder_id), self.get_serializer())
     
     def perform_create(self, serializer):
         case_folder_id = self.kwargs.get('case_folder_id')
         case_folder = get_object_or_404(CaseFolder, id=case_folder_id)
         serializer.save(case_folder=case_folder)
 
+class CohortView(generics.GenericAPIView):
+    """Count case folders by medical history conditions - HIM and Doctors
+
+    `?include=diabetes,kidney_disease&exclude=hypertension` is answered with two
+    bitwise predicates on the packed `conditions` column instead of one
+    predicate per boolean column.
+    """
+    permission_classes = [IsHIMOrDoctorRole]
+
+    def get(self, request):
+        query = CohortQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        queryset = MedicalHistory.objects.all()
+        include = MedicalHistory.condition_mask(params['include'])
+        exclude = MedicalHistory.condition_mask(params['exclude'])
+        if include:
+            queryset = queryset.annotate(included=F('conditions').bitand(include)).filter(included=include)
+        if exclude:
+            queryset = queryset.annotate(excluded=F('conditions').bitand(exclude)).filter(excluded=0)
+
+        case_folders = []
+        if params['limit']:
+            case_folders = list(queryset.order_by('case_folder_id').values_list('case_folder_id', flat=True)[:params['limit']])
+        return Response({
+            'include': params['include'],
+            'exclude': params['exclude'],
+            'count': queryset.count(),
+            'case_folders': case_folders,
+        })
+
+# Reporting Views (HIM only), read from the aggregates maintained by app/aggregates.py
+class ConditionReportView(generics.GenericAPIView):
+    """Condition counts, optionally grouped by gender, state_of_origin, religion and age_band - HIM role only"""
+    permission_classes = [IsHIMRole]
+
+    def get(self, request):
+        query = ConditionReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        queryset = ConditionAggregate.objects.all()
+        if params['condition']:
+            queryset = queryset.filter(condition__in=params['condition'])
+        dimensions = ['condition'] + [name for name in query.DIMENSIONS if name in params['group_by']]
+        rows = queryset.values(*dimensions).annotate(count=Sum('count')).filter(count__gt=0).order_by(*dimensions)
+        return Response({'group_by': dimensions, 'results': list(rows)})
+
+class AdmissionReportView(generics.GenericAPIView):
+    """Admissions per month - HIM role only"""
+    permission_classes = [IsHIMRole]
+
+    def get(self, request):
+        query = AdmissionReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        queryset = AdmissionAggregate.objects.filter(count__gt=0)
+        if 'start' in params:
+            queryset = queryset.filter(month__gte=params['start'].replace(day=1))
+        if 'end' in params:
+            queryset = queryset.filter(month__lte=params['end'])
+        results = [{'month': month.strftime('%Y-%m'), 'count': count} for month, count in queryset.values_list('month', 'count')]
+        return Response({'results': results})
+
 # Diagnosis Views
-class DiagnosisAdmissionListCreateView(generics.ListCreateAPIView):
+class DiagnosisAdmissionListCreateView(FastListMixin, generics.ListCreateAPIView):
     """List and create diagnoses - Doctors only"""
     serializer_class = DiagnosisAdmissionSerializer
     permission_classes = [IsNurseOrDoctorRole]
     
     def get_queryset(self):
         case_folder_id = self.kwargs.get('case_folder_id')
-        return DiagnosisAdmission.objects.filter(case_folder_id=case_folder_id)
+        return plan_queryset(DiagnosisAdmission.objects.filter(case_folder_id=case_folder_id), self.get_serializer())
     
     def perform_create(self, serializer):
         case_folder_id = self.kwargs.get('case_folder_id')
@@ -96,32 +344,139 @@ class DiagnosisAdmissionListCreateView(generics.ListCreateAPIView):
         serializer.save(case_folder=case_folder, created_by=self.request.user)
 
 # Vital Signs Views
-class VitalSignsListCreateView(generics.ListCreateAPIView):
+class VitalSignsListCreateView(FastListMixin, generics.ListCreateAPIView):
     """List and create vital signs - Nurses only"""
     serializer_class = VitalSignsSerializer
     permission_classes = [IsNurseOrDoctorRole]
     
     def get_queryset(self):
         case_folder_id = self.kwargs.get('case_folder_id')
-        return VitalSigns.objects.filter(case_folder_id=case_folder_id)
+        return plan_queryset(VitalSigns.objects.filter(case_folder_id=case_folder_id), self.get_serializer())
     
     def perform_create(self, serializer):
         case_folder_id = self.kwargs.get('case_folder_id')
         case_folder = get_object_or_404(CaseFolder, id=case_folder_id)
         serializer.save(case_folder=case_folder, recorded_by=self.request.user)
 
+class VitalSignsBulkCreateView(generics.GenericAPIView):
+    """Record a ward round of vital signs across many case folders in one request - Nurses and Doctors
+
+    Valid readings are written with one folder lookup and one bulk insert;
+    invalid ones are reported by their index in the payload.
+    """
+    serializer_class = VitalSignsBulkItemSerializer
+    permission_classes = [IsNurseOrDoctorRole]
+    max_items = 1000
+    batch_size = 500
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'detail': 'Expected a non-empty list of readings.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_items:
+            return Response({'detail': 'At most %d readings per request.' % self.max_items},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        errors, valid = [], []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+
+        folder_ids = set(CaseFolder.objects.filter(
+            pk__in={data['case_folder'] for _, data in valid}
+        ).values_list('pk', flat=True))
+
+        readings = []
+        for index, data in valid:
+            data = dict(data)
+            folder_id = data.pop('case_folder')
+            if folder_id not in folder_ids:
+                errors.append({'index': index, 'errors': {'case_folder': ['Case folder not found.']}})
+                continue
+            vitals = VitalSigns(case_folder_id=folder_id, recorded_by=request.user, **data)
+            vitals.parse_readings()
+            readings.append(vitals)
+
+        if readings:
+            with transaction.atomic():
+                VitalSigns.objects.bulk_create(readings, batch_size=self.batch_size)
+            # bulk_create sends no post_save, so drop the cached documents here
+            document_cache.invalidate_casefolder(*{vitals.case_folder_id for vitals in readings})
+
+        errors.sort(key=lambda error: error['index'])
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif readings:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'created': len(readings), 'errors': errors}, status=response_status)
+
+class VitalSignsSeriesView(generics.GenericAPIView):
+    """Min/max/avg vital sign buckets for a case folder, aggregated in SQL - Nurses and Doctors
+
+    A series is limited to VITALS_SERIES_MAX_BUCKETS buckets.
+    """
+    permission_classes = [IsNurseOrDoctorRole]
+    measures = ('systolic', 'diastolic', 'pulse_rate', 'weight_kg', 'height_cm')
+
+    def get(self, request):
+        query = VitalSignsSeriesQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        queryset = VitalSigns.objects.filter(case_folder_id=params['case_folder'])
+        if 'start' in params:
+            queryset = queryset.filter(recorded_at__gte=params['start'])
+        if 'end' in params:
+            queryset = queryset.filter(recorded_at__lt=params['end'])
+
+        aggregates = {}
+        for measure in self.measures:
+            aggregates[measure + '__min'] = Min(measure)
+            aggregates[measure + '__max'] = Max(measure)
+            aggregates[measure + '__avg'] = Avg(measure)
+        rows = (
+            queryset.annotate(bucket=Trunc('recorded_at', params['interval']))
+            .values('bucket')
+            .annotate(count=Count('pk'), **aggregates)
+            .order_by('bucket')
+        )
+        # an open-ended span is checked against the limit on the buckets it has
+        limit = max_series_buckets()
+        rows = list(rows[:limit + 1])
+        if len(rows) > limit:
+            return Response({'detail': 'The series has more than %d %s buckets; give start and end.' % (
+                limit, params['interval'])}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        for row in rows:
+            point = {'bucket': row['bucket'], 'count': row['count']}
+            for measure in self.measures:
+                average = row[measure + '__avg']
+                point[measure] = {
+                    'min': row[measure + '__min'],
+                    'max': row[measure + '__max'],
+                    'avg': round(average, 2) if average is not None else None,
+                }
+            results.append(point)
+        return Response({'case_folder': params['case_folder'], 'interval': params['interval'], 'results': results})
+
 # Patient Notes Views
-class PatientNoteListCreateView(generics.ListCreateAPIView):
+class PatientNoteListCreateView(FastListMixin, generics.ListCreateAPIView):
     """List and create patient notes - Nurses and Doctors"""
     serializer_class = PatientNoteSerializer
     permission_classes = [IsNurseOrDoctorRole]
     
     def get_queryset(self):
         case_folder_id = self.kwargs.get('case_folder_id')
-        return PatientNote.objects.filter(case_folder_id=case_folder_id)
+        return plan_queryset(PatientNote.objects.filter(case_folder_id=case_folder_id), self.get_serializer())
     
     def perform_create(self, serializer):
         case_folder_id = self.kwargs.get('case_folder_id')
         case_folder = get_object_or_404(CaseFolder, id=case_folder_id)
         user_type = 'DOCTOR' if self.request.user.role == 'DOCTOR' else 'NURSE'
-        serializer.save(case_folder=case_folder, profile=self.request.user, user_type=user_type)
+        serializer.save(case_folder=case_folder, recorded_by=self.request.user, user_type=user_type)